@@ -35,42 +35,22 @@ def main(write_output=True):
     eoc_rec = EOCRecorder()
 
 
-    if rcon.is_head_rank:
-        from hedge.mesh.generator import \
-                make_rect_mesh, \
-                make_centered_regular_rect_mesh
+    # adaptivity is not supported on distributed meshes
+    assert len(rcon.ranks) == 1
 
-        refine = 4
-        mesh = make_centered_regular_rect_mesh((0,-5), (10,5), n=(9,9),
-                post_refine_factor=refine)
-        mesh_data = rcon.distribute_mesh(mesh)
-    else:
-        mesh_data = rcon.receive_mesh()
+    from hedge.mesh.generator import make_centered_regular_rect_mesh
 
-    # a second mesh to regrid to
-    if rcon.is_head_rank:
-        from hedge.mesh.generator import \
-                make_rect_mesh, \
-                make_centered_regular_rect_mesh
-
-        refine = 4
-        mesh2 = make_centered_regular_rect_mesh((0,-5), (10,5), n=(8,8),
-                post_refine_factor=refine)
-        mesh_data2 = rcon.distribute_mesh(mesh2)
-    else:
-        mesh_data2 = rcon.receive_mesh()
+    refine = 4
+    mesh = make_centered_regular_rect_mesh((0,-5), (10,5), n=(8,8),
+            post_refine_factor=refine)
 
 
 
     for order in [3,4]:
-        discr = rcon.make_discretization(mesh_data, order=order,
-                        default_scalar_type=numpy.float64,
-                        quad_min_degrees={
-                            "gasdyn_vol": 3*order,
-                            "gasdyn_face": 3*order,
-                            })
+        from hedge.adaptivity import AdaptiveTriangleMesh
+        amesh = AdaptiveTriangleMesh(mesh)
 
-        discr2 = rcon.make_discretization(mesh_data2, order=order,
+        discr = rcon.make_discretization(amesh.mesh, order=order,
                         default_scalar_type=numpy.float64,
                         quad_min_degrees={
                             "gasdyn_vol": 3*order,
@@ -108,8 +88,7 @@ def main(write_output=True):
             print "---------------------------------------------"
             print "order %d" % order
             print "---------------------------------------------"
-            print "#elements for mesh 1 =", len(mesh.elements)
-            print "#elements for mesh 2 =", len(mesh2.elements)
+            print "#elements =", len(mesh.elements)
 
 
         # limiter ------------------------------------------------------------
@@ -188,15 +167,29 @@ def main(write_output=True):
                 fields = stepper(fields, t, dt, rhs)
                 #fields = limiter(fields)
 
-                #regrid to discr2 at some arbitrary time
+                #refine around the vortex core at some arbitrary time
                 if step == 21:
+                    rho = op.rho(fields)
+                    marked = [el.id for el in discr.mesh.elements
+                            if rho[discr.find_el_range(el.id)].min() < 0.95]
+
+                    #transfer fields by reference interpolation,
+                    #reuse the compiled operator
+                    from hedge.adaptivity import adapt_discretization
+                    old_discr = discr
+                    discr, transfer = adapt_discretization(
+                            discr, amesh.refine(marked))
+                    old_discr.close()
+                    fields = transfer(fields)
+
+                    if rcon.is_head_rank:
+                        print "#elements after refinement =", \
+                                len(discr.mesh.elements)
 
-                    #get interpolated fields
-                    fields = discr.get_regrid_values(fields, discr2, dtype=None, use_btree=True, thresh=1e-8)
                     #get new stepper (old one has reference to discr
                     stepper = SSPRK3TimeStepper()
                     #new bind
-                    euler_ex = op.bind(discr2)
+                    euler_ex = op.bind(discr)
                     #new rhs
                     max_eigval = [0]
                     def rhs(t, q):
@@ -205,17 +198,16 @@ def main(write_output=True):
                         return ode_rhs
                     rhs(t+dt, fields)
                     #add logmanager
-                    #discr2.add_instrumentation(logmgr)
+                    #discr.add_instrumentation(logmgr)
                     #new step_it
                     step_it = times_and_steps(
                         final_time=final_time, logmgr=logmgr,
-                        max_dt_getter=lambda t: op.estimate_timestep(discr2,
+                        max_dt_getter=lambda t: op.estimate_timestep(discr,
                             stepper=stepper, t=t, max_eigenvalue=max_eigval[0]))
 
                     #new visualization
                     vis.close()
-                    vis = VtkVisualizer(discr2, rcon, "vortexNewGrid-%d" % order)
-                    discr=discr2
+                    vis = VtkVisualizer(discr, rcon, "vortexNewGrid-%d" % order)
 
 
 
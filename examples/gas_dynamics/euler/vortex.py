@@ -75,14 +75,7 @@ def main(write_output=True):
 
         fields = flow.volume_interpolant(0, discr)
 
-        euler_ex = op.bind(discr)
-
-        max_eigval = [0]
-        def rhs(t, q):
-            ode_rhs, speed = euler_ex(t, q)
-            max_eigval[0] = speed
-            return ode_rhs
-        rhs(0, fields)
+        euler_ex = op.bind(discr, reduce_max_speed=False)
 
         if rcon.is_head_rank:
             print "---------------------------------------------"
@@ -122,13 +115,17 @@ def main(write_output=True):
         logmgr.add_watches(["step.max", "t_sim.max", "t_step.max"])
 
         # timestep loop -------------------------------------------------------
+        from hedge.timestep import TimestepController
+        dt_controller = TimestepController(op, discr, stepper=stepper)
+        rhs = dt_controller.wrap_rhs(euler_ex)
+        rhs(0, fields)
+
         try:
             final_time = flow.final_time
             from hedge.timestep import times_and_steps
             step_it = times_and_steps(
                     final_time=final_time, logmgr=logmgr,
-                    max_dt_getter=lambda t: op.estimate_timestep(discr,
-                        stepper=stepper, t=t, max_eigenvalue=max_eigval[0]))
+                    max_dt_getter=dt_controller)
 
             print "run until t=%g" % final_time
             for step, t, dt in step_it:
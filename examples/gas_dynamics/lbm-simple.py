@@ -36,7 +36,7 @@ def main(write_output=True, dtype=np.float32):
                 subdivisions=(int(70/h_fac), int(70/h_fac)))
 
     from hedge.models.gas_dynamics.lbm import \
-            D2Q9LBMMethod, LatticeBoltzmannOperator
+            D2Q9LBMMethod, LatticeBoltzmannOperator, unpack_distributions
 
     op = LatticeBoltzmannOperator(
             D2Q9LBMMethod(), lbm_delta_t=0.001, nu=1e-4)
@@ -89,7 +89,7 @@ def main(write_output=True, dtype=np.float32):
 
     # timestep loop -----------------------------------------------------------
     stream_rhs = op.bind_rhs(discr)
-    collision_update = op.bind(discr, op.collision_update)
+    collision_update = op.bind_collision(discr)
     get_rho = op.bind(discr, op.rho)
     get_rho_u = op.bind(discr, op.rho_u)
 
@@ -133,7 +133,9 @@ def main(write_output=True, dtype=np.float32):
 
             print "step=%d, t=%f" % (step, t)
 
-            f_bar = collision_update(f_bar)
+            # stream on views of the contiguous storage used by the
+            # collision, which avoids repacking after every stage
+            f_bar = unpack_distributions(collision_update(f_bar))
 
             for substep in range(dg_steps_per_lbm_step):
                 f_bar = stepper(f_bar, t + substep*dg_dt, dg_dt, stream_rhs)
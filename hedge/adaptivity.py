@@ -0,0 +1,600 @@
+# -*- coding: utf-8 -*-
+"""h-adaptivity for triangular meshes by newest-vertex bisection.
+
+Only the refinement bookkeeping is updated incrementally, i.e. the
+refinement forest, adjacency, tags and the element objects of untouched
+triangles. Each adaptation then builds a new
+:class:`hedge.mesh.ConformalMesh`, including its connectivity, and a new
+discretization, including its nodes and face groups, from scratch. What
+carries over to the new discretization are the reference matrices of the
+local discretization and, optionally, compiled code (see
+:func:`adapt_discretization`). The cost of an adaptation is therefore
+proportional to the size of the whole mesh, not to the number of elements
+that changed.
+"""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2009 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+import numpy
+import numpy.linalg as la
+from pytools import Record, memoize
+
+
+
+
+# {{{ reference transfer matrices ---------------------------------------------
+def bisection_child_unit_vertices(ref_vertex):
+    """Return the unit-coordinate vertices of the two children created by
+    bisecting the unit triangle across the edge opposite its vertex number
+    *ref_vertex*, in the vertex order used by :class:`AdaptiveTriangleMesh`.
+    """
+    unit_vertices = numpy.array([[-1, -1], [1, -1], [-1, 1]], dtype=numpy.float64)
+
+    a = unit_vertices[ref_vertex]
+    b = unit_vertices[(ref_vertex+1) % 3]
+    c = unit_vertices[(ref_vertex+2) % 3]
+    m = (b+c)/2
+
+    return [numpy.array([m, a, b]), numpy.array([m, c, a])]
+
+
+
+
+@memoize
+def get_bisection_transfer_matrices(ldis, ref_vertex):
+    """Return a tuple *(prolongations, restrictions)* of lists with one
+    matrix per child of the bisection of the element across the edge
+    opposite its vertex number *ref_vertex*.
+
+    The prolongation of a child interpolates parent nodal values onto the
+    child's nodes. The restrictions sum to the :math:`L^2` projection of
+    the children's nodal values onto the parent.
+    """
+    unit_nodes = numpy.array(ldis.unit_nodes())
+    inv_vdm = la.inv(ldis.vandermonde())
+    mass_mat = ldis.mass_matrix()
+    inv_mass_mat = ldis.inverse_mass_matrix()
+
+    prolongations = []
+    restrictions = []
+    for child_vertices in bisection_child_unit_vertices(ref_vertex):
+        child_nodes = child_vertices[0] + numpy.dot(
+                (unit_nodes+1)/2, child_vertices[1:]-child_vertices[0])
+
+        prolongation = numpy.dot(ldis.basis_vandermonde(child_nodes), inv_vdm)
+
+        prolongations.append(prolongation)
+
+        # each child covers half of its parent
+        restrictions.append(0.5*numpy.dot(
+            numpy.dot(inv_mass_mat, prolongation.T), mass_mat))
+
+    return prolongations, restrictions
+
+# }}}
+
+# {{{ refinement forest -------------------------------------------------------
+class MeshAdaptation(Record):
+    """The result of one adaptation step of an
+    :class:`AdaptiveTriangleMesh`.
+
+    :ivar mesh: the adapted :class:`hedge.mesh.ConformalMesh`.
+    :ivar origins: a mapping from a key describing how new elements arose
+      from old ones to a tuple *(new_el_ids, old_el_id_lists)*, where
+      *old_el_id_lists* contains one array of old element numbers per
+      old element contributing to each new one. Keys are one of
+
+      * *("keep",)*,
+      * *("refine", chain)*, where *chain* is a tuple of
+        *(ref_vertex, child_nr)* bisection steps leading from the old
+        to the new element,
+      * *("coarsen", ref_vertex)*, with one old element per child.
+    """
+
+
+
+
+def _renumbered_element(el, id):
+    """Return *el* if it has number *id*, otherwise a copy of it with that
+    number. The copy shares the (immutable) geometric data of *el*, so that
+    unchanged elements need not be recomputed after an adaptation.
+    """
+    if el.id == id:
+        return el
+
+    result = el.__class__.__new__(el.__class__)
+    for cls in type(el).__mro__:
+        for slot in cls.__dict__.get("__slots__", ()):
+            setattr(result, slot, getattr(el, slot))
+    result.id = id
+    return result
+
+
+
+
+class AdaptiveTriangleMesh(object):
+    """A triangular mesh that can be refined and coarsened locally by
+    newest-vertex bisection while remaining conforming.
+
+    Every triangle stores its vertices in the order of its
+    :class:`hedge.mesh.element.Triangle` and the number of its *refinement
+    vertex*, the one opposite the edge it is bisected across. Initially,
+    that edge is the longest one. Bisecting creates a new vertex at its
+    midpoint, which becomes the refinement vertex (number 0) of both
+    children. Since there are only three bisection patterns per triangle,
+    fields are transferred by precomputed reference matrices, see
+    :func:`get_bisection_transfer_matrices` and :class:`FieldTransfer`.
+
+    Initially, :attr:`mesh` consists of the same elements as the input
+    mesh, so that discretizations built on either may be adapted.
+
+    :ivar mesh: the current :class:`hedge.mesh.ConformalMesh`.
+    """
+
+    def __init__(self, mesh):
+        from hedge.mesh.element import Triangle
+        for el in mesh.elements:
+            if not isinstance(el, Triangle):
+                raise NotImplementedError(
+                        "adaptivity is only supported on triangle meshes")
+
+        if [axis for axis in getattr(mesh, "periodicity", None) or []
+                if axis is not None]:
+            raise NotImplementedError(
+                    "adaptivity is not supported on periodic meshes")
+        if getattr(mesh, "has_internal_boundaries", False):
+            raise NotImplementedError(
+                    "adaptivity is not supported on meshes with internal "
+                    "boundaries")
+
+        self.points = list(mesh.points)
+
+        # per-triangle data, indexed by triangle number
+        self.vertices = []
+        self.ref_vertex = []
+        self.parent = []
+        self.children = []
+        self.volume_tags = []
+        self.elements = []
+
+        self.edge_midpoint = {}
+        self.edge_to_leaves = {}
+
+        from hedge.mesh import TAG_ALL, TAG_REALLY_ALL, TAG_NONE
+        self.edge_tags = {}
+        for tag, el_faces in mesh.tag_to_boundary.iteritems():
+            if tag in [TAG_ALL, TAG_REALLY_ALL, TAG_NONE]:
+                continue
+            for el, face_nr in el_faces:
+                self.edge_tags.setdefault(
+                        frozenset(el.faces[face_nr]), []).append(tag)
+
+        el_to_tags = {}
+        for tag, els in mesh.tag_to_elements.iteritems():
+            if tag in [TAG_ALL, TAG_NONE]:
+                continue
+            for el in els:
+                el_to_tags.setdefault(el.id, []).append(tag)
+
+        points = mesh.points
+
+        def edge_key(i, j):
+            d = points[i] - points[j]
+            return numpy.dot(d, d), tuple(sorted((i, j)))
+
+        for el in mesh.elements:
+            vi = tuple(el.vertex_indices)
+            ref_vertex = max(range(3), key=lambda k:
+                    edge_key(vi[(k+1) % 3], vi[(k+2) % 3]))
+            self._add_triangle(vi, ref_vertex, None,
+                    el_to_tags.get(el.id, []), el)
+
+        self.leaves = range(len(mesh.elements))
+        self.mesh = self._make_mesh()
+
+    # {{{ triangle bookkeeping
+    def _add_triangle(self, vertices, ref_vertex, parent, volume_tags,
+            element=None):
+        tri = len(self.vertices)
+        self.vertices.append(vertices)
+        self.ref_vertex.append(ref_vertex)
+        self.parent.append(parent)
+        self.children.append(None)
+        self.volume_tags.append(volume_tags)
+        self.elements.append(element)
+        self._attach_leaf(tri)
+        return tri
+
+    def _edges(self, tri):
+        a, b, c = self.vertices[tri]
+        return [frozenset((a, b)), frozenset((b, c)), frozenset((c, a))]
+
+    def _attach_leaf(self, tri):
+        for edge in self._edges(tri):
+            self.edge_to_leaves.setdefault(edge, set()).add(tri)
+
+    def _detach_leaf(self, tri):
+        for edge in self._edges(tri):
+            self.edge_to_leaves[edge].remove(tri)
+
+    def refinement_edge(self, tri):
+        k = self.ref_vertex[tri]
+        verts = self.vertices[tri]
+        return verts[(k+1) % 3], verts[(k+2) % 3]
+
+    def _get_midpoint(self, b, c):
+        edge = frozenset((b, c))
+        try:
+            return self.edge_midpoint[edge]
+        except KeyError:
+            m = self.edge_midpoint[edge] = len(self.points)
+            self.points.append((self.points[b]+self.points[c])/2)
+
+            tags = self.edge_tags.get(edge)
+            if tags is not None:
+                self.edge_tags[frozenset((b, m))] = tags
+                self.edge_tags[frozenset((m, c))] = tags
+
+            return m
+
+    # }}}
+
+    # {{{ bisection
+    def _bisect(self, tri):
+        k = self.ref_vertex[tri]
+        verts = self.vertices[tri]
+        a = verts[k]
+        b = verts[(k+1) % 3]
+        c = verts[(k+2) % 3]
+        m = self._get_midpoint(b, c)
+
+        self._detach_leaf(tri)
+        tags = self.volume_tags[tri]
+        self.children[tri] = (
+                self._add_triangle((m, a, b), 0, tri, tags),
+                self._add_triangle((m, c, a), 0, tri, tags))
+
+    def _refine_leaf(self, tri):
+        """Bisect *tri* and, to keep the mesh conforming, its neighbor
+        across the refinement edge, refining that neighbor first if its
+        own refinement edge is a different one.
+        """
+        edge = frozenset(self.refinement_edge(tri))
+
+        neighbors = self.edge_to_leaves[edge] - set([tri])
+        if neighbors:
+            nb, = neighbors
+            if frozenset(self.refinement_edge(nb)) != edge:
+                self._refine_leaf(nb)
+                assert self.children[tri] is None
+                nb, = self.edge_to_leaves[edge] - set([tri])
+
+            self._bisect(tri)
+            self._bisect(nb)
+        else:
+            self._bisect(tri)
+
+    def _leaf_descendants(self, tri, chain=()):
+        children = self.children[tri]
+        if children is None:
+            yield tri, chain
+        else:
+            k = self.ref_vertex[tri]
+            for child_nr, child in enumerate(children):
+                for result in self._leaf_descendants(
+                        child, chain + ((k, child_nr),)):
+                    yield result
+
+    def refine(self, element_ids):
+        """Bisect the elements numbered *element_ids* in :attr:`mesh`,
+        along with as many neighbors as needed to keep the mesh conforming.
+
+        :returns: a :class:`MeshAdaptation`.
+        """
+        old_leaves = self.leaves
+
+        for el_id in element_ids:
+            tri = old_leaves[el_id]
+            if self.children[tri] is None:
+                self._refine_leaf(tri)
+
+        new_leaves = []
+        origins = {}
+        for old_el_id, old_tri in enumerate(old_leaves):
+            for tri, chain in self._leaf_descendants(old_tri):
+                if chain:
+                    key = ("refine", chain)
+                else:
+                    key = ("keep",)
+
+                new_el_ids, (old_el_ids,) = origins.setdefault(key, ([], ([],)))
+                new_el_ids.append(len(new_leaves))
+                old_el_ids.append(old_el_id)
+                new_leaves.append(tri)
+
+        return self._finish_adaptation(new_leaves, origins)
+
+    # }}}
+
+    # {{{ coarsening
+    def _coarsening_patch(self, parent):
+        """Return the list of parents whose children need to be merged
+        along with those of *parent* to remove the vertex created by
+        bisecting *parent*, or *None* if that vertex cannot be removed.
+        """
+        children = self.children[parent]
+        for child in children:
+            if self.children[child] is not None:
+                return None
+
+        b, c = self.refinement_edge(parent)
+        m = self.vertices[children[0]][0]
+
+        result = [parent]
+        nb_leaves = self.edge_to_leaves[frozenset((b, m))] - set(children)
+        if nb_leaves:
+            nb, = nb_leaves
+            nb_parent = self.parent[nb]
+            if (nb_parent is None
+                    or self.vertices[nb][0] != m
+                    or frozenset(self.refinement_edge(nb_parent))
+                    != frozenset((b, c))):
+                return None
+
+            for nb_child in self.children[nb_parent]:
+                if self.children[nb_child] is not None:
+                    return None
+
+            result.append(nb_parent)
+
+        return result
+
+    def _unbisect(self, tri):
+        for child in self.children[tri]:
+            self._detach_leaf(child)
+        self.children[tri] = None
+        self._attach_leaf(tri)
+
+    def coarsen(self, element_ids):
+        """Undo bisections whose children are all among the elements
+        numbered *element_ids* in :attr:`mesh`. A bisection is only
+        undone if its new vertex can be removed from the mesh, i.e.
+        together with the one on the other side of the bisected edge.
+
+        :returns: a :class:`MeshAdaptation`.
+        """
+        old_leaves = self.leaves
+        marked = set(old_leaves[el_id] for el_id in element_ids)
+
+        merged = set()
+        for tri in marked:
+            parent = self.parent[tri]
+            if parent is None or parent in merged:
+                continue
+
+            patch = self._coarsening_patch(parent)
+            if patch is not None and all(
+                    child in marked
+                    for patch_parent in patch
+                    for child in self.children[patch_parent]):
+                merged.update(patch)
+
+        merged_children = dict(
+                (parent, self.children[parent]) for parent in merged)
+        for parent in merged:
+            self._unbisect(parent)
+
+        new_leaves = []
+        origins = {}
+        old_el_number = dict((tri, i) for i, tri in enumerate(old_leaves))
+        for old_el_id, old_tri in enumerate(old_leaves):
+            parent = self.parent[old_tri]
+            if parent in merged_children:
+                children = merged_children[parent]
+                if old_tri != children[0]:
+                    continue
+
+                new_el_ids, old_el_id_lists = origins.setdefault(
+                        ("coarsen", self.ref_vertex[parent]),
+                        ([], ([], [])))
+                for child, old_el_ids in zip(children, old_el_id_lists):
+                    old_el_ids.append(old_el_number[child])
+                tri = parent
+            else:
+                new_el_ids, (old_el_ids,) = origins.setdefault(
+                        ("keep",), ([], ([],)))
+                old_el_ids.append(old_el_id)
+                tri = old_tri
+
+            new_el_ids.append(len(new_leaves))
+            new_leaves.append(tri)
+
+        return self._finish_adaptation(new_leaves, origins)
+
+    # }}}
+
+    # {{{ mesh generation
+    def _finish_adaptation(self, new_leaves, origins):
+        self.leaves = new_leaves
+        self.mesh = self._make_mesh()
+
+        return MeshAdaptation(
+                mesh=self.mesh,
+                origins=dict(
+                    (key, (numpy.array(new_el_ids, dtype=numpy.intp),
+                        [numpy.array(old_el_ids, dtype=numpy.intp)
+                            for old_el_ids in old_el_id_lists]))
+                    for key, (new_el_ids, old_el_id_lists)
+                    in origins.iteritems()))
+
+    def _make_mesh(self):
+        # a full rebuild of the connectivity, see the module docstring
+        from hedge.mesh.element import Triangle
+
+        points = numpy.array(self.points, dtype=numpy.float64)
+
+        elements = []
+        for el_id, tri in enumerate(self.leaves):
+            el = self.elements[tri]
+            if el is None:
+                el = self.elements[tri] = Triangle(
+                        el_id, self.vertices[tri], points)
+            else:
+                el = _renumbered_element(el, el_id)
+            elements.append(el)
+
+        leaves = self.leaves
+        edge_tags = self.edge_tags
+        volume_tags = self.volume_tags
+
+        def boundary_tagger(fvi, el, fn, all_v):
+            return edge_tags.get(frozenset(fvi), [])
+
+        def volume_tagger(el, all_v):
+            return volume_tags[leaves[el.id]]
+
+        from hedge.mesh import make_conformal_mesh_ext
+        return make_conformal_mesh_ext(points, elements,
+                boundary_tagger=boundary_tagger,
+                volume_tagger=volume_tagger)
+
+    # }}}
+
+# }}}
+
+# {{{ field transfer ----------------------------------------------------------
+class FieldTransfer(object):
+    """Carries volume vectors from a discretization of an
+    :class:`AdaptiveTriangleMesh` before one adaptation step to a
+    discretization of the same order after it.
+
+    New elements receive the values of the old elements they coincide with,
+    the reference interpolation of their ancestor's values if they arose
+    by bisection, or the :math:`L^2` projection of their former children's
+    values if they arose by coarsening. No point location takes place, and
+    elements sharing a bisection pattern are transferred in one matrix
+    product.
+    """
+
+    def __init__(self, old_discr, new_discr, adaptation):
+        ldis = self._get_local_discretization(old_discr)
+        if (ldis.order !=
+                self._get_local_discretization(new_discr).order):
+            raise ValueError("field transfer requires discretizations "
+                    "of equal order")
+
+        self.new_discr = new_discr
+
+        node_numbers = numpy.arange(ldis.node_count(), dtype=numpy.intp)
+
+        def node_indices(discr, el_ids):
+            starts = numpy.array(
+                    [discr.find_el_range(el_id).start for el_id in el_ids],
+                    dtype=numpy.intp)
+            return starts[:, numpy.newaxis] + node_numbers
+
+        prolongation_cache = {}
+
+        def get_prolongation(chain):
+            try:
+                return prolongation_cache[chain]
+            except KeyError:
+                pass
+
+            (ref_vertex, child_nr), rest = chain[-1], chain[:-1]
+            result = get_bisection_transfer_matrices(
+                    ldis, ref_vertex)[0][child_nr]
+            if rest:
+                result = numpy.dot(result, get_prolongation(rest))
+
+            prolongation_cache[chain] = result
+            return result
+
+        self.steps = []
+        for key, (new_el_ids, old_el_id_lists) in \
+                adaptation.origins.iteritems():
+            if key[0] == "keep":
+                matrices = [None]
+            elif key[0] == "refine":
+                matrices = [get_prolongation(key[1])]
+            elif key[0] == "coarsen":
+                matrices = get_bisection_transfer_matrices(ldis, key[1])[1]
+            else:
+                raise ValueError("invalid element origin: %s" % key[0])
+
+            self.steps.append((
+                node_indices(new_discr, new_el_ids),
+                [(node_indices(old_discr, old_el_ids), mat)
+                    for old_el_ids, mat in zip(old_el_id_lists, matrices)]))
+
+    @staticmethod
+    def _get_local_discretization(discr):
+        if len(discr.element_groups) != 1:
+            raise NotImplementedError("field transfer between "
+                    "discretizations with multiple element groups")
+        return discr.element_groups[0].local_discretization
+
+    def transfer_scalar(self, field):
+        result = self.new_discr.volume_empty(dtype=field.dtype, kind="numpy")
+
+        for new_indices, sources in self.steps:
+            values = 0
+            for old_indices, mat in sources:
+                if mat is None:
+                    values = values + field[old_indices]
+                else:
+                    values = values + numpy.dot(field[old_indices], mat.T)
+
+            result[new_indices] = values
+
+        return result
+
+    def __call__(self, field):
+        from pytools.obj_array import with_object_array_or_scalar
+        return with_object_array_or_scalar(self.transfer_scalar, field)
+
+
+
+
+def adapt_discretization(discr, adaptation, reuse_code=True):
+    """Return a tuple *(new_discr, transfer)* of a discretization of
+    *adaptation.mesh* like *discr* and a :class:`FieldTransfer` from *discr*
+    to it.
+
+    :param adaptation: a :class:`MeshAdaptation` of the mesh of *discr*.
+    :param reuse_code: passed on to
+      :meth:`hedge.discretization.Discretization.copy_with_mesh`.
+    """
+    new_discr = discr.copy_with_mesh(adaptation.mesh, reuse_code=reuse_code)
+    return new_discr, FieldTransfer(discr, new_discr, adaptation)
+
+# }}}
+
+
+
+
+# vim: foldmethod=marker
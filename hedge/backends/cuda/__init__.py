@@ -332,6 +332,9 @@ class Discretization(hedge.discretization.Discretization):
 
         log_info("cuda discr: init superclass")
 
+        if isinstance(order, (list, tuple, numpy.ndarray)):
+            raise NotImplementedError("per-element orders in the CUDA backend")
+
         ldis = self.get_local_discretization(mesh, local_discretization, order)
 
         hedge.discretization.Discretization.__init__(self, mesh, ldis, debug=debug,
@@ -485,6 +488,19 @@ class Discretization(hedge.discretization.Discretization):
                 from warnings import warn
                 warn("Error when popping context in Discretization.close().")
 
+    def copy_with_mesh(self, mesh, reuse_code=False):
+        if reuse_code:
+            raise NotImplementedError(
+                    "reusing compiled code in the CUDA backend")
+
+        return hedge.discretization.Discretization.copy_with_mesh(
+                self, mesh)
+
+    @staticmethod
+    def _get_code_cache_key(optemplate, post_bind_mapper, type_hints):
+        # the CUDA executor always compiles its code itself
+        return None
+
     # }}}
 
     # {{{ setup ---------------------------------------------------------------
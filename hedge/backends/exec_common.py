@@ -27,6 +27,7 @@ THE SOFTWARE.
 
 
 
+import numpy
 import hedge.optemplate
 
 
@@ -45,10 +46,32 @@ class ExecutionMapperBase(hedge.optemplate.Evaluator,
             raise NotImplementedError("normal components on quad. grids")
         return self.discr.boundary_normals(expr.boundary_tag)[expr.axis]
 
+    def is_per_element(self, expr):
+        """Return whether *expr* evaluates to a per-element vector. Backends
+        that produce per-element vectors override this.
+        """
+        return False
+
+    def broadcast_mixed(self, exprs, values):
+        """Return *values*, the values of *exprs*, with per-element vectors
+        broadcast to volume vectors if other vectors are among them.
+        """
+        per_element = [self.is_per_element(expr) for expr in exprs]
+        if any(per_element) and any(
+                isinstance(value, numpy.ndarray) and not pe
+                for value, pe in zip(values, per_element)):
+            return [self.discr.broadcast_per_element(value) if pe else value
+                    for value, pe in zip(values, per_element)]
+        else:
+            return values
+
     def map_boundarize(self, op, field_expr):
-        return self.discr.boundarize_volume_field(
-                self.rec(field_expr), tag=op.tag,
-                kind=self.discr.compute_kind)
+        field = self.rec(field_expr)
+        if self.is_per_element(field_expr):
+            field = self.discr.broadcast_per_element(field)
+
+        return self.discr.boundarize_volume_field(field,
+                tag=op.tag, kind=self.discr.compute_kind)
 
     def map_scalar_parameter(self, expr):
         return self.context[expr.name]
@@ -74,4 +97,7 @@ class ExecutionMapperBase(hedge.optemplate.Evaluator,
         except KeyError:
             func = getattr(numpy, expr.function.name)
 
-        return func(*[self.rec(p) for p in expr.parameters])
+        args = self.broadcast_mixed(expr.parameters,
+                [self.rec(p) for p in expr.parameters])
+
+        return func(*args)
@@ -37,6 +37,18 @@ import numpy
 
 # {{{ exec mapper -------------------------------------------------------------
 class ExecutionMapper(ExecutionMapperBase):
+    def is_per_element(self, expr):
+        return self.executor.code.is_per_element(expr)
+
+    def rec_volume(self, expr):
+        """Evaluate *expr*, broadcasting a per-element result to a volume
+        vector.
+        """
+        result = self.rec(expr)
+        if self.is_per_element(expr):
+            result = self.discr.broadcast_per_element(result)
+        return result
+
     # {{{ code execution functions --------------------------------------------
     def exec_assign(self, insn):
         return [(name, self.rec(expr))
@@ -54,10 +66,21 @@ class ExecutionMapper(ExecutionMapperBase):
             return [(name, self(expr))
                 for name, expr in zip(insn.names, insn.exprs)], []
         else:
-            compiled = insn.compiled(self.executor)
+            compiled = self.executor.get_compiled_insn(insn)
             return zip(compiled.result_names(),
                     compiled(self, stats_callback)), []
 
+    def exec_elementwise_max_assign(self, insn):
+        if self.discr.instrumented:
+            def stats_callback(n, vec_expr):
+                self.discr.vector_math_flop_counter.add(n*insn.flop_count())
+                return self.discr.vector_math_timer
+        else:
+            stats_callback = None
+
+        compiled = self.executor.get_compiled_insn(insn)
+        return [(insn.names[0], compiled(self, stats_callback))], []
+
     def exec_flux_batch_assign(self, insn):
         from pymbolic.primitives import is_zero
 
@@ -70,7 +93,10 @@ class ExecutionMapper(ExecutionMapperBase):
 
         def eval_arg(arg_spec):
             arg_expr, is_int = arg_spec
-            arg = self.rec(arg_expr)
+            if insn.is_boundary and not is_int:
+                arg = self.rec(arg_expr)
+            else:
+                arg = self.rec_volume(arg_expr)
             if is_zero(arg):
                 if insn.is_boundary and not is_int:
                     return BoundaryZeros()
@@ -115,15 +141,18 @@ class ExecutionMapper(ExecutionMapperBase):
                 face_groups = self.discr.get_quadrature_info(insn.quadrature_tag) \
                         .face_groups
 
-        result = []
-
-        for fg in face_groups:
-            # grab module
-            module = insn.get_module(self.discr, max_dtype)
-            func = module.gather_flux
+        def get_lift_matrix_and_scaling(fg, flux_bdg):
+            if insn.quadrature_tag is None:
+                if flux_bdg.op.is_lift:
+                    return (fg.ldis_loc.lifting_matrix(),
+                            fg.local_el_inverse_jacobians)
+                else:
+                    return fg.ldis_loc.multi_face_mass_matrix(), None
+            else:
+                assert not flux_bdg.op.is_lift
+                return fg.ldis_loc_quad_info.multi_face_mass_matrix(), None
 
-            # set up argument structure
-            arg_struct = module.ArgStruct()
+        def set_flux_args(arg_struct, args):
             for arg_name, arg in zip(insn.flux_var_info.arg_names, args):
                 setattr(arg_struct, arg_name, arg)
             for arg_num, scalar_arg_expr in enumerate(insn.flux_var_info.scalar_parameters):
@@ -131,6 +160,15 @@ class ExecutionMapper(ExecutionMapperBase):
                         "_scalar_arg_%d" % arg_num,
                         self.rec(scalar_arg_expr))
 
+        def gather_then_lift(fg, args=args):
+            # grab module
+            module = self.executor.get_flux_module(insn, max_dtype)
+            func = module.gather_flux
+
+            # set up argument structure
+            arg_struct = module.ArgStruct()
+            set_flux_args(arg_struct, args)
+
             fof_shape = (fg.face_count*fg.face_length()*fg.element_count(),)
             all_fluxes_on_faces = [
                     numpy.zeros(fof_shape, dtype=max_dtype)
@@ -146,67 +184,231 @@ class ExecutionMapper(ExecutionMapperBase):
             func(fg, arg_struct)
 
             # do lift, produce output
-            for name, flux_bdg, fluxes_on_faces in zip(insn.names, insn.expressions,
+            outs = []
+            for flux_bdg, fluxes_on_faces in zip(insn.expressions,
                     all_fluxes_on_faces):
-
-                if insn.quadrature_tag is None:
-                    if flux_bdg.op.is_lift:
-                        mat = fg.ldis_loc.lifting_matrix()
-                        scaling = fg.local_el_inverse_jacobians
-                    else:
-                        mat = fg.ldis_loc.multi_face_mass_matrix()
-                        scaling = None
-                else:
-                    assert not flux_bdg.op.is_lift
-                    mat = fg.ldis_loc_quad_info.multi_face_mass_matrix()
-                    scaling = None
+                mat, scaling = get_lift_matrix_and_scaling(fg, flux_bdg)
 
                 out = self.discr.volume_zeros(dtype=fluxes_on_faces.dtype)
                 self.executor.lift_flux(fg, mat, scaling, fluxes_on_faces, out)
+                outs.append(out)
 
-                if self.discr.instrumented:
-                    from hedge.tools import lift_flops
+            return outs
 
-                    # correct for quadrature, too.
-                    self.discr.lift_flop_counter.add(lift_flops(fg))
+        def fused_gather_lift(fg, args=args):
+            module = self.executor.get_flux_module(insn, max_dtype,
+                    fused=True)
 
-                result.append((name, out))
+            arg_struct = module.ArgStruct()
+            set_flux_args(arg_struct, args)
 
-        if not face_groups:
+            from hedge.backends.jit.flux import make_element_face_slots
+            arg_struct.el_face_slots = make_element_face_slots(fg)
+
+            from pytools import to_uncomplex_dtype
+            outs = []
+            for i, flux_bdg in enumerate(insn.expressions):
+                mat, scaling = get_lift_matrix_and_scaling(fg, flux_bdg)
+
+                out = self.discr.volume_zeros(dtype=max_dtype)
+                setattr(arg_struct, "flux%d_result" % i, out)
+                setattr(arg_struct, "flux%d_matrix" % i,
+                        self.discr.get_cast_matrix(mat,
+                            to_uncomplex_dtype(max_dtype)).reshape(-1))
+                if flux_bdg.op.is_lift:
+                    setattr(arg_struct, "flux%d_scaling" % i, scaling)
+                outs.append(out)
+
+            assert not arg_struct.__dict__, arg_struct.__dict__.keys()
+
+            module.gather_lift_flux(fg, arg_struct)
+            return outs
+
+        if insn.quadrature_tag is None:
+            gather_lift = self.executor.pick_flux_gather_lift(
+                    face_groups, insn.is_boundary, [
+                ("separate", gather_then_lift),
+                ("fused", fused_gather_lift),
+                ])
+        else:
+            gather_lift = gather_then_lift
+
+        # Each face group contributes to the elements it touches.
+        results = None
+
+        def add_outs(outs):
+            if results is None:
+                return outs
+            else:
+                for res, out in zip(results, outs):
+                    res += out
+                return results
+
+        def count_lift_flops(fg):
+            if self.discr.instrumented:
+                from hedge.tools import lift_flops
+
+                # correct for quadrature, too.
+                self.discr.lift_flop_counter.add(
+                        len(insn.expressions)*lift_flops(fg))
+
+        for fg in face_groups:
+            results = add_outs(gather_lift(fg))
+            count_lift_flops(fg)
+
+        if (not insn.is_boundary and insn.quadrature_tag is None
+                and self.discr.mixed_order_face_groups):
+            # The exterior sides of mixed-order face pairs refer to
+            # interpolated values appended to the volume vectors.
+            # These face groups are single-sided, which the fused module
+            # handles without flipping.
+            trace = self.discr.mixed_order_trace
+            trace_args = [trace.extend(arg)
+                    if isinstance(arg, numpy.ndarray) else arg
+                    for arg in args]
+
+            for fg in self.discr.mixed_order_face_groups:
+                results = add_outs(fused_gather_lift(fg, trace_args))
+                count_lift_flops(fg)
+
+        if results is None:
             # No face groups? Still assign context variables.
-            for name, flux_bdg in zip(insn.names, insn.expressions):
-                result.append((name, self.discr.volume_zeros()))
+            results = [self.discr.volume_zeros()
+                    for flux_bdg in insn.expressions]
 
-        return result, []
+        return zip(insn.names, results), []
 
     def exec_diff_batch_assign(self, insn):
-        rst_diff = self.executor.diff(insn.operators, self.rec(insn.field))
+        rst_diff = self.executor.diff(insn.operators,
+                self.rec_volume(insn.field))
 
         return [(name, diff) for name, diff in zip(insn.names, rst_diff)], []
 
     exec_quad_diff_batch_assign = exec_diff_batch_assign
 
+    def exec_xyz_diff_batch_assign(self, insn):
+        xyz_diff = self.executor.diff_xyz(insn.op_class, insn.xyz_axes,
+                self.rec_volume(insn.field))
+
+        return [(name, diff) for name, diff in zip(insn.names, xyz_diff)], []
+
+    def elementwise_parts(self, op):
+        """Return a tuple *(out_size, parts)* describing the element-local
+        operator *op* in the form expected by
+        :func:`hedge.backends.jit.gemm.gemm_batched_elwise`.
+        """
+        from hedge.optemplate.operators import (
+                ElementwiseLinearOperator,
+                ReferenceQuadratureMassOperator,
+                QuadratureGridUpsampler,
+                QuadratureInteriorFacesGridUpsampler,
+                QuadratureBoundaryGridUpsampler)
+
+        discr = self.discr
+
+        if isinstance(op, ElementwiseLinearOperator):
+            return len(discr), [
+                    (eg.ranges, eg.ranges, op.matrix(eg), op.coefficients(eg))
+                    for eg in discr.element_groups]
+
+        elif isinstance(op, ReferenceQuadratureMassOperator):
+            return len(discr), [
+                    (eg.quadrature_info[op.quadrature_tag].ranges, eg.ranges,
+                        eg.quadrature_info[op.quadrature_tag]
+                        .ldis_quad_info.mass_matrix(), None)
+                    for eg in discr.element_groups]
+
+        elif isinstance(op, QuadratureGridUpsampler):
+            quad_info = discr.get_quadrature_info(op.quadrature_tag)
+            return quad_info.node_count, [
+                    (eg.ranges, eg.quadrature_info[op.quadrature_tag].ranges,
+                        eg.quadrature_info[op.quadrature_tag]
+                        .ldis_quad_info.volume_up_interpolation_matrix(), None)
+                    for eg in discr.element_groups]
+
+        elif isinstance(op, QuadratureInteriorFacesGridUpsampler):
+            quad_info = discr.get_quadrature_info(op.quadrature_tag)
+            return quad_info.int_faces_node_count, [
+                    (eg.ranges,
+                        eg.quadrature_info[op.quadrature_tag].el_faces_ranges,
+                        eg.quadrature_info[op.quadrature_tag].ldis_quad_info
+                        .volume_to_face_up_interpolation_matrix(), None)
+                    for eg in discr.element_groups]
+
+        elif isinstance(op, QuadratureBoundaryGridUpsampler):
+            bdry = discr.get_boundary(op.boundary_tag)
+            bdry_q_info = bdry.get_quadrature_info(op.quadrature_tag)
+            return bdry_q_info.node_count, [
+                    (from_ranges, to_ranges,
+                        ldis_quad_info.face_up_interpolation_matrix(), None)
+                    for from_ranges, to_ranges, ldis_quad_info in zip(
+                        bdry.fg_ranges,
+                        bdry_q_info.fg_ranges,
+                        bdry_q_info.fg_ldis_quad_infos)]
+
+        else:
+            raise TypeError("cannot batch operator '%s'" % op)
+
+    def exec_elementwise_batch_assign(self, insn):
+        from hedge.tools import is_zero
+        fields = [self.rec_volume(field) for field in insn.fields]
+        nonzero = [(name, field)
+                for name, field in zip(insn.names, fields)
+                if not is_zero(field)]
+
+        result = [(name, 0)
+                for name, field in zip(insn.names, fields)
+                if is_zero(field)]
+
+        from hedge.optemplate.operators import ElementwiseLinearOperator
+        if len(nonzero) == 1 \
+                and isinstance(insn.op, ElementwiseLinearOperator):
+            # nothing to batch--use the autotuned single-field variant
+            (name, field), = nonzero
+            out = self.discr.volume_zeros(dtype=field.dtype)
+            self.executor.do_elementwise_linear(insn.op, field, out)
+            result.append((name, out))
+
+        elif nonzero:
+            from pytools import common_dtype
+            dtype = common_dtype([field.dtype for name, field in nonzero],
+                    self.discr.default_scalar_type)
+
+            out_size, parts = self.elementwise_parts(insn.op)
+
+            from hedge.backends.jit.gemm import gemm_batched_elwise
+            apply_batch = gemm_batched_elwise
+
+            if self.discr.instrumented \
+                    and isinstance(insn.op, ElementwiseLinearOperator):
+                from hedge.tools import time_count_flop, mass_flops
+                apply_batch = time_count_flop(apply_batch,
+                        self.discr.el_local_timer,
+                        self.discr.el_local_counter,
+                        self.discr.el_local_flop_counter,
+                        len(nonzero)*mass_flops(self.discr))
+
+            result.extend(zip(
+                [name for name, field in nonzero],
+                apply_batch(parts, [field for name, field in nonzero],
+                    out_size, dtype)))
+
+        return result, []
+
     # }}}
 
     # {{{ expression mappings -------------------------------------------------
     def map_if_positive(self, expr):
-        crit = self.rec(expr.criterion)
-        bool_crit = crit > 0
-        then = self.rec(expr.then)
-        else_ = self.rec(expr.else_)
-
-        true_indices = numpy.nonzero(bool_crit)
-        false_indices = numpy.nonzero(~bool_crit)
+        # Only reached for selects that were not compiled into a vector
+        # expression. Fill in the else branch, then overwrite in place
+        # where the criterion holds, without building index arrays.
+        arg_exprs = [expr.criterion, expr.then, expr.else_]
+        crit, then, else_ = self.broadcast_mixed(arg_exprs,
+                [self.rec(arg_expr) for arg_expr in arg_exprs])
 
         result = numpy.empty_like(crit)
-
-        if isinstance(then, numpy.ndarray):
-            then = then[true_indices]
-        if isinstance(else_, numpy.ndarray):
-            else_ = else_[false_indices]
-
-        result[true_indices] = then
-        result[false_indices] = else_
+        result[...] = else_
+        numpy.putmask(result, crit > 0, then)
         return result
 
     def map_ref_diff_base(self, op, field_expr):
@@ -214,18 +416,22 @@ class ExecutionMapper(ExecutionMapperBase):
                 "differentiation should be happening in batched form")
 
     def map_elementwise_linear(self, op, field_expr):
-        field = self.rec(field_expr)
+        field = self.rec_volume(field_expr)
 
         from hedge.tools import is_zero
         if is_zero(field):
             return 0
 
+        from hedge.optemplate.operators import ElementReductionOperator
+        if isinstance(op, ElementReductionOperator):
+            return self.executor.do_elementwise_reduction(op, field)
+
         out = self.discr.volume_zeros()
         self.executor.do_elementwise_linear(op, field, out)
         return out
 
     def map_ref_quad_mass(self, op, field_expr):
-        field = self.rec(field_expr)
+        field = self.rec_volume(field_expr)
 
         from hedge.tools import is_zero
         if is_zero(field):
@@ -246,7 +452,7 @@ class ExecutionMapper(ExecutionMapperBase):
         return out
 
     def map_quad_grid_upsampler(self, op, field_expr):
-        field = self.rec(field_expr)
+        field = self.rec_volume(field_expr)
 
         from hedge.tools import is_zero
         if is_zero(field):
@@ -268,7 +474,7 @@ class ExecutionMapper(ExecutionMapperBase):
         return out
 
     def map_quad_int_faces_grid_upsampler(self, op, field_expr):
-        field = self.rec(field_expr)
+        field = self.rec_volume(field_expr)
 
         from hedge.tools import is_zero
         if is_zero(field):
@@ -290,7 +496,7 @@ class ExecutionMapper(ExecutionMapperBase):
         return out
 
     def map_quad_bdry_grid_upsampler(self, op, field_expr):
-        field = self.rec(field_expr)
+        field = self.rec_volume(field_expr)
 
         from hedge.tools import is_zero
         if is_zero(field):
@@ -316,6 +522,8 @@ class ExecutionMapper(ExecutionMapperBase):
     def map_elementwise_max(self, op, field_expr):
         from hedge._internal import perform_elwise_max
         field = self.rec(field_expr)
+        if self.is_per_element(field_expr):
+            return field
 
         out = self.discr.volume_zeros(dtype=field.dtype)
         for eg in self.discr.element_groups:
@@ -323,25 +531,85 @@ class ExecutionMapper(ExecutionMapperBase):
 
         return out
 
+    def map_jacobian(self, expr):
+        if expr.quadrature_tag is None:
+            return self.discr.per_element_jacobians()
+        else:
+            return ExecutionMapperBase.map_jacobian(self, expr)
+
+    def map_forward_metric_derivative(self, expr):
+        if expr.quadrature_tag is None:
+            return (self.discr.per_element_forward_metric_derivatives()
+                    [expr.xyz_axis][expr.rst_axis])
+        else:
+            return ExecutionMapperBase.map_forward_metric_derivative(
+                    self, expr)
+
+    def map_inverse_metric_derivative(self, expr):
+        if expr.quadrature_tag is None:
+            return (self.discr.per_element_inverse_metric_derivatives()
+                    [expr.xyz_axis][expr.rst_axis])
+        else:
+            return ExecutionMapperBase.map_inverse_metric_derivative(
+                    self, expr)
+
     # }}}
 
 # }}}
 
 # {{{ executor ----------------------------------------------------------------
+GEMM_BLOCK_SIZE = 256
+
+
+
+
 class Executor(object):
-    def __init__(self, discr, optemplate, post_bind_mapper, type_hints):
+    def __init__(self, discr, optemplate, post_bind_mapper, type_hints,
+            code=None):
+        """
+        :param code: if not *None*, a :class:`hedge.compiler.Code` previously
+          compiled from the same arguments on a discretization differing
+          from *discr* only in its elements, to be used instead of
+          compiling *optemplate* again.
+        """
         self.discr = discr
-        self.code = self.compile_optemplate(discr, optemplate, 
-                post_bind_mapper, type_hints)
-        self.elwise_linear_cache = {}
 
-        if "dump_op_code" in discr.debug:
-            from hedge.tools import open_unique_debug_file
-            open_unique_debug_file("op-code", ".txt").write(
-                    str(self.code))
+        # compiled forms of the instructions in self.code, see
+        # get_compiled_insn and get_flux_module
+        self.insn_artifacts = {}
+
+        from hedge.compiler import CompileProfile
+        self.compile_profile = CompileProfile(discr.module_builds)
+
+        discr.active_compile_profiles.append(self.compile_profile)
+        try:
+            if code is None:
+                code = self.compile_optemplate(discr, optemplate,
+                        post_bind_mapper, type_hints)
+            self.code = code
+            self.elwise_linear_cache = {}
+
+            if "dump_op_code" in discr.debug:
+                from hedge.tools import open_unique_debug_file
+                open_unique_debug_file("op-code", ".txt").write(
+                        str(self.code))
+
+            self.tune()
+        finally:
+            discr.active_compile_profiles.pop()
+
+    def tune(self):
+        """Pick the implementations of the local operators, see
+        :meth:`pick_faster_func`.
+        """
+        discr = self.discr
+
+        def make_test_field():
+            return numpy.random.randn(len(discr)).astype(
+                    discr.default_scalar_type)
 
         def bench_diff(f):
-            test_field = discr.volume_zeros()
+            test_field = make_test_field()
             from hedge.optemplate import ReferenceDifferentiationOperator
             from time import time
 
@@ -350,6 +618,16 @@ class Executor(object):
                 for i in range(discr.dimensions)], test_field)
             return time() - start
 
+        def bench_diff_xyz(f):
+            test_field = make_test_field()
+            from hedge.optemplate import ReferenceDifferentiationOperator
+            from time import time
+
+            start = time()
+            f(ReferenceDifferentiationOperator, range(discr.dimensions),
+                    test_field)
+            return time() - start
+
         def bench_lift(f):
             if len(discr.face_groups) == 0:
                 return 0
@@ -358,27 +636,157 @@ class Executor(object):
             out = discr.volume_zeros()
             from time import time
 
-            xyz_needed = range(discr.dimensions)
-
             fof_shape = (fg.face_count*fg.face_length()*fg.element_count(),)
-            fof = numpy.zeros(fof_shape, dtype=self.discr.default_scalar_type)
+            fof = numpy.random.randn(*fof_shape).astype(
+                    discr.default_scalar_type)
 
             start = time()
             f(fg, fg.ldis_loc.lifting_matrix(), fg.local_el_inverse_jacobians, fof, out)
             return time() - start
 
-        def pick_faster_func(benchmark, choices, attempts=3):
-            from pytools import argmin2
-            return argmin2(
-                    (f, min(benchmark(f) for i in range(attempts)))
-                    for f in choices)
+        def bench_elwise_linear(f):
+            test_field = make_test_field()
+            out = discr.volume_zeros()
+            from hedge.optemplate.operators import ReferenceMassOperator
+            from time import time
+
+            start = time()
+            f(ReferenceMassOperator(), test_field, out)
+            return time() - start
+
+        self.chosen_variants = {}
+        pick_faster_func = self.pick_faster_func
 
         from hedge.backends.jit.diff import JitDifferentiator
-        self.diff = pick_faster_func(bench_diff,
-                [self.diff_builtin, JitDifferentiator(discr)])
+        from hedge.backends.jit.gemm import GemmDifferentiator
+        self.diff = pick_faster_func("diff", bench_diff, [
+            ("builtin", self.diff_builtin),
+            ("jit", JitDifferentiator(discr)),
+            ("gemm", GemmDifferentiator(discr)),
+            ("gemm_blocked", GemmDifferentiator(discr,
+                block_size=GEMM_BLOCK_SIZE)),
+            ])
+
+        from hedge.backends.jit.diff import JitXYZDifferentiator
+        self.diff_xyz = pick_faster_func("diff_xyz", bench_diff_xyz, [
+            ("builtin", self.diff_xyz_builtin),
+            ("jit", JitXYZDifferentiator(discr)),
+            ])
+
         from hedge.backends.jit.lift import JitLifter
-        self.lift_flux = pick_faster_func(bench_lift,
-                [self.lift_flux, JitLifter(discr)])
+        from hedge.backends.jit.gemm import GemmLifter
+        self.lift_flux = pick_faster_func("lift", bench_lift, [
+            ("builtin", self.lift_flux),
+            ("jit", JitLifter(discr)),
+            ("gemm", GemmLifter(discr)),
+            ("gemm_blocked", GemmLifter(discr, block_size=GEMM_BLOCK_SIZE)),
+            ])
+
+        from hedge.backends.jit.gemm import GemmElementwiseLinear
+        self.do_elementwise_linear = pick_faster_func(
+                "elwise_linear", bench_elwise_linear, [
+            ("builtin", self.do_elementwise_linear),
+            ("gemm", GemmElementwiseLinear(discr)),
+            ("gemm_blocked", GemmElementwiseLinear(discr,
+                block_size=GEMM_BLOCK_SIZE)),
+            ])
+
+    def get_compiled_insn(self, insn):
+        """Return the compiled form of the instruction *insn* of
+        :attr:`code` on this executor's discretization.
+
+        This is kept on the executor rather than on the instruction, since
+        the instructions may be shared with executors on other
+        discretizations (see
+        :meth:`hedge.discretization.Discretization.copy_with_mesh`).
+        """
+        key = id(insn)
+        try:
+            return self.insn_artifacts[key]
+        except KeyError:
+            result = self.insn_artifacts[key] = insn.compile(self)
+            return result
+
+    def get_flux_module(self, insn, dtype, fused=False):
+        """Return the module computing the fluxes of the flux batch
+        instruction *insn* of :attr:`code`, as in :meth:`get_compiled_insn`.
+        If *fused* is set, the module also lifts the fluxes.
+        """
+        key = id(insn), numpy.dtype(dtype), fused
+        try:
+            return self.insn_artifacts[key]
+        except KeyError:
+            if fused:
+                result = insn.make_fused_module(self.discr, dtype)
+            else:
+                result = insn.make_module(self.discr, dtype)
+
+            self.insn_artifacts[key] = result
+            return result
+
+    def pick_faster_func(self, kind, benchmark, choices):
+        """Among the (name, function) pairs in *choices*, return the
+        function that runs *benchmark* the fastest. The decision is
+        looked up in (or recorded to) the persistent tuning database.
+        """
+        from hedge.backends.jit.tuning import get_tuning_database
+        from time import time
+        start = time()
+        name = get_tuning_database().pick(
+                self.tuning_key(kind), benchmark, choices)
+        self.compile_profile.add_phase("tuning:"+kind, time()-start)
+
+        self.chosen_variants[kind] = name
+        return dict(choices)[name]
+
+    def pick_flux_gather_lift(self, face_groups, is_boundary, choices):
+        """Return whichever of the (name, function) pairs in *choices*
+        computes (and lifts) fluxes on a face group fastest. Unlike the
+        other operations, this is decided on first use, with the first
+        flux batch (on the first of *face_groups*) as the benchmark.
+
+        Boundary and interior face groups, and face groups of different
+        sizes, are tuned separately. A variant name stored under the plain
+        kind ``"flux_lift"`` in :attr:`chosen_variants` overrides the
+        choice for all face groups.
+        """
+        try:
+            return dict(choices)[self.chosen_variants["flux_lift"]]
+        except KeyError:
+            pass
+
+        if not face_groups:
+            return choices[0][1]
+
+        fg = face_groups[0]
+
+        from hedge.backends.jit.tuning import element_count_bucket
+        if is_boundary:
+            where = "boundary"
+        else:
+            where = "interior"
+        kind = "flux_lift:%s:%d:%d" % (where, fg.face_count,
+                element_count_bucket(len(fg.face_pairs)))
+
+        try:
+            return dict(choices)[self.chosen_variants[kind]]
+        except KeyError:
+            pass
+
+        def bench_flux_lift(f):
+            from time import time
+            start = time()
+            f(fg)
+            return time() - start
+
+        return self.pick_faster_func(kind, bench_flux_lift, choices)
+
+    def tuning_key(self, kind):
+        """Return the key under which the choice of implementation for
+        the operation *kind* is stored in the tuning database.
+        """
+        from hedge.backends.jit.tuning import make_tuning_key
+        return make_tuning_key(kind, self.discr)
 
     def compile_optemplate(self, discr, optemplate, post_bind_mapper,
             type_hints):
@@ -394,14 +802,27 @@ class Executor(object):
                         pretty_print_optemplate(optemplate))
                 stage[0] += 1
 
+        pass_timings = {}
         optemplate = process_optemplate(optemplate,
                 post_bind_mapper=post_bind_mapper,
                 dumper=dump_optemplate,
                 mesh=discr.mesh,
-                type_hints=type_hints)
+                type_hints=type_hints,
+                cache=discr.get_optemplate_processing_cache(),
+                pass_timings=pass_timings)
+
+        if "optemplate_pass_timing" in discr.debug:
+            print "optemplate processing times:"
+            for name, seconds in sorted(pass_timings.iteritems(),
+                    key=lambda item: -item[1]):
+                print "    %-25s %.4f s" % (name, seconds)
+
+        for name, seconds in pass_timings.iteritems():
+            self.compile_profile.add_phase("optemplate:"+name, seconds)
 
         from hedge.backends.jit.compiler import OperatorCompiler
-        return OperatorCompiler(discr)(optemplate, type_hints)
+        return OperatorCompiler(discr)(optemplate, type_hints,
+                profile=self.compile_profile)
 
     def instrument(self):
         discr = self.discr
@@ -439,11 +860,19 @@ class Executor(object):
                         discr.lift_timer,
                         discr.lift_counter)
 
+        mgr = getattr(discr, "log_manager", None)
+        if mgr is not None:
+            for kind, name in self.chosen_variants.iteritems():
+                mgr.set_constant("jit_variant_%s" % kind, name)
+
+            self.compile_profile.add_to_log(mgr)
+
     def lift_flux(self, fgroup, matrix, scaling, field, out):
         from hedge._internal import lift_flux
         from pytools import to_uncomplex_dtype
         lift_flux(fgroup,
-                matrix.astype(to_uncomplex_dtype(field.dtype)),
+                self.discr.get_cast_matrix(matrix,
+                    to_uncomplex_dtype(field.dtype)),
                 scaling, field, out)
 
     def diff_rst(self, op, field):
@@ -452,7 +881,8 @@ class Executor(object):
         from hedge._internal import perform_elwise_operator
         for eg in self.discr.element_groups:
             perform_elwise_operator(op.preimage_ranges(eg), eg.ranges,
-                    op.matrices(eg)[op.rst_axis].astype(field.dtype),
+                    self.discr.get_cast_matrix(
+                        op.matrices(eg)[op.rst_axis], field.dtype),
                     field, result)
 
         return result
@@ -465,6 +895,28 @@ class Executor(object):
 
         return [self.diff_rst(op, field) for op in operators]
 
+    def diff_xyz_builtin(self, op_class, xyz_axes, field):
+        """Return the derivatives of *field* along each of the axes in
+        *xyz_axes*, computed from the reference derivatives obtained with
+        *op_class* and the per-element inverse metric constants.
+        """
+        rst_diffs = self.diff(
+                [op_class(rst_axis) for rst_axis in range(self.discr.dimensions)],
+                field)
+
+        result = [self.discr.volume_zeros(dtype=field.dtype)
+                for i in xyz_axes]
+
+        for eg in self.discr.element_groups:
+            metric = self.discr.inverse_metric_constants(eg)
+            for xyz_axis, res in zip(xyz_axes, result):
+                res_el = eg.el_array_from_volume(res)
+                for rst_axis, rst_diff in enumerate(rst_diffs):
+                    res_el += (metric[:, xyz_axis, rst_axis, numpy.newaxis]
+                            * eg.el_array_from_volume(rst_diff))
+
+        return result
+
     def do_elementwise_linear(self, op, field, out):
         for eg in self.discr.element_groups:
             try:
@@ -485,9 +937,49 @@ class Executor(object):
                 perform_elwise_scaled_operator(eg.ranges, eg.ranges,
                         coeffs, matrix, field, out)
 
+    def do_elementwise_reduction(self, op, field):
+        """Apply the :class:`hedge.optemplate.operators.ElementReductionOperator`
+        *op* to *field* and return the result as a per-element vector.
+        """
+        result = self.discr.per_element_empty(dtype=field.dtype)
+
+        for eg, el_slice in zip(self.discr.element_groups,
+                self.discr.per_element_slices()):
+            try:
+                row, coeffs = self.elwise_linear_cache[
+                        eg, op, field.dtype, "row"]
+            except KeyError:
+                row = numpy.asarray(op.row(eg), dtype=field.dtype)
+                coeffs = op.coefficients(eg)
+                self.elwise_linear_cache[eg, op, field.dtype, "row"] = \
+                        row, coeffs
+
+            result[el_slice] = numpy.dot(eg.el_array_from_volume(field), row)
+            if coeffs is not None:
+                result[el_slice] *= coeffs
+
+        return result
+
     def __call__(self, **context):
-        return self.code.execute(
-                self.discr.exec_mapper_class(context, self))
+        # modules built on first use belong to this executor's profile
+        self.discr.active_compile_profiles.append(self.compile_profile)
+        try:
+            result = self.code.execute(
+                    self.discr.exec_mapper_class(context, self))
+        finally:
+            self.discr.active_compile_profiles.pop()
+
+        # per-element results are an internal storage format
+        from hedge.tools import is_obj_array
+        if is_obj_array(result):
+            result = result.copy()
+            for i in numpy.ndindex(result.shape):
+                if self.code.is_per_element(self.code.result[i]):
+                    result[i] = self.discr.broadcast_per_element(result[i])
+        elif self.code.is_per_element(self.code.result):
+            result = self.discr.broadcast_per_element(result)
+
+        return result
 
 # }}}
 
@@ -500,6 +992,7 @@ class Discretization(hedge.discretization.Discretization):
     def all_debug_flags(cls):
         return hedge.discretization.Discretization.all_debug_flags() | set([
             "jit_dont_optimize_large_exprs",
+            "jit_no_xyz_diff",
             ])
 
     @classmethod
@@ -526,6 +1019,71 @@ class Discretization(hedge.discretization.Discretization):
 
         self.toolchain = toolchain
 
+        self.module_builds = []
+        self.built_module_checksums = set()
+        self.active_compile_profiles = []
+
+        self.cast_matrix_cache = {}
+
+    def add_instrumentation(self, mgr):
+        hedge.discretization.Discretization.add_instrumentation(self, mgr)
+
+        # executors record their choice of operator implementations here
+        self.log_manager = mgr
+
+    def build_module(self, kind, source, build):
+        """Return the result of calling *build*, which compiles the C++
+        code *source* into an extension module, and record the build in
+        :attr:`module_builds` (see :class:`hedge.compiler.ModuleBuild`).
+
+        The build is attributed to the innermost of
+        :attr:`active_compile_profiles`, i.e. to the executor that is
+        being compiled or run.
+        """
+        from hashlib import md5
+        checksum = md5(source).hexdigest()
+
+        if self.active_compile_profiles:
+            profile = self.active_compile_profiles[-1]
+        else:
+            profile = None
+
+        from time import time
+        start = time()
+        result = build()
+
+        from hedge.compiler import ModuleBuild
+        self.module_builds.append(ModuleBuild(
+            kind=kind, seconds=time()-start,
+            cache_hit=checksum in self.built_module_checksums,
+            profile=profile))
+        self.built_module_checksums.add(checksum)
+
+        return result
+
+    def get_cast_matrix(self, matrix, dtype, transpose=False):
+        """Return *matrix* (or, if *transpose* is set, its transpose) as a
+        C-contiguous array of type *dtype*.
+
+        Each conversion happens only once. The results are looked up by
+        the identity of *matrix*, so this is meant for matrices that live
+        as long as the discretization, such as the (memoized) matrices of
+        the local discretizations.
+        """
+        dtype = numpy.dtype(dtype)
+        key = id(matrix), dtype, transpose
+        try:
+            return self.cast_matrix_cache[key][1]
+        except KeyError:
+            if transpose:
+                result = numpy.asarray(matrix.T, dtype=dtype, order="C")
+            else:
+                result = numpy.asarray(matrix, dtype=dtype, order="C")
+
+            # holding on to *matrix* keeps its id from being reused
+            self.cast_matrix_cache[key] = matrix, result
+            return result
+
 # }}}
 
 
@@ -31,7 +31,8 @@ import hedge.discretization
 import hedge.optemplate
 from pytools import memoize_method
 from hedge.compiler import OperatorCompilerBase, FluxBatchAssign, \
-        Assign
+        Assign, Instruction
+from hedge.optemplate.mappers import BoundOperatorCollector
 
 
 
@@ -45,8 +46,10 @@ class VectorExprAssign(Assign):
 
     comment = "compiled"
 
-    @memoize_method
-    def compiled(self, executor):
+    def compile(self, executor):
+        """Return the compiled vector expression for *executor*. Cached by
+        :meth:`hedge.backends.jit.Executor.get_compiled_insn`.
+        """
         discr = executor.discr
 
         if self.flop_count() > 500:
@@ -69,7 +72,103 @@ class VectorExprAssign(Assign):
                     for name, expr, dnr in zip(
                         self.names, self.exprs, self.do_not_return)],
                 result_dtype_getter=simple_result_dtype_getter,
-                toolchain=toolchain)
+                toolchain=toolchain,
+                module_builder=discr.build_module,
+                element_ranges=[eg.ranges for eg in discr.element_groups],
+                per_element_starts=[sl.start
+                    for sl in discr.per_element_slices()],
+                is_per_element=executor.code.is_per_element)
+
+
+
+class ElementwiseMaxAssign(Instruction):
+    """Evaluates the vector expression *expr* and takes its maximum over
+    each element in the same pass, so that the value of *expr* is never
+    stored.
+
+    :ivar names: a list containing the single assignee.
+    :ivar expr:
+    """
+
+    comment = "compiled"
+
+    def get_assignees(self):
+        return set(self.names)
+
+    @memoize_method
+    def get_dependencies(self):
+        return self.dep_mapper_factory()(self.expr)
+
+    @memoize_method
+    def flop_count(self):
+        from hedge.optemplate import FlopCounter
+        # one comparison for the reduction
+        return FlopCounter()(self.expr) + 1
+
+    def __str__(self):
+        return "%s <- /* %s */ ElementwiseMax(%s)" % (
+                self.names[0], self.comment, self.expr)
+
+    def get_executor_method(self, executor):
+        return executor.exec_elementwise_max_assign
+
+    def compile(self, executor):
+        """Return the compiled reduction for *executor*. Cached by
+        :meth:`hedge.backends.jit.Executor.get_compiled_insn`.
+        """
+        discr = executor.discr
+
+        from hedge.backends.vector_expr import simple_result_dtype_getter
+        from hedge.backends.jit.vector_expr import CompiledElementwiseMax
+        return CompiledElementwiseMax(self.expr,
+                [eg.ranges for eg in discr.element_groups],
+                result_dtype_getter=simple_result_dtype_getter,
+                toolchain=discr.toolchain,
+                module_builder=discr.build_module,
+                per_element_starts=[sl.start
+                    for sl in discr.per_element_slices()],
+                is_per_element=executor.code.is_per_element)
+
+
+
+
+class XYZDiffBatchAssign(Instruction):
+    """Computes global derivatives of *field* directly from its reference
+    derivatives and the per-element inverse metric constants, without
+    storing either the reference derivatives or per-node geometric
+    factors. Only valid for affine elements.
+
+    :ivar names:
+    :ivar op_class: a subclass of
+      :class:`hedge.optemplate.operators.ReferenceDiffOperatorBase`
+      supplying the reference matrices.
+    :ivar xyz_axes: a list of global axes, one for each name in
+      :attr:`names`.
+    :ivar field:
+    """
+
+    comment = "compiled"
+
+    def get_assignees(self):
+        return set(self.names)
+
+    @memoize_method
+    def get_dependencies(self):
+        return self.dep_mapper_factory()(self.field)
+
+    def __str__(self):
+        lines = []
+        lines.append("{ /* %s */" % self.comment)
+        for n, xyz_axis in zip(self.names, self.xyz_axes):
+            lines.append("  %s <- sum_rst InverseMetricDerivative(rst, %d)"
+                    " * %s(rst)(%s)" % (
+                        n, xyz_axis, self.op_class.__name__, self.field))
+        lines.append("}")
+        return "\n".join(lines)
+
+    def get_executor_method(self, executor):
+        return executor.exec_xyz_diff_batch_assign
+
 
 
 
@@ -94,8 +193,11 @@ class CompiledFluxBatchAssign(FluxBatchAssign):
         from pytools import flatten
         return set(flatten(dep_mapper(dep) for dep in deps))
 
-    @memoize_method
-    def get_module(self, discr, dtype):
+    def make_module(self, discr, dtype):
+        """Return a module whose *gather_flux* function computes the fluxes
+        of this batch on the faces of *discr*. Cached by
+        :meth:`hedge.backends.jit.Executor.get_flux_module`.
+        """
         from hedge.backends.jit.flux import \
                 get_interior_flux_mod, \
                 get_boundary_flux_mod
@@ -128,17 +230,136 @@ class CompiledFluxBatchAssign(FluxBatchAssign):
 
         return mod
 
+    def make_fused_module(self, discr, dtype):
+        """Return a module that gathers and lifts the fluxes of this batch
+        in one element-centric pass. See
+        :func:`hedge.backends.jit.flux.get_fused_flux_lift_mod`. Cached by
+        :meth:`hedge.backends.jit.Executor.get_flux_module`.
+        """
+        from hedge.backends.jit.flux import get_fused_flux_lift_mod
+        mod = get_fused_flux_lift_mod(
+                self.expressions, self.flux_var_info,
+                discr, dtype, self.is_boundary)
+
+        if discr.instrumented:
+            from pytools.log import time_and_count_function
+            mod.gather_lift_flux = time_and_count_function(
+                    mod.gather_lift_flux, discr.gather_timer)
+
+        return mod
+
 
 
 
 
+# }}}
+
+# {{{ geometric-factor-fused derivatives --------------------------------------
+def match_xyz_derivative_term(expr):
+    """If *expr* is one term of a global derivative as emitted by
+    :class:`hedge.optemplate.mappers.GlobalToReferenceMapper`, i.e.
+    a nodal inverse metric derivative times a nodal reference derivative
+    along the same reference axis, return a tuple
+    *(op_class, field, xyz_axis, rst_axis)*. Otherwise, return *None*.
+    """
+    from pymbolic.primitives import Product
+    if not isinstance(expr, Product) or len(expr.children) != 2:
+        return None
+
+    from hedge.optemplate import OperatorBinding
+    from hedge.optemplate.primitives import InverseMetricDerivative
+    from hedge.optemplate.operators import (
+            ReferenceDifferentiationOperator,
+            ReferenceStiffnessTOperator)
+
+    metric, bdg = expr.children
+    if isinstance(metric, OperatorBinding):
+        metric, bdg = bdg, metric
+
+    if not (isinstance(metric, InverseMetricDerivative)
+            and metric.quadrature_tag is None
+            and isinstance(bdg, OperatorBinding)
+            and type(bdg.op) in [
+                ReferenceDifferentiationOperator,
+                ReferenceStiffnessTOperator]
+            and bdg.op.rst_axis == metric.rst_axis):
+        return None
+
+    return type(bdg.op), bdg.field, metric.xyz_axis, metric.rst_axis
+
+
+
+
+def split_xyz_derivatives(terms, dimensions):
+    """Find complete global derivatives among the summands *terms*.
+
+    Return a tuple *(derivatives, other_terms)*, where *derivatives* is a
+    list of *((op_class, field, xyz_axis), derivative_terms)* tuples for
+    which *derivative_terms* contains exactly one term for each reference
+    axis (see :func:`match_xyz_derivative_term`), and *other_terms*
+    contains everything else.
+    """
+    keys = []
+    terms_by_key = {}
+    other_terms = []
+
+    for term in terms:
+        match = match_xyz_derivative_term(term)
+        if match is None:
+            other_terms.append(term)
+        else:
+            key, rst_axis = match[:3], match[3]
+            if key not in terms_by_key:
+                keys.append(key)
+            terms_by_key.setdefault(key, []).append((rst_axis, term))
+
+    derivatives = []
+    for key in keys:
+        rst_terms = terms_by_key[key]
+        if sorted(rst_axis for rst_axis, term in rst_terms) \
+                == range(dimensions):
+            derivatives.append((key, [term for rst_axis, term in rst_terms]))
+        else:
+            other_terms.extend(term for rst_axis, term in rst_terms)
+
+    return derivatives, other_terms
+
+
+
+
+class XYZDerivativeCollector(BoundOperatorCollector):
+    """Returns the set of reference derivative bindings that are used
+    outside of a complete global derivative (see
+    :func:`split_xyz_derivatives`), and records the global axes along which
+    each *(op_class, field)* pair is differentiated in :attr:`xyz_diffs`.
+    """
+
+    def __init__(self, dimensions):
+        from hedge.optemplate.operators import ReferenceDiffOperatorBase
+        BoundOperatorCollector.__init__(self, ReferenceDiffOperatorBase)
+
+        self.dimensions = dimensions
+        self.xyz_diffs = {}
+
+    def map_sum(self, expr):
+        derivatives, other_terms = split_xyz_derivatives(
+                expr.children, self.dimensions)
+
+        result = set()
+        for (op_class, field, xyz_axis), terms in derivatives:
+            self.xyz_diffs.setdefault((op_class, field), set()).add(xyz_axis)
+            result |= self.rec(field)
+
+        return result | self.combine(self.rec(term) for term in other_terms)
+
 # }}}
 
 # {{{ subclassed compiler -----------------------------------------------------
 class OperatorCompiler(OperatorCompilerBase):
     def __init__(self, discr):
         OperatorCompilerBase.__init__(self,
-                max_vectors_in_batch_expr=100)
+                max_vectors_in_batch_expr=100,
+                max_flops_in_batch_expr=500)
         self.discr = discr
 
     def get_contained_fluxes(self, expr):
@@ -165,18 +386,115 @@ class OperatorCompiler(OperatorCompilerBase):
             dependencies=get_flux_deps(flux_binding))
             for flux_binding in FluxCollector()(expr)]
 
+    def collect_elementwise_batch_ops(self, expr):
+        from hedge.optemplate.operators import (
+                ElementwiseLinearOperator,
+                ElementReductionOperator,
+                ReferenceQuadratureMassOperator,
+                QuadratureGridUpsampler,
+                QuadratureInteriorFacesGridUpsampler,
+                QuadratureBoundaryGridUpsampler)
+        from hedge.optemplate.mappers import BoundOperatorCollector
+        # Reductions have per-element results and are evaluated by
+        # themselves.
+        return set(bdg for bdg in BoundOperatorCollector((
+            ElementwiseLinearOperator,
+            ReferenceQuadratureMassOperator,
+            QuadratureGridUpsampler,
+            QuadratureInteriorFacesGridUpsampler,
+            QuadratureBoundaryGridUpsampler))(expr)
+            if not isinstance(bdg.op, ElementReductionOperator))
+
+    def collect_diff_ops(self, expr):
+        self.xyz_diff_batches = {}
+        self.xyz_diff_vars = {}
+
+        if "jit_no_xyz_diff" not in self.discr.debug:
+            collector = XYZDerivativeCollector(self.discr.dimensions)
+            stray_keys = set((type(bdg.op), bdg.field)
+                    for bdg in collector(expr))
+
+            # If any of the reference derivatives are needed by themselves,
+            # they will be computed anyway--so compute the global ones from
+            # them, too.
+            self.xyz_diff_batches = dict(
+                    (key, sorted(xyz_axes))
+                    for key, xyz_axes in collector.xyz_diffs.iteritems()
+                    if key not in stray_keys)
+
+        return OperatorCompilerBase.collect_diff_ops(self, expr)
+
     def internal_map_flux(self, flux_bind):
         from hedge.optemplate import IdentityMapper
         return IdentityMapper.map_operator_binding(self, flux_bind)
 
     def map_operator_binding(self, expr, name_hint=None):
         from hedge.optemplate import FluxOperatorBase
+        from hedge.optemplate.operators import ElementwiseMaxOperator
         if isinstance(expr.op, FluxOperatorBase):
             return self.map_planned_flux(expr)
+        elif isinstance(expr.op, ElementwiseMaxOperator):
+            return self.map_elementwise_max(expr, name_hint=name_hint)
         else:
             return OperatorCompilerBase.map_operator_binding(
                     self, expr, name_hint=name_hint)
 
+    def map_elementwise_max(self, expr, name_hint=None):
+        field = self.rec(expr.field)
+
+        from hedge.optemplate import FlopCounter
+        if FlopCounter()(field) == 0:
+            # nothing to fuse with--use the precompiled reduction
+            field_var = self.assign_to_new_var(field)
+            return self.assign_to_new_var(
+                    expr.op(field_var),
+                    prefix=name_hint)
+
+        name = self.get_var_name(name_hint)
+        self.code.append(ElementwiseMaxAssign(
+            names=[name], expr=field,
+            dep_mapper_factory=self.dep_mapper_factory))
+
+        from pymbolic import var
+        return var(name)
+
+    def map_sum(self, expr):
+        derivatives, other_terms = split_xyz_derivatives(
+                expr.children, self.discr.dimensions)
+
+        xyz_diff_vars = []
+        for (op_class, field, xyz_axis), terms in derivatives:
+            if (op_class, field) in self.xyz_diff_batches:
+                xyz_diff_vars.append(
+                        self.map_xyz_diff(op_class, field, xyz_axis))
+            else:
+                other_terms.extend(terms)
+
+        if not xyz_diff_vars:
+            return OperatorCompilerBase.map_sum(self, expr)
+
+        from pymbolic.primitives import flattened_sum
+        return flattened_sum(xyz_diff_vars
+                + [self.rec(term) for term in other_terms])
+
+    def map_xyz_diff(self, op_class, field, xyz_axis):
+        try:
+            return self.xyz_diff_vars[op_class, field, xyz_axis]
+        except KeyError:
+            xyz_axes = self.xyz_diff_batches[op_class, field]
+            names = [self.get_var_name() for axis in xyz_axes]
+
+            self.code.append(XYZDiffBatchAssign(
+                names=names, op_class=op_class, xyz_axes=xyz_axes,
+                field=self.rec(field),
+                dep_mapper_factory=self.dep_mapper_factory))
+
+            from pymbolic import var
+            for n, axis in zip(names, xyz_axes):
+                self.xyz_diff_vars[op_class, field, axis] = var(n)
+
+            return self.xyz_diff_vars[op_class, field, xyz_axis]
+
     # {{{ flux compilation
     def make_flux_batch_assign(self, names, expressions, repr_op):
         from hedge.optemplate.operators import (
@@ -183,7 +183,8 @@ class JitDifferentiator:
         #print mod.generate()
         #raw_input()
 
-        compiled_func = mod.compile(self.discr.toolchain).diff
+        compiled_func = discr.build_module("diff", str(mod.generate()),
+                lambda: mod.compile(discr.toolchain)).diff
 
         if self.discr.instrumented:
             from hedge.tools import time_count_flop
@@ -218,7 +219,8 @@ class JitDifferentiator:
                 uncomplex_dtype = to_uncomplex_dtype(field.dtype)
                 matrices = rep_op.matrices(eg)
                 args = ([rep_op.preimage_ranges(eg), eg.ranges, field]
-                        + [m.astype(uncomplex_dtype) for m in matrices]
+                        + [self.discr.get_cast_matrix(m, uncomplex_dtype)
+                            for m in matrices]
                         + result)
 
                 diff_routine = self.make_diff(eg, field.dtype,
@@ -228,4 +230,212 @@ class JitDifferentiator:
         return [result[op.rst_axis] for op in operators]
     # }}}
 
+
+
+
+class JitXYZDifferentiator:
+    """Computes global (xyz) derivatives on affine elements in one sweep,
+    applying the (per-element constant) inverse metric derivatives to the
+    reference derivatives while they are still in registers. Neither the
+    reference derivatives nor per-node geometric factors are ever stored.
+    """
+
+    def __init__(self, discr):
+        self.discr = discr
+
+    @memoize_method
+    def get_metric(self, elgroup, xyz_axes, dtype):
+        """Return the inverse metric constants of *elgroup* for the axes in
+        *xyz_axes* as a C-contiguous array of shape
+        *(element count, len(xyz_axes), dimensions)*.
+        """
+        metric = self.discr.inverse_metric_constants(elgroup)
+        return numpy.asarray(metric[:, list(xyz_axes), :],
+                dtype=dtype, order="C")
+
+    # {{{ code generation
+    @memoize_method
+    def make_diff(self, elgroup, dtype, xyz_count):
+        from hedge._internal import UniformElementRanges
+        assert isinstance(elgroup.ranges, UniformElementRanges)
+
+        ldis = elgroup.local_discretization
+        discr = self.discr
+        dims = discr.dimensions
+        from cgen import (
+                FunctionDeclaration, FunctionBody, Typedef,
+                Const, Reference, Value, POD,
+                Statement, Include, Line, Block, Initializer, Assign,
+                For, If, Define)
+
+        from pytools import to_uncomplex_dtype
+
+        from codepy.bpl import BoostPythonModule
+        mod = BoostPythonModule()
+
+        # {{{ preamble
+        S = Statement
+        mod.add_to_preamble([
+            Include("hedge/volume_operators.hpp"),
+            Include("boost/foreach.hpp"),
+            ])
+
+        mod.add_to_module([
+            S("namespace ublas = boost::numeric::ublas"),
+            S("using namespace hedge"),
+            S("using namespace pyublas"),
+            Line(),
+            Define("NODE_COUNT", ldis.node_count()),
+            Define("DIMENSIONS", dims),
+            Define("XYZ_COUNT", xyz_count),
+            Line(),
+            Typedef(POD(dtype, "value_type")),
+            Typedef(POD(to_uncomplex_dtype(dtype), "uncomplex_type")),
+            ])
+
+        fdecl = FunctionDeclaration(
+                    Value("void", "diff_xyz"),
+                    [
+                    Const(Reference(Value("uniform_element_ranges", "ers"))),
+                    Value("numpy_array<value_type>", "field"),
+                    Value("numpy_array<uncomplex_type>", "metric"),
+                    ]+[
+                    Value("ublas::matrix<uncomplex_type>", "diffmat_rst%d" % rst)
+                    for rst in range(dims)
+                    ]+[
+                    Value("numpy_array<value_type>", "result%d" % i)
+                    for i in range(xyz_count)
+                    ]
+                    )
+        # }}}
+
+        # {{{ set-up
+        def make_it(name, is_const=True, tpname="value_type"):
+            if is_const:
+                const = "const_"
+            else:
+                const = ""
+
+            return Initializer(
+                Value("numpy_array<%s>::%siterator" % (tpname, const), name+"_it"),
+                "%s.begin()" % name)
+
+        fbody = Block([
+            If("NODE_COUNT != diffmat_rst%d.size1() "
+                "|| NODE_COUNT != diffmat_rst%d.size2()" % (i, i),
+                S('throw(std::runtime_error("unexpected matrix size"))'))
+            for i in range(dims)
+            ]+[
+            If("NODE_COUNT != ers.el_size()",
+                S('throw(std::runtime_error("unsupported element size"))')),
+            If("metric.size() != ers.size()*XYZ_COUNT*DIMENSIONS",
+                S('throw(std::runtime_error("unexpected metric size"))')),
+            Line(),
+            make_it("field"),
+            make_it("metric", tpname="uncomplex_type"),
+            ]+[
+            make_it("result%d" % i, is_const=False)
+            for i in range(xyz_count)
+            ]+[
+            Line(),
+        # }}}
+
+        # {{{ computation
+            For("element_number_t eg_el_nr = 0",
+                "eg_el_nr < ers.size()",
+                "++eg_el_nr",
+                Block([
+                    Initializer(
+                        Value("node_number_t", "el_base"),
+                        "ers.start() + eg_el_nr*NODE_COUNT"),
+                    Initializer(
+                        Value("unsigned", "metric_base"),
+                        "eg_el_nr*XYZ_COUNT*DIMENSIONS"),
+                    ]+[
+                    Initializer(
+                        Const(Value("uncomplex_type", "drdx_%d_%d" % (xyz, rst))),
+                        "metric_it[metric_base+%d]" % (xyz*dims + rst))
+                    for xyz in range(xyz_count)
+                    for rst in range(dims)
+                    ]+[
+                    Line(),
+                    For("unsigned i = 0",
+                        "i < NODE_COUNT",
+                        "++i",
+                        Block([
+                            Initializer(Value("value_type", "drst_%d" % rst), 0)
+                            for rst in range(dims)
+                            ]+[
+                            Line(),
+                            For("unsigned j = 0",
+                                "j < NODE_COUNT",
+                                "++j",
+                                Block([
+                                    S("drst_%(rst)d += "
+                                        "diffmat_rst%(rst)d(i, j)*field_it[el_base+j]"
+                                        % {"rst":rst})
+                                    for rst in range(dims)
+                                    ])
+                                ),
+                            Line(),
+                            ]+[
+                            Assign("result%d_it[el_base+i]" % xyz,
+                                " + ".join(
+                                    "drdx_%d_%d*drst_%d" % (xyz, rst, rst)
+                                    for rst in range(dims)))
+                            for xyz in range(xyz_count)
+                            ])
+                        )
+                    ])
+                )
+            ])
+        # }}}
+
+        # {{{ compilation
+        mod.add_function(FunctionBody(fdecl, fbody))
+
+        compiled_func = discr.build_module("diff_xyz", str(mod.generate()),
+                lambda: mod.compile(discr.toolchain)).diff_xyz
+
+        if self.discr.instrumented:
+            from hedge.tools import time_count_flop
+
+            compiled_func = time_count_flop(compiled_func,
+                    discr.diff_timer, discr.diff_counter,
+                    discr.diff_flop_counter,
+                    flops=len(elgroup.members) * ldis.node_count() * (
+                        2 * dims * ldis.node_count() # mul+add
+                        + 2 * dims * xyz_count),
+                    increment=xyz_count)
+
+        return compiled_func
+        # }}}
+    # }}}
+
+    # {{{ invocation
+    def __call__(self, op_class, xyz_axes, field):
+        """Return the derivatives of *field* along each of the axes in
+        *xyz_axes*, using the reference matrices of the
+        :class:`hedge.optemplate.operators.ReferenceDiffOperatorBase`
+        subclass *op_class*.
+        """
+        result = [self.discr.volume_zeros(dtype=field.dtype)
+                for i in xyz_axes]
+
+        from hedge.tools import is_zero
+        if not is_zero(field):
+            from pytools import to_uncomplex_dtype
+            uncomplex_dtype = to_uncomplex_dtype(field.dtype)
+
+            for eg in self.discr.element_groups:
+                diff_routine = self.make_diff(eg, field.dtype, len(xyz_axes))
+                diff_routine(*([eg.ranges, field,
+                    self.get_metric(eg, tuple(xyz_axes), uncomplex_dtype)]
+                    + [self.discr.get_cast_matrix(m, uncomplex_dtype)
+                        for m in op_class.matrices(eg)]
+                    + result))
+
+        return result
+    # }}}
+
 # vim: foldmethod=marker
@@ -357,7 +357,9 @@ def get_interior_flux_mod(fluxes, fvi, discr, dtype):
     #print mod.generate()
     #raw_input("[Enter]")
 
-    return mod.compile(get_flux_toolchain(discr, fluxes))
+    toolchain = get_flux_toolchain(discr, fluxes)
+    return discr.build_module("flux", str(mod.generate()),
+            lambda: mod.compile(toolchain))
 
 
 
@@ -477,4 +479,259 @@ def get_boundary_flux_mod(fluxes, fvi, discr, dtype):
     #print mod.generate()
     #raw_input("[Enter]")
 
-    return mod.compile(get_flux_toolchain(discr, fluxes))
+    toolchain = get_flux_toolchain(discr, fluxes)
+    return discr.build_module("flux", str(mod.generate()),
+            lambda: mod.compile(toolchain))
+
+
+
+
+# fused gather and lift -------------------------------------------------------
+def make_element_face_slots(fg):
+    """Return an array of shape *(element_count, face_count)* that, for each
+    element of the face group *fg* (in local numbering) and each of its
+    faces, contains *2*face_pair_number* if the element is on the interior
+    side of that face pair, *2*face_pair_number+1* if it is on the
+    exterior side, and -1 if the face is not part of *fg*.
+
+    The result is stored on *fg*, so that it lives exactly as long as the
+    face group.
+    """
+    try:
+        return fg.element_face_slots
+    except AttributeError:
+        pass
+
+    import numpy
+    from hedge._internal import INVALID_ELEMENT
+
+    result = numpy.empty((fg.element_count(), fg.face_count),
+            dtype=numpy.int32)
+    result.fill(-1)
+
+    for fp_nr, fp in enumerate(fg.face_pairs):
+        for side_nr, side in enumerate([fp.int_side, fp.ext_side]):
+            if side.element_id != INVALID_ELEMENT:
+                result[side.local_el_number, side.face_id] = 2*fp_nr + side_nr
+
+    fg.element_face_slots = result
+    return result
+
+
+
+
+def get_fused_flux_lift_mod(fluxes, fvi, discr, dtype, is_boundary):
+    """Generate a module whose *gather_lift_flux* function evaluates the
+    *fluxes* element by element into a small scratch buffer and lifts
+    that buffer into the element's result degrees of freedom right away,
+    without a face-group-wide fluxes-on-faces vector.
+
+    Lift fluxes expect an element-wise scaling vector, all others do not.
+    """
+    from cgen import \
+            FunctionDeclaration, FunctionBody, \
+            Const, Reference, Value, MaybeUnused, Typedef, POD, \
+            Statement, Include, Line, Block, Initializer, Assign, \
+            For, If, Struct
+
+    from codepy.bpl import BoostPythonModule
+    mod = BoostPythonModule()
+
+    from pytools import to_uncomplex_dtype
+
+    S = Statement
+    mod.add_to_preamble([
+        Include("cstdlib"),
+        Include("algorithm"),
+        Include("vector"),
+        Line(),
+        Include("hedge/face_operators.hpp"),
+        ])
+
+    mod.add_to_module([
+        S("using namespace hedge"),
+        S("using namespace pyublas"),
+        Line(),
+        Typedef(POD(dtype, "value_type")),
+        Typedef(POD(to_uncomplex_dtype(dtype), "uncomplex_type")),
+        Line(),
+        ])
+
+    arg_struct = Struct("arg_struct", [
+        Value("numpy_array<value_type>", "flux%d_result" % i)
+        for i in range(len(fluxes))
+        ]+[
+        Value("numpy_array<uncomplex_type>", "flux%d_matrix" % i)
+        for i in range(len(fluxes))
+        ]+[
+        Value("numpy_array<double>", "flux%d_scaling" % i)
+        for i, flux in enumerate(fluxes)
+        if flux.op.is_lift
+        ]+[
+        Value("numpy_array<int>", "el_face_slots")
+        ]+[
+        Value("numpy_array<value_type>", arg_name)
+        for arg_name in fvi.arg_names
+        ]+[
+        Value("value_type" if scalar_par.is_complex else "uncomplex_type",
+            "_scalar_arg_%d" % i)
+        for i, scalar_par in enumerate(fvi.scalar_parameters)
+        ])
+
+    mod.add_struct(arg_struct, "ArgStruct")
+    mod.add_to_module([Line()])
+
+    fdecl = FunctionDeclaration(
+            Value("void", "gather_lift_flux"),
+            [
+                Const(Reference(Value("face_group<face_pair<straight_face> >", "fg"))),
+                Reference(Value("arg_struct", "args"))
+                ])
+
+    from pymbolic.mapper.stringifier import PREC_PRODUCT
+
+    def gen_flux_code(is_flipped, tgt_idx):
+        f2cm = FluxToCodeMapper()
+
+        result = [
+                Assign("fof[%d*el_fof_size + face_nr*fg.face_length() + %s]"
+                    % (flux_idx, tgt_idx),
+                    "uncomplex_type(fp.int_side.face_jacobian) * " +
+                    flux_to_code(f2cm, is_flipped, flux_idx, fvi, flux.op.flux,
+                        PREC_PRODUCT))
+                for flux_idx, flux in enumerate(fluxes)]
+
+        return [
+            Initializer(Value("value_type", cse_name), cse_str)
+            for cse_name, cse_str in f2cm.cse_name_list] + result
+
+    def gen_face_loop(is_flipped):
+        if is_flipped:
+            tgt_idx = "ext_native_write_map[i]"
+            preamble = [
+                Initializer(
+                    Value("index_lists_t::const_iterator", "ext_native_write_map"),
+                    "fg.index_list(fp.ext_native_write_map)")]
+        else:
+            tgt_idx = "i"
+            preamble = []
+
+        return Block(preamble+[
+            For("unsigned i = 0",
+                "i < fg.face_length()",
+                "++i",
+                Block(
+                    [
+                    Initializer(MaybeUnused(Value("node_number_t", "%s_idx" % where)),
+                        "fp.%(where)s.el_base_index + %(where)s_idx_list[i]"
+                        % {"where": where})
+                    for where in ["int_side", "ext_side"]
+                    ]+gen_flux_code(is_flipped, tgt_idx)))
+            ])
+
+    if is_boundary:
+        # boundary face groups are single-sided--elements are
+        # always on the interior side
+        face_code = gen_face_loop(False)
+    else:
+        face_code = If("(slot & 1) == 0",
+                gen_face_loop(False),
+                gen_face_loop(True))
+
+    def gen_lift_code(flux_idx, flux):
+        if flux.op.is_lift:
+            scale = " * value_type(flux%d_scaling_it[fg_el_nr])" % flux_idx
+        else:
+            scale = ""
+
+        return For("unsigned i = 0",
+                "i < dofs_per_el",
+                "++i",
+                Block([
+                    Initializer(Value("value_type", "tmp"), 0),
+                    For("unsigned j = 0",
+                        "j < el_fof_size",
+                        "++j",
+                        S("tmp += flux%(idx)d_matrix_it[i*el_fof_size + j]"
+                            "*fof[%(idx)d*el_fof_size + j]"
+                            % {"idx": flux_idx})),
+                    S("flux%d_result_it[dest_el_base + i] += tmp%s"
+                        % (flux_idx, scale)),
+                    ]))
+
+    fbody = Block([
+        Initializer(
+            Const(Value("numpy_array<value_type>::iterator",
+                "flux%d_result_it" % i)),
+            "args.flux%d_result.begin()" % i)
+        for i in range(len(fluxes))
+        ]+[
+        Initializer(
+            Const(Value("numpy_array<uncomplex_type>::const_iterator",
+                "flux%d_matrix_it" % i)),
+            "args.flux%d_matrix.begin()" % i)
+        for i in range(len(fluxes))
+        ]+[
+        Initializer(
+            Const(Value("numpy_array<double>::const_iterator",
+                "flux%d_scaling_it" % i)),
+            "args.flux%d_scaling.begin()" % i)
+        for i, flux in enumerate(fluxes)
+        if flux.op.is_lift
+        ]+[
+        Initializer(
+            Const(Value("numpy_array<int>::const_iterator", "slots_it")),
+            "args.el_face_slots.begin()"),
+        ]+[
+        Initializer(
+            Const(Value("numpy_array<value_type>::const_iterator", "%s_it" % arg_name)),
+            "args.%s.begin()" % arg_name)
+        for arg_name in fvi.arg_names
+        ]+[
+        Line(),
+        Initializer(Const(Value("unsigned", "el_fof_size")),
+            "fg.face_count*fg.face_length()"),
+        Initializer(Const(Value("unsigned", "dofs_per_el")),
+            "args.flux0_matrix.size() / el_fof_size"),
+        Initializer(Value("std::vector<value_type>", "fof"),
+            "%d*el_fof_size" % len(fluxes)),
+        Line(),
+        For("unsigned fg_el_nr = 0",
+            "fg_el_nr < fg.element_count()",
+            "++fg_el_nr",
+            Block([
+                S("std::fill(fof.begin(), fof.end(), value_type(0))"),
+                Line(),
+                For("unsigned face_nr = 0",
+                    "face_nr < fg.face_count",
+                    "++face_nr",
+                    Block([
+                        Initializer(Const(Value("int", "slot")),
+                            "slots_it[fg_el_nr*fg.face_count + face_nr]"),
+                        If("slot < 0", S("continue")),
+                        Line(),
+                        Initializer(
+                            Const(Reference(Value(
+                                "face_pair<straight_face>", "fp"))),
+                            "fg.face_pairs[slot >> 1]"),
+                        ]+[
+                        Initializer(Value("index_lists_t::const_iterator",
+                            "%s_idx_list" % where),
+                            "fg.index_list(fp.%s.face_index_list_number)" % where)
+                        for where in ["int_side", "ext_side"]
+                        ]+[
+                        face_code
+                        ])),
+                Line(),
+                Initializer(Const(Value("node_number_t", "dest_el_base")),
+                    "fg.local_el_write_base[fg_el_nr]"),
+                ]+[
+                gen_lift_code(flux_idx, flux)
+                for flux_idx, flux in enumerate(fluxes)
+                ]))
+        ])
+    mod.add_function(FunctionBody(fdecl, fbody))
+
+    toolchain = get_flux_toolchain(discr, fluxes)
+    return discr.build_module("flux", str(mod.generate()),
+            lambda: mod.compile(toolchain))
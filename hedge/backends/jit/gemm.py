@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""Element-local operators as BLAS-3 matrix-matrix products."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+import numpy
+from pytools import memoize_method
+
+
+
+
+# {{{ helpers -----------------------------------------------------------------
+def el_array_from_ranges(ranges, vol_array):
+    """Return a 2-dimensional view of *vol_array* restricted to the uniform
+    element ranges *ranges*, of shape *(element_count, nodes_per_element)*.
+
+    In column-major terms, this is the *(nodes_per_element, element_count)*
+    matrix that the element-local operators multiply from the left.
+    """
+    return (vol_array[ranges.start:ranges.start+ranges.total_size]
+            .reshape(len(ranges), -1))
+
+
+
+
+def gemm_elwise(matrix_t, src, dest, block_size=None):
+    """Compute *dest = src . matrix_t* for the element-by-node arrays
+    *src* and *dest*.
+
+    :param block_size: If not *None*, the product is carried out in
+      chunks of *block_size* elements, so that each chunk of *src*
+      and *dest* stays in cache while it is being worked on.
+    """
+    el_count = src.shape[0]
+
+    if block_size is None or block_size >= el_count:
+        numpy.dot(src, matrix_t, out=dest)
+    else:
+        for start in xrange(0, el_count, block_size):
+            stop = min(start+block_size, el_count)
+            numpy.dot(src[start:stop], matrix_t, out=dest[start:stop])
+
+# }}}
+
+# {{{ differentiation ---------------------------------------------------------
+class GemmDifferentiator:
+    """Applies the reference differentiation matrices of each element
+    group as one matrix-matrix product per axis, treating the group's
+    part of a volume vector as a *(nodes_per_element, element_count)*
+    matrix.
+    """
+
+    def __init__(self, discr, block_size=None):
+        self.discr = discr
+        self.block_size = block_size
+
+    @memoize_method
+    def matrices_t(self, rep_op, elgroup, dtype):
+        from pytools import to_uncomplex_dtype
+        uncomplex_dtype = to_uncomplex_dtype(dtype)
+        return [numpy.asarray(m.T, dtype=uncomplex_dtype, order="C")
+                for m in rep_op.matrices(elgroup)]
+
+    @memoize_method
+    def make_diff(self, elgroup, dtype):
+        discr = self.discr
+        block_size = self.block_size
+
+        def diff(src, matrices_t, results):
+            for mat_t, result in zip(matrices_t, results):
+                gemm_elwise(mat_t, src, result, block_size)
+
+        if discr.instrumented:
+            from hedge.tools import time_count_flop
+            ldis = elgroup.local_discretization
+
+            diff = time_count_flop(diff,
+                    discr.diff_timer, discr.diff_counter,
+                    discr.diff_flop_counter,
+                    flops=discr.dimensions*(
+                        2 # mul+add
+                        * ldis.node_count() * len(elgroup.members)
+                        * ldis.node_count()),
+                    increment=discr.dimensions)
+
+        return diff
+
+    def __call__(self, operators, field):
+        # pick a "representative operator"
+        rep_op = operators[0]
+
+        result = [self.discr.volume_zeros(dtype=field.dtype)
+                for i in range(self.discr.dimensions)]
+
+        from hedge.tools import is_zero
+        if not is_zero(field):
+            for eg in self.discr.element_groups:
+                src = el_array_from_ranges(rep_op.preimage_ranges(eg), field)
+                results = [el_array_from_ranges(eg.ranges, r) for r in result]
+
+                self.make_diff(eg, field.dtype)(
+                        src, self.matrices_t(rep_op, eg, field.dtype),
+                        results)
+
+        return [result[op.rst_axis] for op in operators]
+
+# }}}
+
+# {{{ lifting -----------------------------------------------------------------
+class GemmLifter:
+    """Lifts fluxes on faces as one matrix-matrix product per face group,
+    followed by a scatter into the element-local write locations.
+    """
+
+    def __init__(self, discr, block_size=None):
+        self.discr = discr
+        self.block_size = block_size
+
+    @memoize_method
+    def write_indices(self, fgroup, dofs_per_el):
+        return (fgroup.local_el_write_base.astype(numpy.intp)[:, numpy.newaxis]
+                + numpy.arange(dofs_per_el, dtype=numpy.intp))
+
+    def __call__(self, fgroup, matrix, scaling, field, out):
+        el_count = fgroup.element_count()
+        if not el_count:
+            return
+
+        from pytools import to_uncomplex_dtype
+        matrix_t = self.discr.get_cast_matrix(matrix,
+                to_uncomplex_dtype(field.dtype), transpose=True)
+
+        lifted = numpy.empty((el_count, matrix.shape[0]), dtype=field.dtype)
+        gemm_elwise(matrix_t, field.reshape(el_count, -1), lifted,
+                self.block_size)
+
+        if scaling is not None:
+            lifted *= scaling[:, numpy.newaxis]
+
+        out[self.write_indices(fgroup, matrix.shape[0])] += lifted
+
+# }}}
+
+# {{{ element-wise linear operators -------------------------------------------
+class GemmElementwiseLinear:
+    """Applies an :class:`hedge.optemplate.ElementwiseLinearOperator`
+    (e.g. a mass matrix) as one matrix-matrix product per element group.
+    """
+
+    def __init__(self, discr, block_size=None):
+        self.discr = discr
+        self.block_size = block_size
+
+    @memoize_method
+    def matrix_and_coefficients(self, op, elgroup, dtype):
+        from pytools import to_uncomplex_dtype
+        matrix_t = numpy.asarray(op.matrix(elgroup).T,
+                dtype=to_uncomplex_dtype(dtype), order="C")
+        coeffs = op.coefficients(elgroup)
+        if coeffs is not None:
+            coeffs = numpy.asarray(coeffs)[:, numpy.newaxis]
+        return matrix_t, coeffs
+
+    def __call__(self, op, field, out):
+        for eg in self.discr.element_groups:
+            matrix_t, coeffs = self.matrix_and_coefficients(
+                    op, eg, field.dtype)
+
+            src = el_array_from_ranges(eg.ranges, field)
+            dest = el_array_from_ranges(eg.ranges, out)
+
+            gemm_elwise(matrix_t, src, dest, self.block_size)
+
+            if coeffs is not None:
+                dest *= coeffs
+
+# }}}
+
+# {{{ batched element-local operators -----------------------------------------
+def gemm_batched_elwise(parts, fields, out_size, dtype):
+    """Apply element-local matrices to all of *fields* at once, returning a
+    list of result vectors of length *out_size*.
+
+    :param parts: a list of tuples *(from_ranges, to_ranges, matrix,
+      coefficients)*, one per element (or face) group. *matrix* maps the
+      nodes of each element in *from_ranges* of a field to the nodes of the
+      same element in *to_ranges* of the result. *coefficients* is either
+      *None* or an array of per-element factors.
+
+    For each group, the fields' element data are stacked so that the matrix
+    is applied to all of them in a single matrix-matrix product. The
+    results share one allocation.
+    """
+    from pytools import to_uncomplex_dtype
+
+    result = numpy.zeros((len(fields), out_size), dtype=dtype)
+
+    for from_ranges, to_ranges, matrix, coeffs in parts:
+        el_count = len(from_ranges)
+        if not el_count:
+            continue
+
+        src = numpy.empty((len(fields), el_count,
+            from_ranges.total_size // el_count), dtype=dtype)
+        for i, field in enumerate(fields):
+            src[i] = el_array_from_ranges(from_ranges, field)
+
+        dest = numpy.dot(src.reshape(len(fields)*el_count, -1),
+                numpy.asarray(matrix.T, dtype=to_uncomplex_dtype(dtype)))
+        dest = dest.reshape(len(fields), el_count, -1)
+
+        if coeffs is not None:
+            dest *= numpy.asarray(coeffs)[:, numpy.newaxis]
+
+        result[:, to_ranges.start:to_ranges.start+to_ranges.total_size] = \
+                dest.reshape(len(fields), -1)
+
+    return list(result)
+
+# }}}
+
+# vim: foldmethod=marker
@@ -147,14 +147,16 @@ class JitLifter:
         #print FunctionBody(fdecl, fbody)
         #raw_input()
 
-        return mod.compile(self.discr.toolchain).lift
+        return discr.build_module("lift", str(mod.generate()),
+                lambda: mod.compile(discr.toolchain)).lift
 
     def __call__(self, fgroup, matrix, scaling, field, out):
         result = self.discr.volume_zeros(dtype=field.dtype)
 
         from pytools import to_uncomplex_dtype
         uncomplex_dtype = to_uncomplex_dtype(field.dtype)
-        args = [fgroup, matrix.astype(uncomplex_dtype), field, out]
+        args = [fgroup, self.discr.get_cast_matrix(matrix, uncomplex_dtype),
+                field, out]
 
         if scaling is not None:
             args.append(scaling)
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""Persistent database of autotuning decisions for the JIT executor."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+import os
+import numpy
+
+
+
+
+# {{{ tuning keys -------------------------------------------------------------
+def cpu_model():
+    """Return a string identifying the CPU this process runs on."""
+    try:
+        cpuinfo = open("/proc/cpuinfo", "r")
+    except IOError:
+        pass
+    else:
+        try:
+            for line in cpuinfo:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+        finally:
+            cpuinfo.close()
+
+    import platform
+    return platform.processor() or platform.machine()
+
+
+
+
+def element_count_bucket(element_count):
+    """Round *element_count* down to a power of two, so that discretizations
+    of similar size share tuning decisions.
+    """
+    bucket = 1
+    while 2*bucket <= element_count:
+        bucket *= 2
+    return bucket
+
+
+
+
+def make_tuning_key(kind, discr):
+    """Return the key under which the tuning decision for the operation
+    *kind* (e.g. ``"diff"`` or ``"lift"``) on *discr* is stored.
+    """
+    orders = sorted(set(eg.local_discretization.order
+            for eg in discr.element_groups))
+    if len(orders) == 1:
+        order, = orders
+    else:
+        # p-adaptive discretization
+        order = tuple(orders)
+
+    return (kind, order, discr.dimensions,
+            element_count_bucket(len(discr.mesh.elements)),
+            numpy.dtype(discr.default_scalar_type).name,
+            cpu_model())
+
+# }}}
+
+# {{{ database ----------------------------------------------------------------
+def default_database_filename():
+    """Return the value of ``$HEDGE_JIT_TUNING_DB`` or, if that is not set,
+    the file ``jit-tuning.json`` in ``$HEDGE_CACHE_DIR`` (which defaults to
+    ``~/.hedge``).
+    """
+    try:
+        return os.environ["HEDGE_JIT_TUNING_DB"]
+    except KeyError:
+        return os.path.join(
+                os.environ.get("HEDGE_CACHE_DIR",
+                    os.path.join(os.path.expanduser("~"), ".hedge")),
+                "jit-tuning.json")
+
+
+
+
+class TuningDatabase(object):
+    """A mapping from tuning keys (see :func:`make_tuning_key`) to the name of
+    the fastest implementation variant, backed by a JSON file.
+
+    :ivar retune: If *True*, :meth:`pick` ignores stored decisions and
+      benchmarks again.
+    :ivar attempts: the number of timings of each variant, the minimum of
+      which is used to compare variants.
+    """
+
+    def __init__(self, filename=None, persistent=True):
+        if filename is None:
+            filename = default_database_filename()
+
+        self.filename = filename
+        self.persistent = persistent
+        self.retune = False
+        self.attempts = 3
+
+        self.entries = {}
+        self.recorded_keys = set()
+        if persistent:
+            self.load()
+
+    @staticmethod
+    def _key_to_str(key):
+        return "|".join(str(k) for k in key)
+
+    def _read(self):
+        """Return the entries stored in the database file."""
+        try:
+            inf = open(self.filename, "r")
+        except IOError:
+            return {}
+
+        import json
+        try:
+            try:
+                return json.load(inf)
+            except ValueError:
+                from warnings import warn
+                warn("ignoring corrupt JIT tuning database '%s'"
+                        % self.filename)
+                return {}
+        finally:
+            inf.close()
+
+    def load(self):
+        self.entries.update(self._read())
+
+    def save(self):
+        if not self.persistent:
+            return
+
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # another process may have created it in the meantime
+                if not os.path.isdir(dirname):
+                    raise
+
+        # keep the decisions other processes stored since we loaded,
+        # and override only those recorded here
+        entries = self._read()
+        entries.update((key_str, self.entries[key_str])
+                for key_str in self.recorded_keys)
+        self.entries.update(entries)
+
+        # write-then-rename, so that concurrent ranks never see a
+        # partially-written file
+        import json
+        tmp_filename = "%s.%d.tmp" % (self.filename, os.getpid())
+        outf = open(tmp_filename, "w")
+        try:
+            json.dump(self.entries, outf, indent=1, sort_keys=True)
+        finally:
+            outf.close()
+        os.rename(tmp_filename, self.filename)
+
+    def lookup(self, key):
+        try:
+            return self.entries[self._key_to_str(key)]["variant"]
+        except KeyError:
+            return None
+
+    def record(self, key, variant, timings):
+        key_str = self._key_to_str(key)
+        self.entries[key_str] = {
+                "variant": variant,
+                "timings": timings,
+                }
+        self.recorded_keys.add(key_str)
+
+    def pick(self, key, benchmark, choices):
+        """Among the (name, function) pairs in *choices*, return the name
+        of the function that runs *benchmark* the fastest, consulting
+        and updating the database.
+        """
+        choices = dict(choices)
+
+        if not self.retune:
+            name = self.lookup(key)
+            if name in choices:
+                return name
+
+        timings = dict(
+                (name, min(benchmark(f) for i in range(self.attempts)))
+                for name, f in choices.iteritems())
+
+        from pytools import argmin2
+        name = argmin2(timings.iteritems())
+
+        self.record(key, name, timings)
+        try:
+            self.save()
+        except (IOError, OSError), e:
+            from warnings import warn
+            warn("could not write JIT tuning database: %s" % e)
+
+        return name
+
+
+
+
+_database = []
+
+def get_tuning_database():
+    """Return the process-wide :class:`TuningDatabase`."""
+    if not _database:
+        _database.append(TuningDatabase())
+
+    return _database[0]
+
+# }}}
+
+# {{{ offline tuning ----------------------------------------------------------
+def tune(dimensions, order, element_count, dtype, db):
+    """Build a discretization of roughly *element_count* elements and
+    compile and run operators on it, which benchmarks all variants and
+    records the decisions in *db*.
+    """
+    from math import pi
+    r = 0.5
+
+    if dimensions == 2:
+        from hedge.mesh.generator import make_disk_mesh
+        mesh = make_disk_mesh(r=r, max_area=pi*r**2/element_count)
+    elif dimensions == 3:
+        from hedge.mesh.generator import make_ball_mesh
+        mesh = make_ball_mesh(r=r, max_volume=4/3*pi*r**3/element_count)
+    else:
+        raise ValueError("unsupported dimension count: %d" % dimensions)
+
+    from hedge.backends.jit import Discretization
+    discr = Discretization(mesh, order=order, default_scalar_type=dtype)
+
+    from hedge.optemplate import MassOperator, InverseMassOperator, Field, \
+            get_flux_operator
+    ex = discr.compile(MassOperator() * Field("f"))
+    chosen = dict(ex.chosen_variants)
+
+    # the flux gather/lift variant is only picked once fluxes are evaluated
+    from hedge.flux import make_normal, FluxScalarPlaceholder
+    u = FluxScalarPlaceholder(0)
+    flux_ex = discr.compile(InverseMassOperator()(
+        get_flux_operator(u.avg*make_normal(dimensions)[0])(Field("u"))))
+    flux_ex(u=numpy.random.randn(len(discr)).astype(dtype))
+    chosen.update(flux_ex.chosen_variants)
+
+    return chosen
+
+
+
+
+def main():
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="%prog [options]",
+            description="Benchmark the operator implementations of hedge's "
+            "JIT backend and record the fastest ones in the tuning database.")
+    parser.add_option("--dimensions", default="2,3",
+            help="comma-separated list of dimension counts")
+    parser.add_option("--orders", default="1,2,3,4,5,6,7,8",
+            help="comma-separated list of polynomial orders")
+    parser.add_option("--element-counts", default="1000,10000",
+            help="comma-separated list of (approximate) element counts")
+    parser.add_option("--dtypes", default="float64,float32",
+            help="comma-separated list of scalar types")
+    parser.add_option("--attempts", type="int", default=10,
+            help="number of timings to take the minimum of")
+    parser.add_option("--db", metavar="FILENAME",
+            help="tuning database to update (default: %s)"
+            % default_database_filename())
+    parser.add_option("--keep", action="store_true",
+            help="only tune configurations missing from the database")
+    options, args = parser.parse_args()
+
+    db = TuningDatabase(options.db)
+    db.retune = not options.keep
+    db.attempts = options.attempts
+    _database[:] = [db]
+
+    def int_list(s):
+        return [int(x) for x in s.split(",")]
+
+    for dims in int_list(options.dimensions):
+        for order in int_list(options.orders):
+            for el_count in int_list(options.element_counts):
+                for dtype_name in options.dtypes.split(","):
+                    chosen = tune(dims, order, el_count,
+                            numpy.dtype(dtype_name).type, db)
+                    print "%dD order %d ~%d elements %s: %s" % (
+                            dims, order, el_count, dtype_name,
+                            ", ".join("%s=%s" % item
+                                for item in sorted(chosen.iteritems())))
+
+    print "tuning database written to '%s'" % db.filename
+
+
+
+
+if __name__ == "__main__":
+    main()
+
+# }}}
+
+# vim: foldmethod=marker
@@ -37,16 +37,80 @@ from hedge.backends.vector_expr import CompiledVectorExpressionBase
 class CompiledVectorExpression(CompiledVectorExpressionBase):
     elementwise_mod = codepy.elementwise
 
-    def __init__(self, vec_expr_info_list, result_dtype_getter, toolchain=None):
+    def __init__(self, vec_expr_info_list, result_dtype_getter, toolchain=None,
+            module_builder=None, element_ranges=None, per_element_starts=None,
+            is_per_element=None):
+        """
+        :param module_builder: if not *None*, kernels are compiled through
+          a call *module_builder(kind, source, build)*, as in
+          :meth:`hedge.backends.jit.Discretization.build_module`.
+        :param element_ranges: a list of
+          :class:`hedge._internal.UniformElementRanges`, one per element
+          group. Required to broadcast per-element vectors.
+        :param per_element_starts: for each entry of *element_ranges*, the
+          index of the group's first element in a per-element vector.
+        :param is_per_element: a function telling whether a dependency
+          expression evaluates to a per-element vector, such as
+          :meth:`hedge.compiler.Code.is_per_element`. If *None*, no
+          dependency does.
+        """
         CompiledVectorExpressionBase.__init__(self,
                 vec_expr_info_list, result_dtype_getter)
 
         self.toolchain = toolchain
+        self.module_builder = module_builder
+        self.element_ranges = element_ranges
+        self.per_element_starts = per_element_starts
+
+        if is_per_element is None:
+            self.per_element_dep_names = frozenset()
+            self.per_element_result_names = frozenset()
+        else:
+            from pymbolic import var
+            self.per_element_dep_names = frozenset(name
+                    for name, dep in zip(
+                        self.vector_dep_names, self.vector_deps)
+                    if is_per_element(dep))
+            self.per_element_result_names = frozenset(vei.name
+                    for vei in self.result_vec_expr_info_list
+                    if is_per_element(var(vei.name)))
+
+    def get_per_element_names(self):
+        """Return the names of the per-element vector dependencies and
+        results, or *None* if no dependency needs to be broadcast.
+        """
+        if (not self.per_element_dep_names
+                or len(self.per_element_dep_names)
+                == len(self.vector_dep_names)):
+            return None
+
+        return self.per_element_dep_names | self.per_element_result_names
+
+    def run_element_loop(self, kernel, args):
+        for ranges, pe_start in zip(
+                self.element_ranges, self.per_element_starts):
+            kernel(*(args+[ranges.start, ranges.el_size, len(ranges),
+                pe_start]))
 
     def make_kernel_internal(self, args, instructions):
-        return self.elementwise_mod.ElementwiseKernel(
-                args, instructions, name="vector_expression",
-                toolchain=self.toolchain)
+        def build():
+            return self.elementwise_mod.ElementwiseKernel(
+                    args, instructions, name="vector_expression",
+                    toolchain=self.toolchain)
+
+        if self.module_builder is None:
+            return build()
+        else:
+            source = "\n".join(
+                    ["%s %s %s" % (type(arg).__name__, arg.dtype, arg.name)
+                        for arg in args]
+                    + [instructions])
+            return self.module_builder("vector_expr", source, build)
+
+    def make_broadcasting_kernel_internal(self, args, instructions):
+        return _make_element_loop_kernel("vector_expr_bcast",
+                args, instructions, [], self.elementwise_mod,
+                self.toolchain, self.module_builder)
 
     def __call__(self, evaluate_subexpr, stats_callback=None):
         vectors = [evaluate_subexpr(vec_expr) 
@@ -54,32 +118,240 @@ class CompiledVectorExpression(CompiledVectorExpressionBase):
         scalars = [evaluate_subexpr(scal_expr) 
                 for scal_expr in self.scalar_deps]
 
+        per_element_names = self.get_per_element_names()
+
         from pytools import single_valued
-        shape = single_valued(vec.shape for vec in vectors)
+        if per_element_names:
+            shape = single_valued(vec.shape for name, vec in
+                    zip(self.vector_dep_names, vectors)
+                    if name not in per_element_names)
+            per_element_shape = single_valued(vec.shape for name, vec in
+                    zip(self.vector_dep_names, vectors)
+                    if name in per_element_names)
 
-        kernel_rec = self.get_kernel(
-                tuple(v.dtype for v in vectors),
-                tuple(s.dtype for s in scalars))
+            kernel_rec = self.get_kernel(
+                    tuple(v.dtype for v in vectors),
+                    tuple(s.dtype for s in scalars),
+                    per_element_names)
+        else:
+            shape = per_element_shape = single_valued(
+                    vec.shape for vec in vectors)
 
-        results = [numpy.empty(shape, kernel_rec.result_dtype)
+            kernel_rec = self.get_kernel(
+                    tuple(v.dtype for v in vectors),
+                    tuple(s.dtype for s in scalars))
+
+        def get_result_shape(vei):
+            # per-element results are written once for each node of their
+            # element
+            if vei.name in self.per_element_result_names:
+                return per_element_shape
+            else:
+                return shape
+
+        results = [numpy.empty(get_result_shape(vei), kernel_rec.result_dtype)
                 for vei in self.result_vec_expr_info_list]
 
         size = results[0].size
         args = (results+vectors+scalars)
 
+        def run():
+            if per_element_names:
+                self.run_element_loop(kernel_rec.kernel, args)
+            else:
+                kernel_rec.kernel(*args)
+
         if stats_callback is not None:
             timer = stats_callback(size, self)
             sub_timer = timer.start_sub_timer()
-            kernel_rec.kernel(*args)
+            run()
             sub_timer.stop().submit()
         else:
-            kernel_rec.kernel(*args)
+            run()
 
         return results
 
 
 
 
+class CompiledElementwiseMax(CompiledVectorExpression):
+    """Evaluates a vector expression and replaces its values by their
+    maximum over each element, in a single pass over memory.
+
+    Each element's values are written to the output, reduced and then
+    overwritten while they are still in cache, so the value of the
+    expression is never stored as a separate vector.
+    """
+
+    def __init__(self, expr, element_ranges, result_dtype_getter,
+            toolchain=None, module_builder=None, per_element_starts=None,
+            is_per_element=None):
+        """
+        :param element_ranges: a list of
+          :class:`hedge._internal.UniformElementRanges`, one per element
+          group.
+        :param per_element_starts: as for :class:`CompiledVectorExpression`.
+        :param is_per_element: as for :class:`CompiledVectorExpression`.
+        """
+        from hedge.backends.vector_expr import VectorExpressionInfo
+        if per_element_starts is None:
+            per_element_starts = [0]*len(element_ranges)
+
+        CompiledVectorExpression.__init__(self,
+                [VectorExpressionInfo(name="result", expr=expr,
+                    do_not_return=False)],
+                result_dtype_getter, toolchain, module_builder,
+                element_ranges, per_element_starts, is_per_element)
+
+    def make_kernel_internal(self, args, instructions):
+        from cgen import Line, Initializer, Value, Assign, If
+
+        result_arg = args[0]
+        assert result_arg.name == "result"
+
+        def node_loop(body):
+            from cgen import For
+            return For("unsigned i = el_base", "i < el_base+el_size", "++i",
+                    body)
+
+        epilogue = [
+                Initializer(Value("value_type", "el_max"),
+                    "result[el_base]"),
+                node_loop(If("result[i] > el_max",
+                    Assign("el_max", "result[i]"))),
+                node_loop(Assign("result[i]", "el_max")),
+                ]
+
+        return _make_element_loop_kernel("elwise_max",
+                args, instructions, epilogue, self.elementwise_mod,
+                self.toolchain, self.module_builder)
+
+    make_broadcasting_kernel_internal = make_kernel_internal
+
+    def __call__(self, evaluate_subexpr, stats_callback=None):
+        vectors = [evaluate_subexpr(vec_expr)
+                for vec_expr in self.vector_deps]
+        scalars = [evaluate_subexpr(scal_expr)
+                for scal_expr in self.scalar_deps]
+
+        # The kernel always loops over nodes, so per-element vectors are
+        # read through their element number even if no volume vector is
+        # present.
+        per_element_names = self.per_element_dep_names
+
+        kernel_rec = self.get_kernel(
+                tuple(v.dtype for v in vectors),
+                tuple(s.dtype for s in scalars),
+                per_element_names)
+
+        from pytools import single_valued
+        volume_shapes = [vec.shape for name, vec in
+                zip(self.vector_dep_names, vectors)
+                if name not in per_element_names]
+        if volume_shapes:
+            shape = single_valued(volume_shapes)
+        else:
+            shape = (sum(len(ranges)*ranges.el_size
+                for ranges in self.element_ranges),)
+
+        result = numpy.empty(shape, kernel_rec.result_dtype)
+
+        def run():
+            self.run_element_loop(kernel_rec.kernel, [result]+vectors+scalars)
+
+        if stats_callback is not None:
+            timer = stats_callback(result.size, self)
+            sub_timer = timer.start_sub_timer()
+            run()
+            sub_timer.stop().submit()
+        else:
+            run()
+
+        return result
+
+
+
+
+def _make_element_loop_kernel(name, args, instructions, epilogue,
+        elementwise_mod, toolchain, module_builder):
+    """Build a kernel that evaluates *instructions* for each node *i* of the
+    elements of one element group, followed by the statements in *epilogue*
+    once per element.
+
+    The kernel takes the arguments *args*, followed by the group's first node
+    index, its element size, its element count and the index of its first
+    element in per-element vectors. The number of the current element is
+    available as *el_nr*.
+    """
+    from cgen import (
+            FunctionDeclaration, FunctionBody, Value, POD,
+            Include, Line, Block, Initializer, For,
+            Statement, Typedef, dtype_to_ctype)
+
+    from codepy.bpl import BoostPythonModule
+    mod = BoostPythonModule()
+
+    mod.add_to_preamble([
+        Include("pyublas/numpy.hpp"),
+        Include("cmath"),
+        ])
+
+    mod.add_to_module([
+        Statement("using namespace pyublas"),
+        Line(),
+        Typedef(POD(args[0].dtype, "value_type")),
+        ])
+
+    def make_it(arg):
+        return Initializer(
+                Value("numpy_array<%s>::iterator"
+                    % dtype_to_ctype(arg.dtype), arg.name),
+                "%s_ary.begin()" % arg.name)
+
+    vector_args = [arg for arg in args
+            if isinstance(arg, elementwise_mod.VectorArg)]
+    scalar_args = [arg for arg in args
+            if not isinstance(arg, elementwise_mod.VectorArg)]
+
+    fdecl = FunctionDeclaration(
+            Value("void", name),
+            [Value("numpy_array<%s>" % dtype_to_ctype(arg.dtype),
+                arg.name+"_ary")
+                for arg in vector_args]
+            + [POD(arg.dtype, arg.name) for arg in scalar_args]
+            + [POD(numpy.uint32, "start"),
+                POD(numpy.uint32, "el_size"),
+                POD(numpy.uint32, "el_count"),
+                POD(numpy.uint32, "pe_start")])
+
+    fbody = Block(
+            [make_it(arg) for arg in vector_args]
+            + [Line(),
+                For("unsigned el = 0", "el < el_count", "++el",
+                    Block([
+                        Initializer(POD(numpy.uint32, "el_base"),
+                            "start + el*el_size"),
+                        Initializer(POD(numpy.uint32, "el_nr"),
+                            "pe_start + el"),
+                        Line(),
+                        For("unsigned i = el_base", "i < el_base+el_size",
+                            "++i", Block([Line(instructions)])),
+                        Line(),
+                        ]+epilogue))])
+
+    mod.add_function(FunctionBody(fdecl, fbody))
+
+    def build():
+        return getattr(mod.compile(toolchain), name)
+
+    if module_builder is None:
+        return build()
+    else:
+        return module_builder(name, str(mod.generate()), build)
+
+
+
+
 if __name__ == "__main__":
     test_dtype = numpy.float32
 
@@ -367,6 +367,8 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
                 self.subdiscr.exec_mapper_class)
         self.subdiscr.parallel_discr = self
 
+        self.rank_data = rank_data
+
         self.received_bdrys = {}
         self.context = rcon
 
@@ -388,7 +390,9 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
         self.mpi_scalar_type = {
                 numpy.float64: mpi.DOUBLE,
                 numpy.float32: mpi.FLOAT,
-                }[self.default_scalar_type]
+                numpy.complex128: mpi.DOUBLE_COMPLEX,
+                numpy.complex64: mpi.COMPLEX,
+                }[numpy.dtype(self.default_scalar_type).type]
 
     def add_instrumentation(self, mgr):
         self.subdiscr.add_instrumentation(mgr)
@@ -399,6 +403,23 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
 
         mgr.add_quantity(self.comm_flux_counter)
 
+    def copy_with_order(self, order):
+        """Return a discretization of this rank's part of the mesh that is
+        like this one, except that its local discretizations are of order
+        *order*.
+
+        Since this sets up neighbor connections, it must be called on
+        all ranks.
+        """
+        return self.context.make_discretization(self.rank_data, order=order,
+                quad_min_degrees=self.quad_min_degrees,
+                debug=self.debug | self.subdiscr.debug,
+                default_scalar_type=self.default_scalar_type)
+
+    def copy_with_mesh(self, mesh, reuse_code=False):
+        raise NotImplementedError(
+                "adapting distributed meshes is not supported")
+
     # property forwards -------------------------------------------------------
     def __len__(self):
         return len(self.subdiscr)
@@ -603,9 +624,16 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
     # norm and integral -------------------------------------------------------
     def nodewise_dot_product(self, a, b):
         return self.context.communicator.allreduce(
-                self.subdiscr.nodewise_inner_product(a, b))
+                self.subdiscr.nodewise_dot_product(a, b))
 
     def norm(self, volume_vector, p=2):
+        if p == numpy.Inf:
+            return self.context.communicator.allreduce(
+                    self.subdiscr.norm(volume_vector, p),
+                    op=mpi.MAX)
+        elif p == 2:
+            return self.inner_product(volume_vector, volume_vector)**(1/2)
+
         def add_norms(x, y):
             return (x**p + y**p)**(1/p)
 
@@ -613,16 +641,24 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
                 self.subdiscr.norm(volume_vector, p),
                 op=add_norms)
 
+    def inner_product(self, a, b):
+        return self.context.communicator.allreduce(
+                self.subdiscr.inner_product(a, b))
+
     def integral(self, volume_vector):
         return self.context.communicator.allreduce(
                 self.subdiscr.integral(volume_vector))
 
     # dt estimation -----------------------------------------------------------
+    # These only depend on the mesh, so cache them rather than performing
+    # a global reduction on each timestep estimate.
+    @pytools.memoize_method
     def dt_non_geometric_factor(self):
         return self.context.communicator.allreduce(
                 self.subdiscr.dt_non_geometric_factor(),
                 op=mpi.MIN)
 
+    @pytools.memoize_method
     def dt_geometric_factor(self):
         return self.context.communicator.allreduce(
                 self.subdiscr.dt_geometric_factor(),
@@ -30,6 +30,7 @@ THE SOFTWARE.
 
 import numpy
 import pymbolic.mapper.substitutor
+import pymbolic.mapper.c_code
 import hedge.optemplate
 from pytools import memoize_method, Record
 
@@ -82,6 +83,42 @@ class ConstantGatherMapper(
 
 
 
+class VectorExprCCodeMapper(pymbolic.mapper.c_code.CCodeMapper):
+    # Pointwise selects become conditional expressions, so that they fuse
+    # with the surrounding arithmetic instead of being evaluated branch by
+    # branch on whole vectors.
+
+    def map_if_positive(self, expr, enclosing_prec):
+        from pymbolic.mapper.stringifier import PREC_NONE
+        return "((%s) > 0 ? (%s) : (%s))" % (
+                self.rec(expr.criterion, PREC_NONE),
+                self.rec(expr.then, PREC_NONE),
+                self.rec(expr.else_, PREC_NONE))
+
+
+
+
+class PerElementIndexMapper(hedge.optemplate.IdentityMapper):
+    """Replaces the node index *i* in subscripts of the vectors named in
+    *names* by the element number *el_nr*, so that per-element vectors
+    are broadcast across the nodes of each element.
+    """
+
+    def __init__(self, names):
+        self.names = names
+
+    def map_subscript(self, expr):
+        from pymbolic.primitives import Variable
+        if (isinstance(expr.aggregate, Variable)
+                and expr.aggregate.name in self.names):
+            from pymbolic import var
+            return expr.aggregate[var("el_nr")]
+        else:
+            return hedge.optemplate.IdentityMapper.map_subscript(self, expr)
+
+
+
+
 class KernelRecord(Record):
     pass
 
@@ -190,9 +227,14 @@ class CompiledVectorExpressionBase(object):
         return [rvei.name for rvei in self.result_vec_expr_info_list]
 
     @memoize_method
-    def get_kernel(self, vector_dtypes, scalar_dtypes):
+    def get_kernel(self, vector_dtypes, scalar_dtypes,
+            per_element_names=frozenset()):
+        """
+        :param per_element_names: names of the vector dependencies and
+          results that are per-element vectors. If non-empty, the kernel is
+          built by :meth:`make_broadcasting_kernel_internal`.
+        """
         from pymbolic.mapper.stringifier import PREC_NONE
-        from pymbolic.mapper.c_code import CCodeMapper
 
         elwise = self.elementwise_mod
 
@@ -218,16 +260,26 @@ class CompiledVectorExpressionBase(object):
             else:
                 return r
 
-        code_mapper = CCodeMapper(constant_mapper=real_const_mapper)
+        code_mapper = VectorExprCCodeMapper(constant_mapper=real_const_mapper)
+
+        vec_expr_info_list = self.vec_expr_info_list
+        if per_element_names:
+            pe_index_mapper = PerElementIndexMapper(per_element_names)
+            vec_expr_info_list = [
+                    vei.copy(expr=pe_index_mapper(vei.expr))
+                    for vei in vec_expr_info_list]
 
         code_lines = []
-        for vei in self.vec_expr_info_list:
+        for vei in vec_expr_info_list:
             expr_code = code_mapper(vei.expr, PREC_NONE)
             if vei.do_not_return:
                 from cgen import dtype_to_ctype
                 code_lines.append(
                         "%s %s = %s;" % (
                             dtype_to_ctype(result_dtype), vei.name, expr_code))
+            elif vei.name in per_element_names:
+                code_lines.append(
+                        "%s[el_nr] = %s;" % (vei.name, expr_code))
             else:
                 code_lines.append(
                         "%s[i] = %s;" % (vei.name, expr_code))
@@ -242,6 +294,19 @@ class CompiledVectorExpressionBase(object):
                 elwise.ScalarArg(dtype, name)
                 for dtype, name in zip(scalar_dtypes, self.scalar_dep_names))
 
+        if per_element_names:
+            make_kernel = self.make_broadcasting_kernel_internal
+        else:
+            make_kernel = self.make_kernel_internal
+
         return KernelRecord(
-                kernel=self.make_kernel_internal(args, "\n".join(code_lines)),
+                kernel=make_kernel(args, "\n".join(code_lines)),
                 result_dtype=result_dtype)
+
+    def make_broadcasting_kernel_internal(self, args, instructions):
+        """Like :meth:`make_kernel_internal`, but return a kernel that
+        loops over the nodes of each element of one element group, with the
+        current element's number available as *el_nr*.
+        """
+        raise NotImplementedError("per-element vectors are not supported "
+                "by %s" % type(self).__name__)
@@ -30,7 +30,8 @@ THE SOFTWARE.
 import numpy
 import numpy.linalg as la
 from hedge.optemplate.operators import (
-        ElementwiseLinearOperator, StatelessOperator)
+        ElementwiseLinearOperator, ElementReductionOperator,
+        StatelessOperator)
 from pytools import Record, memoize_method
 
 
@@ -121,7 +122,7 @@ class PerssonPeraireDiscontinuitySensor(object):
 
 # {{{ exponential fit ---------------------------------------------------------
 # {{{ operators for basic fit
-class DecayEstimateOperatorBase(ElementwiseLinearOperator):
+class DecayEstimateOperatorBase(ElementReductionOperator):
     def __init__(self, ignored_modes, weight_mode):
         self.ignored_modes = ignored_modes
         self.weight_mode = weight_mode
@@ -202,24 +203,12 @@ class DecayEstimateOperatorBase(ElementwiseLinearOperator):
 
 
 class DecayExponentOperator(DecayEstimateOperatorBase):
-    def matrix(self, eg):
-        ldis = eg.local_discretization
-        plsm = self.decay_fit_mat(ldis)
-        a = numpy.zeros((ldis.node_count(), ldis.node_count()))
-        for i in range(ldis.node_count()):
-            a[i] = plsm[1]
-
-        return a
+    def row(self, eg):
+        return self.decay_fit_mat(eg.local_discretization)[1]
 
 class LogDecayConstantOperator(DecayEstimateOperatorBase):
-    def matrix(self, eg):
-        ldis = eg.local_discretization
-        plsm = self.decay_fit_mat(ldis)
-        a = numpy.zeros((ldis.node_count(), ldis.node_count()))
-        for i in range(ldis.node_count()):
-            a[i] = plsm[0]
-
-        return a
+    def row(self, eg):
+        return self.decay_fit_mat(eg.local_discretization)[0]
 
 # }}}
 
@@ -935,30 +924,73 @@ class AveragingModeProcessor(ElementwiseCodeExecutor):
 # }}}
 
 # {{{ make h, h/n vector
-def make_h_vector(discr):
-    result = discr.volume_zeros(kind="numpy")
+def make_h_vector(discr, per_element=False):
+    """Return a vector of element sizes. If *per_element* is set, return
+    a per-element vector (see
+    :meth:`hedge.discretization.Discretization.per_element_empty`)
+    instead of a volume vector.
+    """
+    result = discr.per_element_zeros()
 
-    for eg in discr.element_groups:
-        for el, rng in zip(eg.members, eg.ranges):
+    for eg, el_slice in zip(discr.element_groups, discr.per_element_slices()):
+        for i, el in enumerate(eg.members):
             bbox_min, bbox_max = el.bounding_box(discr.mesh.points)
-            h = numpy.max(bbox_max-bbox_min)
-            result[rng] = h
+            result[el_slice.start+i] = numpy.max(bbox_max-bbox_min)
 
-    return discr.convert_volume(result, kind=discr.compute_kind)
+    if per_element:
+        return result
 
+    return discr.convert_volume(discr.broadcast_per_element(result),
+            kind=discr.compute_kind)
 
 
 
-def make_h_over_n_vector(discr):
-    result = discr.volume_zeros(kind="numpy")
 
+def make_h_over_n_vector(discr, per_element=False):
+    """Like :func:`make_h_vector`, but divide each element size by the
+    order of the element's local discretization.
+    """
+    result = make_h_vector(discr, per_element=True)
+
+    for eg, el_slice in zip(discr.element_groups, discr.per_element_slices()):
+        result[el_slice] /= eg.local_discretization.order
+
+    if per_element:
+        return result
+
+    return discr.convert_volume(discr.broadcast_per_element(result),
+            kind=discr.compute_kind)
+
+# }}}
+
+# {{{ order assignment for p-adaptivity
+def make_decay_order_assignment(discr, u, low_order, high_order,
+        decay_threshold=-3, ignored_modes=1, weight_mode=None):
+    """Return an array of polynomial orders, one for each element of
+    ``discr.mesh``, that may be passed as the *order* argument of
+    :class:`hedge.discretization.Discretization` to obtain a p-adaptive
+    discretization.
+
+    Elements on which the modal coefficients of *u* decay more slowly than
+    :math:`n^s` with :math:`s` = *decay_threshold* are assigned
+    *high_order*, all others *low_order*.
+    """
+    sensor = DecayFitDiscontinuitySensorBase(
+            mode_processor=None, weight_mode=weight_mode,
+            ignored_modes=ignored_modes)
+    decay_expt = discr.convert_volume(
+            sensor.bind_quantity(discr, "decay_expt")(u),
+            kind="numpy")
+
+    result = numpy.empty(len(discr.mesh.elements), dtype=numpy.int32)
     for eg in discr.element_groups:
-        for el, rng in zip(eg.members, eg.ranges):
-            bbox_min, bbox_max = el.bounding_box(discr.mesh.points)
-            h = numpy.max(bbox_max-bbox_min)
-            result[rng] = h/(eg.local_discretization.order)
+        for el, el_range in zip(eg.members, eg.ranges):
+            if decay_expt[el_range.start] > decay_threshold:
+                result[el.id] = high_order
+            else:
+                result[el.id] = low_order
 
-    return discr.convert_volume(result, kind=discr.compute_kind)
+    return result
 
 # }}}
 
@@ -209,6 +209,44 @@ class QuadratureDiffBatchAssign(DiffBatchAssign):
     def get_executor_method(self, executor):
         return executor.exec_quad_diff_batch_assign
 
+class ElementwiseBatchAssign(Instruction):
+    """Applies the same element-local operator (e.g. a mass matrix or a
+    quadrature upsampler) to several fields.
+
+    :ivar names:
+    :ivar op:
+    :ivar fields:
+    """
+
+    def get_assignees(self):
+        return set(self.names)
+
+    @memoize_method
+    def get_dependencies(self):
+        dep_mapper = self.dep_mapper_factory()
+
+        deps = set()
+        for field in self.fields:
+            deps |= dep_mapper(field)
+        return deps
+
+    def __str__(self):
+        lines = []
+
+        if len(self.names) > 1:
+            lines.append("{")
+            for n, f in zip(self.names, self.fields):
+                lines.append("  %s <- %s(%s)" % (n, self.op, f))
+            lines.append("}")
+        else:
+            for n, f in zip(self.names, self.fields):
+                lines.append("%s <- %s(%s)" % (n, self.op, f))
+
+        return "\n".join(lines)
+
+    def get_executor_method(self, executor):
+        return executor.exec_elementwise_batch_assign
+
 class FluxExchangeBatchAssign(Instruction):
     __slots__ = [
             "names", "indices_and_ranks",
@@ -261,7 +299,11 @@ class FluxExchangeBatchAssign(Instruction):
 
 # {{{ graphviz/dot dataflow graph drawing -------------------------------------
 def dot_dataflow_graph(code, max_node_label_length=30, 
-        label_wrap_width=50):
+        label_wrap_width=50, profile=None):
+    """
+    :param profile: if not *None*, an :class:`InstructionProfile` whose
+      timings are added to the node labels.
+    """
     origins = {}
     node_names = {}
 
@@ -284,6 +326,9 @@ def dot_dataflow_graph(code, max_node_label_length=30,
 
         node_label = node_label.replace("\n", "\\l") + "\\l"
 
+        if profile is not None and insn in profile.stats:
+            node_label += profile.stats[insn].summary() + "\\l"
+
         result.append("%s [ label=\"p%d: %s\" shape=box ];" % (
             node_name, insn.priority, node_label))
 
@@ -320,18 +365,131 @@ def dot_dataflow_graph(code, max_node_label_length=30,
 # }}}
 
 # {{{ code representation -----------------------------------------------------
+class PerElementChecker(object):
+    """Tells which expressions in compiled code evaluate to per-element
+    vectors (see :class:`hedge.optemplate.mappers.type_inference.type_info.PerElementVector`).
+
+    The types of the expressions of the operator template are taken from
+    *typedict*, the result of type inference. The variables assigned by the
+    compiler are registered through :meth:`add_variable`. The kinds of all
+    other expressions follow from those of their children, by the same
+    rules as in type inference.
+    """
+
+    def __init__(self, typedict):
+        from hedge.optemplate.mappers.type_inference import type_info
+
+        self.kinds = {}
+        for expr, tp in typedict.iteritems():
+            if isinstance(tp, type_info.PerElementVector):
+                self.kinds[expr] = "per_element"
+            elif isinstance(tp, type_info.Scalar):
+                self.kinds[expr] = "scalar"
+
+    def add_variable(self, name, expr):
+        """Record that the variable *name* is assigned the value of *expr*."""
+        from pymbolic.primitives import Variable
+        self.kinds[Variable(name)] = self.get_kind(expr)
+
+    def combine(self, children):
+        kinds = set(self.get_kind(child) for child in children)
+        if "other" in kinds:
+            return "other"
+        elif "per_element" in kinds:
+            return "per_element"
+        else:
+            return "scalar"
+
+    def get_kind(self, expr):
+        """Return *"per_element"*, *"scalar"* or *"other"*, depending on
+        what *expr* evaluates to.
+        """
+        try:
+            return self.kinds[expr]
+        except KeyError:
+            pass
+
+        import pymbolic.primitives as p
+        from hedge.optemplate.primitives import OperatorBinding
+        from hedge.optemplate.operators import (
+                ElementReductionOperator, ElementwiseMaxOperator)
+
+        if not isinstance(expr, p.Expression):
+            kind = "scalar"
+        elif isinstance(expr, (p.Sum, p.Product)):
+            kind = self.combine(expr.children)
+        elif isinstance(expr, p.Quotient):
+            kind = self.combine([expr.numerator, expr.denominator])
+        elif isinstance(expr, p.Power):
+            kind = self.combine([expr.base, expr.exponent])
+        elif isinstance(expr, p.IfPositive):
+            kind = self.combine([expr.criterion, expr.then, expr.else_])
+        elif isinstance(expr, p.Call):
+            kind = self.combine(expr.parameters)
+        elif isinstance(expr, OperatorBinding):
+            if isinstance(expr.op, ElementReductionOperator):
+                kind = "per_element"
+            elif isinstance(expr.op, ElementwiseMaxOperator):
+                kind = self.get_kind(expr.field)
+            else:
+                kind = "other"
+        else:
+            return "other"
+
+        self.kinds[expr] = kind
+        return kind
+
+    def __call__(self, expr):
+        return self.get_kind(expr) == "per_element"
+
+
+
+
 class Code(object):
-    def __init__(self, instructions, result):
+    def __init__(self, instructions, result, per_element_checker=None):
+        """
+        :param per_element_checker: a :class:`PerElementChecker` for the
+          expressions in *instructions* and *result*, or *None* if none of
+          them evaluate to per-element vectors.
+        """
         self.instructions = instructions
         self.result = result
+        self.per_element_checker = per_element_checker
         self.last_schedule = None
         self.static_schedule_attempts = 5
+        self.profile = None
+
+    def copy(self):
+        """Return a :class:`Code` with the same instructions and result,
+        but without this one's schedule and profile.
+        """
+        return Code(self.instructions, self.result, self.per_element_checker)
+
+    def is_per_element(self, expr):
+        """Return whether *expr*, an expression occurring in this code,
+        evaluates to a per-element vector.
+        """
+        return (self.per_element_checker is not None
+                and self.per_element_checker(expr))
 
     def dump_dataflow_graph(self):
         from hedge.tools import open_unique_debug_file
 
         open_unique_debug_file("dataflow", ".dot")\
-                .write(dot_dataflow_graph(self, max_node_label_length=None))
+                .write(dot_dataflow_graph(self, max_node_label_length=None,
+                    profile=self.profile))
+
+    def enable_profiling(self):
+        """Record the cost of each instruction in subsequent executions, and
+        return the :class:`InstructionProfile` that the results go into.
+        It is also available as :attr:`profile`.
+        """
+        if self.profile is None:
+            self.profile = InstructionProfile()
+        return self.profile
+
+    def disable_profiling(self):
+        self.profile = None
 
     def __str__(self):
         lines = []
@@ -392,6 +550,7 @@ class Code(object):
         schedule = []
 
         context = exec_mapper.context
+        profile = self.profile
 
         next_future_id = 0
         futures = []
@@ -413,7 +572,11 @@ class Code(object):
 
                     insn = self.EvaluateFuture(future.id)
 
-                    assignments, new_futures = future()
+                    if profile is None:
+                        assignments, new_futures = future()
+                    else:
+                        assignments, new_futures = profile.evaluate_future(
+                                future, waited=force_future)
                     force_future = False
                     break
                 else:
@@ -440,8 +603,12 @@ class Code(object):
                         del context[name]
 
                     done_insns.add(insn)
-                    assignments, new_futures = \
-                            insn.get_executor_method(exec_mapper)(insn)
+                    if profile is None:
+                        assignments, new_futures = \
+                                insn.get_executor_method(exec_mapper)(insn)
+                    else:
+                        assignments, new_futures = \
+                                profile.execute(insn, exec_mapper)
 
             if insn is not None:
                 for target, value in assignments:
@@ -489,6 +656,7 @@ class Code(object):
             return self.execute_dynamic(exec_mapper, pre_assign_check)
 
         context = exec_mapper.context
+        profile = self.profile
         id_to_future = {}
         next_future_id = 0
 
@@ -500,13 +668,22 @@ class Code(object):
 
             if isinstance(insn, self.EvaluateFuture):
                 future = id_to_future.pop(insn.future_id)
-                if not future.is_ready():
+                future_ready = future.is_ready()
+                if not future_ready:
                     schedule_is_delay_free = False
-                assignments, new_futures = future()
+                if profile is None:
+                    assignments, new_futures = future()
+                else:
+                    assignments, new_futures = profile.evaluate_future(
+                            future, waited=not future_ready)
                 del future
             else:
-                assignments, new_futures = \
-                        insn.get_executor_method(exec_mapper)(insn)
+                if profile is None:
+                    assignments, new_futures = \
+                            insn.get_executor_method(exec_mapper)(insn)
+                else:
+                    assignments, new_futures = \
+                            profile.execute(insn, exec_mapper)
 
             for target, value in assignments:
                 if pre_assign_check is not None:
@@ -534,6 +711,272 @@ class Code(object):
 
 
 
+# }}}
+
+# {{{ compile profile ---------------------------------------------------------
+class ModuleBuild(Record):
+    """
+    :ivar kind: what the module computes, e.g. ``"flux"`` or ``"vector_expr"``.
+    :ivar seconds: wall time spent generating and compiling the module.
+    :ivar cache_hit: whether a module from the same source had been built
+      before in this process, so that the compiler's cache could serve it.
+    :ivar profile: the :class:`CompileProfile` of the executor that
+      requested the module, or *None*.
+    """
+
+
+
+
+class CompileProfile(object):
+    """Where compiling an operator template spent its time.
+
+    :ivar phases: a list of *(name, seconds)* tuples, in the order in which
+      the phases ran. Some phases (such as autotuning of operators that are
+      only tuned on first use) may be appended after compilation proper.
+    :ivar instruction_flops: a list of *(instruction, flop_count)* tuples
+      for the instructions whose cost can be counted.
+    """
+
+    def __init__(self, module_builds=None):
+        """
+        :param module_builds: a list of :class:`ModuleBuild` instances that
+          the backend appends to whenever it compiles a module. The ones
+          whose :attr:`ModuleBuild.profile` is this profile are attributed
+          to it.
+        """
+        self.phases = []
+        self.instruction_flops = []
+
+        if module_builds is None:
+            module_builds = []
+        self.module_builds = module_builds
+
+    def add_phase(self, name, seconds):
+        self.phases.append((name, seconds))
+
+    def add_instructions(self, instructions):
+        for insn in instructions:
+            if hasattr(insn, "flop_count"):
+                self.instruction_flops.append((insn, insn.flop_count()))
+
+    @property
+    def modules(self):
+        """The :class:`ModuleBuild` instances belonging to this
+        compilation, including the ones that are only built on first
+        execution.
+        """
+        return [mb for mb in self.module_builds if mb.profile is self]
+
+    def total_time(self):
+        return (sum(seconds for name, seconds in self.phases)
+                + sum(mb.seconds for mb in self.modules))
+
+    def add_to_log(self, mgr, prefix="compile"):
+        """Record the profile as constants in the
+        :class:`pytools.log.LogManager` *mgr*.
+        """
+        for name, seconds in self.phases:
+            mgr.set_constant("%s_t_%s" % (prefix, name.replace(":", "_")),
+                    seconds)
+
+        modules = self.modules
+        mgr.set_constant("%s_t_total" % prefix, self.total_time())
+        mgr.set_constant("%s_n_modules" % prefix, len(modules))
+        mgr.set_constant("%s_n_module_cache_hits" % prefix,
+                len([mb for mb in modules if mb.cache_hit]))
+        mgr.set_constant("%s_t_modules" % prefix,
+                sum(mb.seconds for mb in modules))
+        mgr.set_constant("%s_n_flops_per_eval" % prefix,
+                sum(flops for insn, flops in self.instruction_flops))
+
+    def __str__(self):
+        lines = ["%-40s %10s" % ("phase", "seconds")]
+        for name, seconds in self.phases:
+            lines.append("%-40s %10.4f" % (name, seconds))
+
+        modules_by_kind = {}
+        for mb in self.modules:
+            modules_by_kind.setdefault(mb.kind, []).append(mb)
+
+        for kind, builds in sorted(modules_by_kind.iteritems()):
+            lines.append("%-40s %10.4f" % (
+                "modules:%s (%d built, %d cache hits)" % (
+                    kind, len(builds),
+                    len([mb for mb in builds if mb.cache_hit])),
+                sum(mb.seconds for mb in builds)))
+
+        lines.append("%-40s %10.4f" % ("total", self.total_time()))
+
+        if self.instruction_flops:
+            lines.append("")
+            lines.append("%10s  %s" % ("flops/dof", "assigned names"))
+            for insn, flops in sorted(self.instruction_flops,
+                    key=lambda item: -item[1]):
+                lines.append("%10d  %s" % (flops, ", ".join(insn.names)[:70]))
+
+        return "\n".join(lines)
+
+# }}}
+
+# {{{ runtime profile ---------------------------------------------------------
+def _value_nbytes(value):
+    import numpy
+    if not isinstance(value, numpy.ndarray):
+        return 0
+    elif value.dtype == object:
+        return sum(_value_nbytes(v) for v in value)
+    else:
+        return value.nbytes
+
+
+
+
+def _value_size(value):
+    import numpy
+    if not isinstance(value, numpy.ndarray):
+        return 1
+    elif value.dtype == object:
+        return sum(_value_size(v) for v in value)
+    else:
+        return value.size
+
+
+
+
+class InstructionStatistics(object):
+    """
+    :ivar count: number of executions.
+    :ivar seconds: total wall time.
+    :ivar bytes: total size of the values read and written.
+    :ivar flops: total floating point operations, or *None* if the
+      instruction cannot count them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0
+        self.bytes = 0
+        self.flops = None
+
+    def bandwidth(self):
+        """Return the achieved bandwidth in bytes per second."""
+        if not self.seconds:
+            return 0
+        return self.bytes/self.seconds
+
+    def flop_rate(self):
+        if self.flops is None or not self.seconds:
+            return None
+        return self.flops/self.seconds
+
+    def summary(self):
+        result = "%.3g ms in %d calls, %.3g GB/s" % (
+                1e3*self.seconds, self.count, self.bandwidth()/1e9)
+        flop_rate = self.flop_rate()
+        if flop_rate is not None:
+            result += ", %.3g GFlops/s" % (flop_rate/1e9)
+        return result
+
+
+
+
+class InstructionProfile(object):
+    """The cost of each instruction of a :class:`Code`, accumulated over
+    all executions while profiling is enabled (see
+    :meth:`Code.enable_profiling`).
+
+    Bytes moved are estimated as the sizes of the instruction's inputs
+    and outputs, which is a lower bound on its memory traffic.
+
+    :ivar stats: a mapping from instructions to
+      :class:`InstructionStatistics`.
+    :ivar future_count: number of futures evaluated.
+    :ivar future_seconds: total time spent evaluating futures.
+    :ivar future_wait_seconds: the part of :attr:`future_seconds` spent on
+      futures that were not ready yet, i.e. idle time.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.stats = {}
+        self.future_count = 0
+        self.future_seconds = 0
+        self.future_wait_seconds = 0
+
+    def execute(self, insn, exec_mapper):
+        from time import time
+        start = time()
+        assignments, new_futures = insn.get_executor_method(exec_mapper)(insn)
+        seconds = time() - start
+
+        try:
+            stats = self.stats[insn]
+        except KeyError:
+            stats = self.stats[insn] = InstructionStatistics()
+
+        stats.count += 1
+        stats.seconds += seconds
+
+        from pymbolic.primitives import Variable
+        context = exec_mapper.context
+        stats.bytes += sum(_value_nbytes(context.get(dep.name))
+                for dep in insn.get_dependencies()
+                if isinstance(dep, Variable))
+        stats.bytes += sum(_value_nbytes(value)
+                for target, value in assignments)
+
+        if hasattr(insn, "flop_count") and assignments:
+            stats.flops = (stats.flops or 0) + (
+                    insn.flop_count()*_value_size(assignments[0][1]))
+
+        return assignments, new_futures
+
+    def evaluate_future(self, future, waited):
+        from time import time
+        start = time()
+        result = future()
+        seconds = time() - start
+
+        self.future_count += 1
+        self.future_seconds += seconds
+        if waited:
+            self.future_wait_seconds += seconds
+
+        return result
+
+    def total_seconds(self):
+        return (sum(st.seconds for st in self.stats.itervalues())
+                + self.future_seconds)
+
+    def __str__(self):
+        total = self.total_seconds() or 1
+
+        lines = ["%6s %7s %10s %8s %9s  %s" % (
+            "share", "calls", "time [ms]", "GB/s", "GFlops/s", "instruction")]
+
+        for insn, st in sorted(self.stats.iteritems(),
+                key=lambda item: -item[1].seconds):
+            flop_rate = st.flop_rate()
+            if flop_rate is None:
+                flop_rate = "-"
+            else:
+                flop_rate = "%.3g" % (flop_rate/1e9)
+
+            lines.append("%5.1f%% %7d %10.3f %8.3g %9s  %s" % (
+                100*st.seconds/total, st.count, 1e3*st.seconds,
+                st.bandwidth()/1e9, flop_rate,
+                str(insn).replace("\n", " ")[:60]))
+
+        if self.future_count:
+            lines.append("%5.1f%% %7d %10.3f %8s %9s  %s" % (
+                100*self.future_seconds/total, self.future_count,
+                1e3*self.future_seconds, "-", "-",
+                "futures (%.3f ms waiting)" % (1e3*self.future_wait_seconds)))
+
+        return "\n".join(lines)
+
 # }}}
 
 # {{{ compiler ----------------------------------------------------------------
@@ -544,11 +987,21 @@ class OperatorCompilerBase(IdentityMapper):
     class FluxBatch(Record):
         __slots__ = ["flux_exprs", "repr_op"]
 
-    def __init__(self, prefix="_expr", max_vectors_in_batch_expr=None):
+    def __init__(self, prefix="_expr", max_vectors_in_batch_expr=100,
+            max_flops_in_batch_expr=None):
+        """
+        :param max_vectors_in_batch_expr: the largest number of vectors
+          (results and arguments) an aggregated assignment may touch, or
+          *None* for no limit.
+        :param max_flops_in_batch_expr: the largest flop count of an
+          aggregated assignment, or *None* for no limit. Assignments that
+          exceed it on their own are left as they are.
+        """
         IdentityMapper.__init__(self)
         self.prefix = prefix
 
         self.max_vectors_in_batch_expr = max_vectors_in_batch_expr
+        self.max_flops_in_batch_expr = max_flops_in_batch_expr
 
         self.code = []
         self.expr_to_var = {}
@@ -584,12 +1037,35 @@ class OperatorCompilerBase(IdentityMapper):
         from hedge.optemplate.mappers import FluxExchangeCollector
         return FluxExchangeCollector()(expr)
 
+    def collect_elementwise_batch_ops(self, expr):
+        """Return the set of operator bindings in *expr* that may be
+        evaluated in an :class:`ElementwiseBatchAssign`.
+        """
+
+        # overridden by subclasses that support ElementwiseBatchAssign
+        return set()
+
     # }}}
 
     # {{{ top-level driver ----------------------------------------------------
-    def __call__(self, expr, type_hints={}):
+    def __call__(self, expr, type_hints={}, profile=None):
+        """
+        :param profile: a :class:`CompileProfile` to which the time spent in
+          each phase is added, or *None*.
+        """
+        from time import time
+        phase_start = [time()]
+
+        def end_phase(name):
+            now = time()
+            if profile is not None:
+                profile.add_phase("compiler:"+name, now-phase_start[0])
+            phase_start[0] = now
+
         from hedge.optemplate.mappers.type_inference import TypeInferrer
         self.typedict = TypeInferrer()(expr, type_hints)
+        self.per_element_checker = PerElementChecker(self.typedict)
+        end_phase("type-inference")
 
         # {{{ flux batching
         # Fluxes can be evaluated faster in batches. Here, we find flux 
@@ -634,6 +1110,7 @@ class OperatorCompilerBase(IdentityMapper):
             else:
                 raise RuntimeError("cannot resolve flux evaluation order")
 
+        end_phase("flux-batching")
         # }}}
 
         # Once flux batching is figured out, we also need to know which
@@ -648,13 +1125,56 @@ class OperatorCompilerBase(IdentityMapper):
         # Flux exchange also works better when batched.
         self.flux_exchange_ops = self.collect_flux_exchange_ops(expr)
 
+        # {{{ element-local operator batching
+        # Applications of the same element-local operator to different
+        # fields can share one sweep over the elements, as long as none
+        # of the fields depends on another application in the batch.
+
+        elwise_queue = list(self.collect_elementwise_batch_ops(expr))
+        elwise_deps = dict(
+                (bdg, self.collect_elementwise_batch_ops(bdg.field))
+                for bdg in elwise_queue)
+
+        self.elementwise_batches = {}
+        admissible_deps = set()
+        while elwise_queue:
+            present_batch = [bdg for bdg in elwise_queue
+                    if elwise_deps[bdg] <= admissible_deps]
+            if not present_batch:
+                raise RuntimeError(
+                        "cannot resolve element-local operator evaluation order")
+
+            batches_by_op = {}
+            for bdg in present_batch:
+                batches_by_op.setdefault(bdg.op, []).append(bdg)
+
+            for batch in batches_by_op.itervalues():
+                for bdg in batch:
+                    self.elementwise_batches[bdg] = batch
+
+            admissible_deps |= set(present_batch)
+            elwise_queue = [bdg for bdg in elwise_queue
+                    if bdg not in admissible_deps]
+
+        end_phase("operator-batching")
+        # }}}
+
         # Finally, walk the expression and build the code.
         result = IdentityMapper.__call__(self, expr)
 
         # Then, put the toplevel expressions into variables as well.
         from hedge.tools import with_object_array_or_scalar
         result = with_object_array_or_scalar(self.assign_to_new_var, result)
-        return Code(self.aggregate_assignments(self.code, result), result)
+        end_phase("instruction-generation")
+
+        code = Code(self.aggregate_assignments(self.code, result), result,
+                self.per_element_checker)
+        end_phase("aggregation")
+
+        if profile is not None:
+            profile.add_instructions(code.instructions)
+
+        return code
 
     # }}}
 
@@ -697,6 +1217,7 @@ class OperatorCompilerBase(IdentityMapper):
 
         new_name = self.get_var_name(prefix)
         self.code.append(self.make_assign(new_name, expr, priority))
+        self.per_element_checker.add_variable(new_name, expr)
 
         return Variable(new_name)
 
@@ -734,6 +1255,8 @@ class OperatorCompilerBase(IdentityMapper):
 
         if isinstance(expr.op, ReferenceDiffOperatorBase):
             return self.map_ref_diff_op_binding(expr)
+        elif expr in self.elementwise_batches:
+            return self.map_elementwise_batch_op_binding(expr)
         elif isinstance(expr.op, FluxOperatorBase):
             raise RuntimeError("OperatorCompiler encountered a flux operator.\n\n"
                     "We are expecting flux operators to be converted to custom "
@@ -804,6 +1327,27 @@ class OperatorCompilerBase(IdentityMapper):
 
             return self.expr_to_var[expr]
 
+    def map_elementwise_batch_op_binding(self, expr):
+        try:
+            return self.expr_to_var[expr]
+        except KeyError:
+            batch = self.elementwise_batches[expr]
+
+            names = [self.get_var_name() for bdg in batch]
+            self.code.append(
+                    ElementwiseBatchAssign(
+                        names=names,
+                        op=expr.op,
+                        fields=[self.assign_to_new_var(self.rec(bdg.field))
+                            for bdg in batch],
+                        dep_mapper_factory=self.dep_mapper_factory))
+
+            from pymbolic import var
+            for n, bdg in zip(names, batch):
+                self.expr_to_var[bdg] = var(n)
+
+            return self.expr_to_var[expr]
+
     def map_flux_exchange(self, expr):
         try:
             return self.expr_to_var[expr]
@@ -877,51 +1421,24 @@ class OperatorCompilerBase(IdentityMapper):
         from pymbolic.primitives import Variable
 
         # aggregation helpers -------------------------------------------------
-        def get_complete_origins_set(insn, skip_levels=0):
-            if skip_levels < 0:
-                skip_levels = 0
-
-            result = set()
-            for dep in insn.get_dependencies():
-                if isinstance(dep, Variable):
-                    dep_origin = origins_map.get(dep.name, None)
-                    if dep_origin is not None:
-                        if skip_levels <= 0:
-                            result.add(dep_origin)
-                        result |= get_complete_origins_set(
-                                dep_origin, skip_levels-1)
-
-            return result
-
-        var_assignees_cache = {}
-        def get_var_assignees(insn):
-            try:
-                return var_assignees_cache[insn]
-            except KeyError:
-                result = set(Variable(assignee)
-                        for assignee in insn.get_assignees())
-                var_assignees_cache[insn] = result
-                return result
-
-        def aggregate_two_assignments(ass_1, ass_2):
-            names = ass_1.names + ass_2.names
+        def aggregate_group(assigns):
+            if len(assigns) == 1:
+                return assigns[0]
 
-            from pymbolic.primitives import Variable
-            deps = (ass_1.get_dependencies() | ass_2.get_dependencies()) \
+            names = [name for ass in assigns for name in ass.names]
+
+            from operator import or_
+            deps = reduce(or_, (ass.get_dependencies() for ass in assigns)) \
                     - set(Variable(name) for name in names)
 
             return Assign(
-                    names=names, exprs=ass_1.exprs + ass_2.exprs,
+                    names=names,
+                    exprs=[expr for ass in assigns for expr in ass.exprs],
                     _dependencies=deps,
                     dep_mapper_factory=self.dep_mapper_factory,
-                    priority=max(ass_1.priority, ass_2.priority))
-
-        # main aggregation pass -----------------------------------------------
-        origins_map = dict(
-                    (assignee, insn)
-                    for insn in instructions
-                    for assignee in insn.get_assignees())
+                    priority=max(ass.priority for ass in assigns))
 
+        # find aggregation candidates -----------------------------------------
         from pytools import partition
         unprocessed_assigns, other_insns = partition(
                 lambda insn: isinstance(insn, Assign),
@@ -936,73 +1453,116 @@ class OperatorCompilerBase(IdentityMapper):
         from pytools import any
         from hedge.tools import is_zero
 
-        i = 0
-
-        while i < len(unprocessed_assigns):
-            my_assign = unprocessed_assigns[i]
-            if any(is_zero(expr) for expr in my_assign.exprs):
-                processed_assigns.append(unprocessed_assigns.pop())
-            else:
-                i += 1
-
-        # greedy aggregation
-        while unprocessed_assigns:
-            my_assign = unprocessed_assigns.pop()
-
-            my_deps = my_assign.get_dependencies()
-            my_assignees = get_var_assignees(my_assign)
-
-            agg_candidates = []
-            for i, other_assign in enumerate(unprocessed_assigns):
-                other_deps = other_assign.get_dependencies()
-                other_assignees = get_var_assignees(other_assign)
-
-                if ((my_deps & other_deps
-                        or my_deps & other_assignees
-                        or other_deps & my_assignees)
-                        and my_assign.priority == other_assign.priority):
-                    agg_candidates.append((i, other_assign))
-
-            did_work = False
-
-            if agg_candidates:
-                my_indirect_origins = get_complete_origins_set(
-                        my_assign, skip_levels=1)
-
-                for other_assign_index, other_assign in agg_candidates:
-                    if self.max_vectors_in_batch_expr is not None:
-                        new_assignee_count = len(
-                                set(my_assign.get_assignees())
-                                | set(other_assign.get_assignees()))
-                        new_dep_count = len(
-                                my_assign.get_dependencies(
-                                    each_vector=True)
-                                | other_assign.get_dependencies(
-                                    each_vector=True))
-
-                        if (new_assignee_count + new_dep_count \
-                                > self.max_vectors_in_batch_expr):
-                            continue
-
-                    other_indirect_origins = get_complete_origins_set(
-                            other_assign, skip_levels=1)
-
-                    if (my_assign not in other_indirect_origins and
-                            other_assign not in my_indirect_origins):
-                        did_work = True
-
-                        # aggregate the two assignments
-                        new_assignment = aggregate_two_assignments(
-                                my_assign, other_assign)
-                        del unprocessed_assigns[other_assign_index]
-                        unprocessed_assigns.append(new_assignment)
-                        for assignee in new_assignment.get_assignees():
-                            origins_map[assignee] = new_assignment
+        zero_assigns, unprocessed_assigns = partition(
+                lambda ass: any(is_zero(expr) for expr in ass.exprs),
+                unprocessed_assigns)
+        processed_assigns.extend(zero_assigns)
 
-                        break
+        # dependency graph ----------------------------------------------------
+        origins_map = dict(
+                    (assignee, insn)
+                    for insn in instructions
+                    for assignee in insn.get_assignees())
 
-            if not did_work:
-                processed_assigns.append(my_assign)
+        origins = dict(
+                (insn, set(
+                    origins_map[dep.name]
+                    for dep in insn.get_dependencies()
+                    if isinstance(dep, Variable) and dep.name in origins_map)
+                    - set([insn]))
+                for insn in instructions)
+
+        users = dict((insn, []) for insn in instructions)
+        for insn, insn_origins in origins.iteritems():
+            for origin in insn_origins:
+                users[origin].append(insn)
+
+        # Find the "barrier level" of each instruction, i.e. the largest
+        # number of instructions that cannot be aggregated on any dependency
+        # path leading up to it. If two aggregatable assignments have the
+        # same barrier level, every path between them passes only through
+        # aggregatable assignments of that same level. Hence, cutting a
+        # topological order of each level into chunks and merging each
+        # chunk cannot introduce a cycle.
+
+        aggregatable = set(unprocessed_assigns)
+
+        barrier_level = {}
+        topo_order = {}
+        pending_origin_count = dict(
+                (insn, len(insn_origins))
+                for insn, insn_origins in origins.iteritems())
+        ready = [insn for insn in instructions
+                if not pending_origin_count[insn]]
+
+        while ready:
+            insn = ready.pop()
+            topo_order[insn] = len(topo_order)
+
+            barrier_level[insn] = max([
+                barrier_level[origin] + int(origin not in aggregatable)
+                for origin in origins[insn]] + [0])
+
+            for user in users[insn]:
+                pending_origin_count[user] -= 1
+                if not pending_origin_count[user]:
+                    ready.append(user)
+
+        if len(topo_order) != len(instructions):
+            raise RuntimeError("dependency cycle among instructions")
+
+        # aggregate by barrier level ------------------------------------------
+        levels = {}
+        for ass in unprocessed_assigns:
+            levels.setdefault(barrier_level[ass], set()).add(ass)
+
+        def get_vectors(ass):
+            return (ass.get_dependencies(each_vector=True)
+                    | set(Variable(name) for name in ass.names))
+
+        for level in sorted(levels):
+            members = levels[level]
+            pending_origin_count = dict(
+                    (ass, len(origins[ass] & members))
+                    for ass in members)
+            ready = [ass for ass in members if not pending_origin_count[ass]]
+
+            chunk = []
+            chunk_vectors = set()
+            chunk_flops = 0
+            while ready:
+                # Walk a topological order of this level, preferring to
+                # stay with the priority of the present chunk.
+                same_priority = [ass for ass in ready
+                        if chunk and ass.priority == chunk[0].priority]
+                ass = min(same_priority or ready, key=topo_order.__getitem__)
+                ready.remove(ass)
+
+                ass_vectors = get_vectors(ass)
+                ass_flops = ass.flop_count()
+                if chunk and (ass.priority != chunk[0].priority
+                        or (self.max_vectors_in_batch_expr is not None
+                            and len(chunk_vectors | ass_vectors)
+                            > self.max_vectors_in_batch_expr)
+                        or (self.max_flops_in_batch_expr is not None
+                            and chunk_flops + ass_flops
+                            > self.max_flops_in_batch_expr)):
+                    processed_assigns.append(aggregate_group(chunk))
+                    chunk = []
+                    chunk_vectors = set()
+                    chunk_flops = 0
+
+                chunk.append(ass)
+                chunk_vectors |= ass_vectors
+                chunk_flops += ass_flops
+
+                for user in users[ass]:
+                    if user in members:
+                        pending_origin_count[user] -= 1
+                        if not pending_origin_count[user]:
+                            ready.append(user)
+
+            processed_assigns.append(aggregate_group(chunk))
 
         externally_used_names = set(
                 expr
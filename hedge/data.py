@@ -213,56 +213,154 @@ def make_tdep_given(x):
 
 
 
-class TimeHarmonicGivenFunction(ITimeDependentGivenFunction):
-    """Modulates an :class:`ITimeDependentGivenFunction` by a sine
-    in time.
+def _scale_into(buffer, value, factor):
+    """Return *factor* times *value*, storing the result in *buffer* (of the
+    same structure as *value*) if possible. Return the new buffer.
+    """
+    from pytools.obj_array import is_obj_array
+    if is_obj_array(value):
+        if buffer is None:
+            buffer = numpy.empty(value.shape, dtype=object)
+        for i, value_i in enumerate(value):
+            buffer[i] = _scale_into(buffer[i], value_i, factor)
+        return buffer
+    elif isinstance(value, numpy.ndarray):
+        if (buffer is None
+                or not isinstance(buffer, numpy.ndarray)
+                or buffer.shape != value.shape
+                or buffer.dtype != value.dtype):
+            buffer = numpy.empty_like(value)
+        numpy.multiply(value, factor, buffer)
+        return buffer
+    else:
+        return factor*value
+
+
+
+
+class SeparableGivenFunction(ITimeDependentGivenFunction):
+    """Modulates an :class:`ITimeDependentGivenFunction` *gf* by a scalar
+    function of time, :meth:`time_factor`.
+
+    If *gf* is time-independent (such as a :class:`TimeConstantGivenFunction`),
+    its interpolants are cached, so that only the scalar time factor is
+    recomputed on each call. Nested modulations are multiplied together
+    before being applied.
+
+    Each call returns a freshly allocated interpolant unless buffer reuse
+    is enabled, see :meth:`with_buffer_reuse`.
     """
-    def __init__(self, gf, omega, phase=0):
+
+    def __init__(self, gf, time_factor=None, reuse_buffers=False):
+        """
+        :param time_factor: a function of time returning a scalar. If not
+          given, :meth:`time_factor` must be overridden.
+        :param reuse_buffers: if *True*, the returned interpolants are
+          stored in buffers that are overwritten by the next call for the
+          same discretization and boundary.
+        """
+        from weakref import WeakKeyDictionary
+
         self.gf = gf
-        self.omega = omega
-        self.phase = phase
+        if time_factor is not None:
+            self.time_factor = time_factor
+
+        self.reuse_buffers = reuse_buffers
+        self.buffers = WeakKeyDictionary()
+
+    def with_buffer_reuse(self):
+        """Return a copy of *self* with *reuse_buffers* set."""
+        if self.reuse_buffers:
+            return self
+
+        from copy import copy
+        from weakref import WeakKeyDictionary
+        result = copy(self)
+        result.reuse_buffers = True
+        result.buffers = WeakKeyDictionary()
+        return result
+
+    def time_factor(self, t):
+        raise NotImplementedError
+
+    def _interpolant(self, t, discr, tag, get_interpolant):
+        factor = self.time_factor(t)
+        gf = self.gf
+        while isinstance(gf, SeparableGivenFunction):
+            factor = factor * gf.time_factor(t)
+            gf = gf.gf
+
+        if not self.reuse_buffers:
+            return _scale_into(None, get_interpolant(gf), factor)
+
+        discr_buffers = self.buffers.setdefault(discr, {})
+        result = discr_buffers[tag] = _scale_into(
+                discr_buffers.get(tag), get_interpolant(gf), factor)
+        return result
 
     def volume_interpolant(self, t, discr):
-        from math import sin
-        return sin(self.omega * t + self.phase) \
-                * self.gf.volume_interpolant(t, discr)
+        return self._interpolant(t, discr, None,
+                lambda gf: gf.volume_interpolant(t, discr))
 
     def boundary_interpolant(self, t, discr, tag):
-        from math import sin
-        return sin(self.omega * t + self.phase)\
-                * self.gf.boundary_interpolant(t, discr, tag)
+        return self._interpolant(t, discr, tag,
+                lambda gf: gf.boundary_interpolant(t, discr, tag))
+
+
 
 
+class TimeHarmonicGivenFunction(SeparableGivenFunction):
+    """Modulates an :class:`ITimeDependentGivenFunction` by a sine
+    in time.
+    """
+    def __init__(self, gf, omega, phase=0, reuse_buffers=False):
+        SeparableGivenFunction.__init__(self, gf,
+                reuse_buffers=reuse_buffers)
+        self.omega = omega
+        self.phase = phase
+
+    def time_factor(self, t):
+        from math import sin
+        return sin(self.omega * t + self.phase)
+
 
 
 
-class TimeIntervalGivenFunction(ITimeDependentGivenFunction):
+class TimeIntervalGivenFunction(SeparableGivenFunction):
     """Adapts an :class:`ITimeDependentGivenFunction` to depend on time by 
     "turning it on" for the time interval :math:`[\\text{on\\_time}, \\text{off\\_time})`, 
     and having it be zero the rest of the time.
     """
 
-    def __init__(self, gf, on_time=0, off_time=1):
-        self.gf = gf
+    def __init__(self, gf, on_time=0, off_time=1, reuse_buffers=False):
+        SeparableGivenFunction.__init__(self, gf,
+                reuse_buffers=reuse_buffers)
         self.on_time = on_time
         self.off_time = off_time
         assert on_time <= off_time
 
-    def volume_interpolant(self, t, discr):
+    def time_factor(self, t):
         if self.on_time <= t < self.off_time:
-            return self.gf.volume_interpolant(t, discr)
+            return 1
         else:
-            # FIXME: not optimal
-            # difficult part here is to match shape
-            return 0 * self.gf.volume_interpolant(t, discr)
+            return 0
 
-    def boundary_interpolant(self, t, discr, tag):
-        if self.on_time <= t < self.off_time:
-            return self.gf.boundary_interpolant(t, discr, tag)
-        else:
-            # FIXME: not optimal
-            # difficult part here is to match shape
-            return 0 * self.gf.boundary_interpolant(t, discr, tag)
+
+
+
+def with_buffer_reuse(gf):
+    """Return a version of the time-dependent given function *gf* whose
+    interpolants may be overwritten by the next call for the same
+    discretization and boundary, if *gf* supports that, or *gf* itself.
+
+    Only callers that are done with each interpolant before requesting the
+    next one, such as the right-hand sides built by operator ``bind``
+    methods, should use this.
+    """
+    if isinstance(gf, SeparableGivenFunction):
+        return gf.with_buffer_reuse()
+    else:
+        return gf
 
 
 
@@ -381,6 +479,7 @@ class CompiledExpressionData(
         return self(discr, t, fields, self.get_volume_nodes(discr),
                  discr.volume_empty)
 
+    @memoize_method
     def get_boundary_nodes(self, discr, tag):
         from hedge.tools import make_obj_array
         bnodes = discr.get_boundary(tag).nodes
@@ -162,6 +162,18 @@ class Discretization(TimestepCalculator):
     :ivar quad_min_degrees: A mapping from quadrature tags to the degrees to
         which the desired quadrature is supposed to be exact.
 
+    :ivar element_groups: a list of
+        :class:`hedge.discretization.data.StraightElementGroup` instances,
+        one for each distinct local discretization in use.
+    :ivar face_groups: a list of double-sided face groups, one for each
+        local discretization that occurs on both sides of an interior face.
+    :ivar mixed_order_face_groups: a list of single-sided face groups
+        holding the interior faces between elements of differing order,
+        one for each local discretization on the interior side.
+    :ivar mixed_order_trace: a
+        :class:`hedge.discretization.data.MixedOrderTrace` supplying the
+        exterior values for :attr:`mixed_order_face_groups`.
+
     :ivar inverse_metric_derivatives: A list of lists of full-volume vectors,
         such that the vector *inverse_metric_derivatives[xyz_axis][rst_axis]*
         gives the metric derivatives on the entire volume.
@@ -179,6 +191,7 @@ class Discretization(TimestepCalculator):
             "dump_op_code",
             "dump_dataflow_graph",
             "dump_optemplate_stages",
+            "optemplate_pass_timing",
             "help",
             ])
 
@@ -217,6 +230,10 @@ class Discretization(TimestepCalculator):
             order=None, quad_min_degrees={},
             debug=set(), default_scalar_type=numpy.float64, run_context=None):
         """
+        :param order: either an integer giving the polynomial order of all
+          elements or, for a p-adaptive discretization, a sequence giving
+          the order of each element of *mesh*, indexed by element number.
+          Elements of equal order form one element group.
         :param quad_min_degrees: A mapping from quadrature tags to the degrees to
           which the desired quadrature is supposed to be exact.
         :param debug: A set of strings indicating which debug checks should
@@ -231,8 +248,25 @@ class Discretization(TimestepCalculator):
 
         self.mesh = mesh
 
-        local_discretization = self.get_local_discretization(
-                mesh, local_discretization, order)
+        if isinstance(order, (list, tuple, numpy.ndarray)):
+            if local_discretization is not None:
+                raise ValueError("must supply only one of local_discretization "
+                        "and order")
+            if len(order) != len(mesh.elements):
+                raise ValueError("per-element orders must be given for "
+                        "each element of the mesh")
+
+            order_to_ldis = {}
+            for el_order in set(order):
+                order_to_ldis[el_order] = self.get_local_discretization(
+                        mesh, order=int(el_order))
+
+            element_ldis = [order_to_ldis[el_order] for el_order in order]
+            local_discretization = order_to_ldis[max(order_to_ldis)]
+        else:
+            local_discretization = self.get_local_discretization(
+                    mesh, local_discretization, order)
+            element_ldis = [local_discretization]*len(mesh.elements)
 
         self.dimensions = local_discretization.dimensions
 
@@ -257,13 +291,67 @@ class Discretization(TimestepCalculator):
 
         self.exec_functions = {}
 
-        self._build_element_groups_and_nodes(local_discretization)
+        # maps keys from _get_code_cache_key to compiled code. Only set up
+        # (and shared with discretizations of adapted meshes) by
+        # copy_with_mesh(reuse_code=True).
+        self._code_cache = None
+
+        self._build_element_groups_and_nodes(element_ldis)
         self._calculate_local_matrices()
         self._build_interior_face_groups()
+        self._build_mixed_order_face_groups()
 
     def close(self):
         pass
 
+    def copy_with_order(self, order):
+        """Return a discretization of :attr:`mesh` that is like this one,
+        except that its local discretizations are of order *order*.
+        """
+        return type(self)(self.mesh, order=order,
+                quad_min_degrees=self.quad_min_degrees,
+                debug=self.debug,
+                default_scalar_type=self.default_scalar_type,
+                run_context=self.run_context)
+
+    def copy_with_mesh(self, mesh, reuse_code=False):
+        """Return a discretization of *mesh* that is like this one and
+        shares its local discretization, along with the reference matrices
+        already computed on it. *mesh* is typically an adapted version of
+        :attr:`mesh`, see :mod:`hedge.adaptivity`. Everything else, such as
+        the nodes and the face groups, is built anew.
+
+        :param reuse_code: if *True*, operators compiled on either
+          discretization from then on reuse the compiled code of equal
+          operators compiled on the other, skipping optemplate processing
+          and compilation. This only takes effect if *mesh* differs from
+          :attr:`mesh` in nothing but its elements, i.e. it has the same
+          dimension and the same set of non-empty boundary tags.
+        """
+        if len(self.element_groups) != 1:
+            raise NotImplementedError("copying discretizations with "
+                    "multiple element groups onto a new mesh")
+
+        result = type(self)(mesh,
+                local_discretization=self.element_groups[0].local_discretization,
+                quad_min_degrees=self.quad_min_degrees,
+                debug=self.debug,
+                default_scalar_type=self.default_scalar_type,
+                run_context=self.run_context)
+
+        def code_relevant_mesh_structure(mesh):
+            return mesh.dimensions, frozenset(
+                    tag for tag, el_faces in mesh.tag_to_boundary.iteritems()
+                    if el_faces)
+
+        if reuse_code and (code_relevant_mesh_structure(mesh)
+                == code_relevant_mesh_structure(self.mesh)):
+            if self._code_cache is None:
+                self._code_cache = {}
+            result._code_cache = self._code_cache
+
+        return result
+
     # }}}
 
     # {{{ instrumentation -----------------------------------------------------
@@ -371,50 +459,64 @@ class Discretization(TimestepCalculator):
     # }}}
 
     # {{{ initialization ------------------------------------------------------
-    def _build_element_groups_and_nodes(self, local_discretization):
+    def _build_element_groups_and_nodes(self, element_ldis):
+        """
+        :param element_ldis: a list of local discretizations, one for each
+          element of :attr:`mesh`.
+        """
         from hedge.mesh.element import CurvedElement
         from hedge.mesh.element import SimplicialElement
 
-        straight_elements = [el
-                for el in self.mesh.elements
-                if isinstance(el, SimplicialElement)]
         curved_elements = [el
                 for el in self.mesh.elements
                 if isinstance(el, CurvedElement)]
 
+        # group straight elements by local discretization, keeping
+        # elements in mesh order within each group
+        ldis_to_members = {}
+        for el in self.mesh.elements:
+            if isinstance(el, SimplicialElement):
+                ldis_to_members.setdefault(element_ldis[el.id], []).append(el)
+
         self.element_groups = []
 
-        from hedge._internal import UniformElementRanges
-        if straight_elements:
-            from hedge.discretization.data import StraightElementGroup
+        # mem layout:
+        # [....element....][...element...]
+        #  |    \
+        #  [node.]
+        #   | | |
+        #   x y z
+        #
+        # Elements of one group are stored contiguously, groups are stored
+        # in order of increasing polynomial order.
+
+        node_count = sum(ldis.node_count()*len(members)
+                for ldis, members in ldis_to_members.iteritems())
+        self.nodes = numpy.empty((node_count, self.dimensions),
+                dtype=float, order="C")
+
+        self.group_map = [None]*len(self.mesh.elements)
+
+        from hedge._internal import UniformElementRanges, map_element_nodes
+        from hedge.discretization.data import StraightElementGroup
 
+        group_start = 0
+        for ldis, members in sorted(ldis_to_members.iteritems(),
+                key=lambda (ldis, members): ldis.order):
             eg = StraightElementGroup()
             self.element_groups.append(eg)
 
-            eg.members = straight_elements
+            eg.members = members
             eg.member_nrs = numpy.fromiter((el.id for el in eg.members),
                     dtype=numpy.uint32)
-            eg.local_discretization = ldis = local_discretization
+            eg.local_discretization = ldis
             eg.ranges = UniformElementRanges(
-                    0,
+                    group_start,
                     len(ldis.unit_nodes()),
-                    len(self.mesh.elements))
+                    len(members))
             eg.quadrature_info = {}
 
             nodes_per_el = ldis.node_count()
-            # mem layout:
-            # [....element....][...element...]
-            #  |    \
-            #  [node.]
-            #   | | |
-            #   x y z
-
-            # while it seems convenient, nodes should not have an
-            # "element number" dimension: this would break once
-            # p-adaptivity is implemented
-            self.nodes = numpy.empty(
-                    (len(self.mesh.elements) * nodes_per_el, self.dimensions),
-                    dtype=float, order="C")
 
             unit_nodes = numpy.empty((nodes_per_el, self.dimensions),
                     dtype=float, order="C")
@@ -422,17 +524,17 @@ class Discretization(TimestepCalculator):
             for i_node, node in enumerate(ldis.unit_nodes()):
                 unit_nodes[i_node] = node
 
-            from hedge._internal import map_element_nodes
-
-            for el in eg.members:
+            for i, el in enumerate(eg.members):
                 map_element_nodes(
                         self.nodes,
-                        el.id * nodes_per_el * self.dimensions,
+                        (group_start + i*nodes_per_el) * self.dimensions,
                         el.map,
                         unit_nodes,
                         self.dimensions)
 
-            self.group_map = [(eg, i) for i in range(len(self.mesh.elements))]
+                self.group_map[el.id] = (eg, i)
+
+            group_start += eg.ranges.total_size
 
         if curved_elements:
             raise NotImplementedError
@@ -476,7 +578,8 @@ class Discretization(TimestepCalculator):
             q_info = self.get_quadrature_info(quadrature_tag)
 
             def make_empty_quad_vol_vector():
-                return numpy.empty(q_info.node_count, dtype=numpy.float64)
+                return numpy.empty(q_info.node_count,
+                        dtype=self.default_scalar_type)
 
             vol_jac = make_empty_quad_vol_vector()
 
@@ -516,23 +619,38 @@ class Discretization(TimestepCalculator):
         else:
             q_info = self.get_quadrature_info(quadrature_tag)
             result = [[
-                numpy.empty(q_info.node_count)
+                numpy.empty(q_info.node_count, dtype=self.default_scalar_type)
                 for i in range(self.dimensions)]
                 for i in range(self.dimensions)]
 
             for eg in self.element_groups:
                 ldis = eg.local_discretization
-                eg_q_info = eg.quadrature_info
+                eg_q_info = eg.quadrature_info[quadrature_tag]
 
                 for xyz_coord in range(ldis.dimensions):
                     for rst_coord in range(ldis.dimensions):
                         (eg_q_info.el_array_from_volume(
-                            inv_met[xyz_coord][rst_coord]).T)[:,:] \
+                            result[xyz_coord][rst_coord]).T)[:,:] \
                                     = [el.inverse_map.matrix[rst_coord, xyz_coord]
                                             for el in eg.members]
 
         return result
 
+    @memoize_method
+    def inverse_metric_constants(self, eg):
+        """Return an array of shape *(len(eg.members), dimensions, dimensions)*
+        such that *result[i, xyz_axis, rst_axis]* gives the (constant)
+        metric derivative of the *i*th element of the element group *eg*.
+
+        .. math::
+            \frac{d r_{\mathtt{rst\_axis}} }{d x_{\mathtt{xyz\_axis}} }
+
+        Unlike :meth:`inverse_metric_derivatives`, this stores one value
+        per element rather than one per node.
+        """
+        return numpy.array([el.inverse_map.matrix.T for el in eg.members],
+                dtype=self.default_scalar_type)
+
 
     @memoize_method
     def forward_metric_derivatives(self, quadrature_tag=None, kind="numpy"):
@@ -600,11 +718,13 @@ class Discretization(TimestepCalculator):
         from hedge.discretization.local import FaceVertexMismatch
         from hedge.discretization.data import StraightFaceGroup
         fg_type = StraightFaceGroup
-        fg = fg_type(double_sided=True,
-                debug="ilist_generation" in self.debug)
 
-        all_ldis_l = []
-        all_ldis_n = []
+        # one double-sided face group per local discretization
+        ldis_to_fg = {}
+
+        # interfaces between elements of differing order, see
+        # _build_mixed_order_face_groups
+        self.mixed_order_interfaces = []
 
         debug_node_perm = "node_permutation" in self.debug
 
@@ -616,8 +736,15 @@ class Discretization(TimestepCalculator):
             eslice_l, ldis_l = self.find_el_data(e_l.id)
             eslice_n, ldis_n = self.find_el_data(e_n.id)
 
-            all_ldis_l.append(ldis_l)
-            all_ldis_n.append(ldis_n)
+            if ldis_l is not ldis_n:
+                self.mixed_order_interfaces.append((local_face, neigh_face))
+                continue
+
+            try:
+                fg = ldis_to_fg[ldis_l]
+            except KeyError:
+                fg = ldis_to_fg[ldis_l] = fg_type(double_sided=True,
+                        debug="ilist_generation" in self.debug)
 
             vertices_l = e_l.faces[fi_l]
             vertices_n = e_n.faces[fi_n]
@@ -681,16 +808,100 @@ class Discretization(TimestepCalculator):
                         dist[periodic_axis] = 0
                     assert la.norm(dist) < 1e-14
 
-        if len(fg.face_pairs):
-            from pytools import single_valued
-            ldis_l = single_valued(all_ldis_l)
-            ldis_n = single_valued(all_ldis_n)
+        self.face_groups = []
+        for ldis, fg in sorted(ldis_to_fg.iteritems(),
+                key=lambda (ldis, fg): ldis.order):
+            fg.commit(self, ldis, ldis)
+            self.face_groups.append(fg)
+
+    def _build_mixed_order_face_groups(self):
+        """Build :attr:`mixed_order_face_groups` and
+        :attr:`mixed_order_trace` from the interfaces between elements of
+        differing order.
+
+        Each such interface is represented by two single-sided face pairs,
+        one for each side. The interior side of each face pair refers to
+        volume nodes, as usual. Its exterior side refers to values of the
+        opposite element interpolated to the interior side's face nodes,
+        which :attr:`mixed_order_trace` appends to volume vectors.
+        """
+        from hedge.discretization.data import (
+                StraightFaceGroup, MixedOrderTrace)
+        fg_type = StraightFaceGroup
 
-            fg.commit(self, ldis_l, ldis_n)
+        ldis_to_fg = {}
+        trace_rows = []
 
-            self.face_groups = [fg]
-        else:
-            self.face_groups = []
+        def face_centroid(el, fi):
+            return numpy.average(
+                    [self.mesh.points[vi] for vi in el.faces[fi]],
+                    axis=0)
+
+        for local_face, neigh_face in self.mixed_order_interfaces:
+            for (el_a, fi_a), (el_b, fi_b) in [
+                    (local_face, neigh_face),
+                    (neigh_face, local_face)]:
+                eslice_a, ldis_a = self.find_el_data(el_a.id)
+                eslice_b, ldis_b = self.find_el_data(el_b.id)
+
+                try:
+                    fg = ldis_to_fg[ldis_a]
+                except KeyError:
+                    fg = ldis_to_fg[ldis_a] = fg_type(double_sided=False,
+                            debug="ilist_generation" in self.debug)
+
+                findices_a = ldis_a.face_indices()[fi_a]
+
+                # Locate the face nodes of el_a in el_b. For periodic
+                # interfaces, the two faces are offset by the period.
+                shift = face_centroid(el_b, fi_b) - face_centroid(el_a, fi_a)
+
+                unit_points = [
+                        el_b.inverse_map(self.nodes[eslice_a.start + i] + shift)
+                        for i in findices_a]
+                interp_rows = la.solve(ldis_b.vandermonde().T,
+                        ldis_b.basis_vandermonde(unit_points).T).T
+                for row in interp_rows:
+                    trace_rows.append((eslice_b.start, row))
+
+                fp = fg_type.FacePair()
+                fp.int_side.el_base_index = eslice_a.start
+                fp.ext_side.el_base_index = (len(self.nodes)
+                        + len(trace_rows) - len(findices_a))
+                fp.int_side.face_index_list_number = \
+                        fg.register_face_index_list(
+                                identifier=fi_a,
+                                generator=lambda: findices_a)
+                fp.ext_side.face_index_list_number = \
+                        fg.register_face_index_list(
+                                identifier=(),
+                                generator=lambda: tuple(xrange(len(findices_a))))
+
+                self._set_flux_face_data(fp.int_side, ldis_a, (el_a, fi_a))
+                self._set_flux_face_data(fp.ext_side, ldis_b, (el_b, fi_b))
+
+                # unify h across the faces
+                fp.int_side.h = fp.ext_side.h = max(
+                        fp.int_side.h, fp.ext_side.h)
+
+                # The exterior side is not a volume element of this face
+                # group--el_b gets its own face pair.
+                from hedge._internal import INVALID_ELEMENT
+                fp.ext_side.element_id = INVALID_ELEMENT
+
+                assert len(fp.__dict__) == 0
+                assert len(fp.int_side.__dict__) == 0
+                assert len(fp.ext_side.__dict__) == 0
+
+                fg.face_pairs.append(fp)
+
+        self.mixed_order_face_groups = []
+        for ldis, fg in sorted(ldis_to_fg.iteritems(),
+                key=lambda (ldis, fg): ldis.order):
+            fg.commit(self, ldis, ldis)
+            self.mixed_order_face_groups.append(fg)
+
+        self.mixed_order_trace = MixedOrderTrace(len(self.nodes), trace_rows)
 
     # }}}
 
@@ -711,56 +922,66 @@ class Discretization(TimestepCalculator):
         nodes = []
         vol_indices = []
         fg_type = StraightFaceGroup
-        face_group = fg_type(double_sided=False,
-                debug="ilist_generation" in self.debug)
-        ldis = None # if this boundary is empty, we might as well have no ldis
         el_face_to_face_group_and_face_pair = {}
 
+        # one face group per local discretization, each of which occupies
+        # a contiguous part of the boundary vector
+        ldis_to_faces = {}
         for ef in self.mesh.tag_to_boundary.get(tag, []):
             el, face_nr = ef
+            ldis_to_faces.setdefault(
+                    self.find_el_discretization(el.id), []).append(ef)
 
-            el_slice, ldis = self.find_el_data(el.id)
-            face_indices = ldis.face_indices()[face_nr]
-            face_indices_ary = numpy.array(face_indices, dtype=numpy.intp)
-
-            f_start = len(nodes)
-            nodes.extend(self.nodes[el_slice.start + face_indices_ary])
-            vol_indices.extend(el_slice.start + face_indices_ary)
-
-            # create the face pair
-            fp = face_group.FacePair()
-            fp.int_side.el_base_index = el_slice.start
-            fp.ext_side.el_base_index = f_start
-            fp.int_side.face_index_list_number = face_group.register_face_index_list(
-                    identifier=face_nr,
-                    generator=lambda: face_indices)
-            fp.ext_side.face_index_list_number = face_group.register_face_index_list(
-                    identifier=(),
-                    generator=lambda: tuple(xrange(len(face_indices))))
-            self._set_flux_face_data(fp.int_side, ldis, ef)
-
-            # check that all property assigns found their C++-side slots
-            assert len(fp.__dict__) == 0
-            assert len(fp.int_side.__dict__) == 0
-            assert len(fp.ext_side.__dict__) == 0
-
-            face_group.face_pairs.append(fp)
+        face_groups = []
+        fg_ranges = []
 
-            # and make it possible to find it later
-            el_face_to_face_group_and_face_pair[ef] = \
-                    face_group, len(face_group.face_pairs)-1
+        from hedge._internal import UniformElementRanges
+        for ldis, faces in sorted(ldis_to_faces.iteritems(),
+                key=lambda (ldis, faces): ldis.order):
+            face_group = fg_type(double_sided=False,
+                    debug="ilist_generation" in self.debug)
+            fg_start = len(nodes)
+
+            for ef in faces:
+                el, face_nr = ef
+
+                el_slice = self.find_el_range(el.id)
+                face_indices = ldis.face_indices()[face_nr]
+                face_indices_ary = numpy.array(face_indices, dtype=numpy.intp)
+
+                f_start = len(nodes)
+                nodes.extend(self.nodes[el_slice.start + face_indices_ary])
+                vol_indices.extend(el_slice.start + face_indices_ary)
+
+                # create the face pair
+                fp = face_group.FacePair()
+                fp.int_side.el_base_index = el_slice.start
+                fp.ext_side.el_base_index = f_start
+                fp.int_side.face_index_list_number = \
+                        face_group.register_face_index_list(
+                                identifier=face_nr,
+                                generator=lambda: face_indices)
+                fp.ext_side.face_index_list_number = \
+                        face_group.register_face_index_list(
+                                identifier=(),
+                                generator=lambda: tuple(xrange(len(face_indices))))
+                self._set_flux_face_data(fp.int_side, ldis, ef)
+
+                # check that all property assigns found their C++-side slots
+                assert len(fp.__dict__) == 0
+                assert len(fp.int_side.__dict__) == 0
+                assert len(fp.ext_side.__dict__) == 0
+
+                face_group.face_pairs.append(fp)
+
+                # and make it possible to find it later
+                el_face_to_face_group_and_face_pair[ef] = \
+                        face_group, len(face_group.face_pairs)-1
 
-        if ldis is not None:
             face_group.commit(self, ldis, ldis)
-            face_groups = [face_group]
-        else:
-            face_groups = []
-
-        from hedge._internal import UniformElementRanges
-        fg_ranges = [UniformElementRanges(
-            0, # FIXME: need to vary element starts
-            fg.ldis_loc.face_node_count(), len(face_group.face_pairs))
-            for fg in face_groups]
+            face_groups.append(face_group)
+            fg_ranges.append(UniformElementRanges(
+                fg_start, ldis.face_node_count(), len(face_group.face_pairs)))
 
         nodes_ary = numpy.array(nodes)
         nodes_ary.shape = (len(nodes), self.dimensions)
@@ -808,6 +1029,10 @@ class Discretization(TimestepCalculator):
         # }}}
 
         # {{{ process face groups
+        if self.mixed_order_face_groups:
+            raise NotImplementedError("quadrature on interfaces between "
+                    "elements of differing order")
+
         for fg in self.face_groups:
             quad_fg = type(fg)(double_sided=True,
                     debug="ilist_generation" in self.debug)
@@ -967,6 +1192,93 @@ class Discretization(TimestepCalculator):
             dtype = self.default_scalar_type
         return numpy.zeros(shape + (len(self.nodes),), dtype)
 
+    # {{{ per-element vectors
+    # Quantities that are constant on each element (such as geometric
+    # factors of straight elements) may be stored with one value per
+    # element, in the order in which the elements occur in volume vectors.
+
+    def per_element_empty(self, dtype=None):
+        if dtype is None:
+            dtype = self.default_scalar_type
+        return numpy.empty(len(self.mesh.elements), dtype)
+
+    def per_element_zeros(self, dtype=None):
+        if dtype is None:
+            dtype = self.default_scalar_type
+        return numpy.zeros(len(self.mesh.elements), dtype)
+
+    @memoize_method
+    def per_element_slices(self):
+        """Return a list of slices into per-element vectors, one for each
+        element group in :attr:`element_groups`.
+        """
+        result = []
+        start = 0
+        for eg in self.element_groups:
+            result.append(slice(start, start+len(eg.members)))
+            start += len(eg.members)
+
+        return result
+
+    def broadcast_per_element(self, vec):
+        """Return the volume vector that repeats each value of the
+        per-element vector *vec* at all nodes of its element.
+        """
+        result = self.volume_empty(dtype=vec.dtype)
+        for eg, el_slice in zip(self.element_groups, self.per_element_slices()):
+            eg.el_array_from_volume(result)[:] = vec[el_slice, numpy.newaxis]
+
+        return result
+
+    @memoize_method
+    def per_element_jacobians(self):
+        """Return a per-element vector of the jacobians of the
+        element maps.
+        """
+        result = self.per_element_empty()
+        for eg, el_slice in zip(self.element_groups, self.per_element_slices()):
+            result[el_slice] = [abs(el.map.jacobian()) for el in eg.members]
+
+        return result
+
+    @memoize_method
+    def per_element_inverse_metric_derivatives(self):
+        """Like :meth:`inverse_metric_derivatives`, but return per-element
+        vectors.
+        """
+        result = [[self.per_element_empty()
+                for i in range(self.dimensions)]
+                for i in range(self.dimensions)]
+
+        for eg, el_slice in zip(self.element_groups, self.per_element_slices()):
+            metric = self.inverse_metric_constants(eg)
+            for xyz_coord in range(self.dimensions):
+                for rst_coord in range(self.dimensions):
+                    result[xyz_coord][rst_coord][el_slice] = \
+                            metric[:, xyz_coord, rst_coord]
+
+        return result
+
+    @memoize_method
+    def per_element_forward_metric_derivatives(self):
+        """Like :meth:`forward_metric_derivatives`, but return per-element
+        vectors.
+        """
+        result = [[self.per_element_empty()
+                for i in range(self.dimensions)]
+                for i in range(self.dimensions)]
+
+        for eg, el_slice in zip(self.element_groups, self.per_element_slices()):
+            for xyz_coord in range(self.dimensions):
+                for rst_coord in range(self.dimensions):
+                    result[xyz_coord][rst_coord][el_slice] = [
+                            el.map.matrix[rst_coord, xyz_coord]
+                            for el in eg.members]
+
+        return result
+
+    # }}}
+
     def interpolate_volume_function(self, f, dtype=None, kind=None):
         if kind is None:
             kind = self.compute_kind
@@ -1107,7 +1419,8 @@ class Discretization(TimestepCalculator):
 
     # {{{ scalar reduction ----------------------------------------------------
     def nodewise_dot_product(self, a, b):
-        return numpy.dot(a, b)
+        from hedge.vector_primitives import accumulating_dot
+        return accumulating_dot(a, b)
 
     def _integral_projection(self):
         """Find a vector :math:`v` such that
@@ -1124,17 +1437,87 @@ class Discretization(TimestepCalculator):
     def mesh_volume(self):
         return self.integral(ones_on_volume(self))
 
+    @memoize_method
+    def _reduction_data(self):
+        """Return a list of tuples *(eg, mass_matrix, weights, jacobians)*,
+        one per element group. *weights* are the row sums of the reference
+        mass matrix, so that the dot product of an element's nodal values
+        with *weights*, times the element's jacobian, is the integral over
+        that element.
+        """
+        jacobians = self.per_element_jacobians()
+
+        return [(eg, eg.mass_matrix,
+            numpy.sum(eg.mass_matrix, axis=1),
+            numpy.asarray(jacobians[el_slice], dtype=numpy.float64))
+            for eg, el_slice in zip(
+                self.element_groups, self.per_element_slices())]
+
+    def _reduction_components(self, vec):
+        """Return the volume vectors making up *vec* as a list, or *None*
+        if *vec* is not a scalar or vector field of :mod:`numpy` arrays.
+        Zero components are returned as *None*.
+        """
+        from hedge.tools import log_shape, is_zero
+
+        ls = log_shape(vec)
+        if ls == ():
+            components = [vec]
+        elif len(ls) == 1:
+            components = list(vec)
+        else:
+            return None
+
+        result = []
+        for comp in components:
+            if is_zero(comp):
+                result.append(None)
+            elif (isinstance(comp, numpy.ndarray)
+                    and comp.shape == (len(self.nodes),)):
+                result.append(comp)
+            else:
+                return None
+
+        return result
+
+    @staticmethod
+    def _reduction_dtype(*vecs):
+        # accumulate in at least double precision
+        return numpy.result_type(numpy.float64, *[v.dtype for v in vecs])
+
+    def _integrate_components(self, components):
+        result = numpy.zeros(len(components),
+                dtype=self._reduction_dtype(
+                    *[c for c in components if c is not None]))
+
+        for eg, mmat, weights, jacobians in self._reduction_data():
+            for i, comp in enumerate(components):
+                if comp is not None:
+                    result[i] += numpy.einsum("en,n,e",
+                            eg.el_array_from_volume(comp), weights, jacobians,
+                            dtype=result.dtype)
+
+        return result
+
     def integral(self, volume_vector):
         from hedge.tools import log_shape
 
         ls = log_shape(volume_vector)
-        if ls == ():
-            if isinstance(volume_vector, (int, float, complex)):
-                # accept scalars as volume_vector
-                empty = self.volume_empty(dtype=type(volume_vector))
-                empty.fill(volume_vector)
-                volume_vector = empty
+        if ls == () and isinstance(volume_vector, (int, float, complex)):
+            # accept scalars as volume_vector
+            return volume_vector*self.mesh_volume()
+
+        components = self._reduction_components(volume_vector)
+        if components is not None:
+            if not [c for c in components if c is not None]:
+                return numpy.zeros(ls, dtype=float)
+
+            result = self._integrate_components(components)
+            if ls == ():
+                result, = result
+            return result
 
+        if ls == ():
             return self.nodewise_dot_product(
                     self._mass_integral_projection(), volume_vector)
         else:
@@ -1168,11 +1551,35 @@ class Discretization(TimestepCalculator):
             return self.integral(numpy.abs(volume_vector) ** p)**(1/p)
 
     def inner_product(self, a, b):
-        mass_op = self._compiled_mass_operator()
-
         from hedge.tools import log_shape
         ls = log_shape(a)
         assert log_shape(b) == ls
+
+        a_components = self._reduction_components(a)
+        b_components = self._reduction_components(b)
+        if a_components is not None and b_components is not None:
+            # The mass matrix is block-diagonal, so evaluate the quadratic
+            # form element group by element group, without a full-size
+            # temporary.
+            pairs = [(sub_a, sub_b)
+                    for sub_a, sub_b in zip(a_components, b_components)
+                    if sub_a is not None and sub_b is not None]
+            if not pairs:
+                return 0.
+
+            result = 0
+            for eg, mmat, weights, jacobians in self._reduction_data():
+                for sub_a, sub_b in pairs:
+                    result += numpy.einsum("en,en,e",
+                            eg.el_array_from_volume(sub_a),
+                            numpy.dot(eg.el_array_from_volume(sub_b), mmat),
+                            jacobians,
+                            dtype=self._reduction_dtype(sub_a, sub_b))
+
+            return float(result)
+
+        mass_op = self._compiled_mass_operator()
+
         if ls == ():
             return float(self.nodewise_dot_product(
                     a, mass_op(b)))
@@ -1242,9 +1649,7 @@ class Discretization(TimestepCalculator):
             """
 
             ldis = eg.local_discretization
-            basis_values = numpy.array([
-                phi(el.inverse_map(point))
-                for phi in ldis.basis_functions()])
+            basis_values, = ldis.basis_vandermonde([el.inverse_map(point)])
             vdm_t = ldis.vandermonde().T
             return _PointEvaluator(
                     discr=self,
@@ -1303,14 +1708,34 @@ class Discretization(TimestepCalculator):
     # }}}
 
     # {{{ op template execution -----------------------------------------------
+    @memoize_method
+    def get_optemplate_processing_cache(self):
+        """Return the :class:`hedge.optemplate.tools.OptemplateProcessingCache`
+        shared by all compilations on this discretization.
+        """
+        from hedge.optemplate.tools import OptemplateProcessingCache
+        return OptemplateProcessingCache()
+
     def compile(self, optemplate, post_bind_mapper=lambda x: x,
             type_hints={}):
         from hedge.optemplate.mappers import QuadratureUpsamplerRemover
         optemplate = QuadratureUpsamplerRemover(self.quad_min_degrees)(
                 optemplate)
 
-        ex = self.executor_class(self, optemplate, post_bind_mapper,
-                type_hints)
+        if self._code_cache is None:
+            code_cache_key = None
+        else:
+            code_cache_key = self._get_code_cache_key(
+                    optemplate, post_bind_mapper, type_hints)
+
+        if code_cache_key is not None and code_cache_key in self._code_cache:
+            ex = self.executor_class(self, optemplate, post_bind_mapper,
+                    type_hints, code=self._code_cache[code_cache_key].copy())
+        else:
+            ex = self.executor_class(self, optemplate, post_bind_mapper,
+                    type_hints)
+            if code_cache_key is not None:
+                self._code_cache[code_cache_key] = ex.code
 
         if "dump_dataflow_graph" in self.debug:
             ex.code.dump_dataflow_graph()
@@ -1319,6 +1744,22 @@ class Discretization(TimestepCalculator):
             ex.instrument()
         return ex
 
+    @staticmethod
+    def _get_code_cache_key(optemplate, post_bind_mapper, type_hints):
+        """Return a hashable key identifying the code compiled from the
+        given arguments to :meth:`compile`, or *None* if there is none.
+        """
+        if isinstance(optemplate, numpy.ndarray):
+            optemplate = (optemplate.shape, tuple(optemplate.flat))
+
+        key = (optemplate, post_bind_mapper,
+                frozenset(type_hints.iteritems()))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
     def add_function(self, name, func):
         self.exec_functions[name] = func
     # }}}
@@ -1334,7 +1775,14 @@ class SymmetryMap(object):
     is mapped onto itself by a nontrivial symmetry map M{f(.)}. Then
     this class allows you to carry out this map on vectors representing
     functions on this L{Discretization}.
+
+    The map is stored as an index array :attr:`gather_indices` such that
+    applying it amounts to ``vec[gather_indices]``.
     """
+
+    # bytes of node coordinate differences computed at once
+    chunk_bytes = 32 << 20
+
     def __init__(self, discr, sym_map, element_map, threshold=1e-13):
         self.discretization = discr
 
@@ -1343,32 +1791,79 @@ class SymmetryMap(object):
             complete_el_map[i] = j
             complete_el_map[j] = i
 
-        self.map = {}
+        # scatter_indices[i] is the index of the node onto which node i is
+        # mapped
+        scatter_indices = numpy.empty(len(discr.nodes), dtype=numpy.intp)
 
         for eg in discr.element_groups:
-            for el, el_slice in zip(eg.members, eg.ranges):
-                mapped_i_el = complete_el_map[el.id]
-                mapped_slice = discr.find_el_range(mapped_i_el)
-                for i_pt in range(el_slice.start, el_slice.stop):
-                    pt = discr.nodes[i_pt]
-                    mapped_pt = sym_map(pt)
-                    for m_i_pt in range(mapped_slice.start, mapped_slice.stop):
-                        if (la.norm(discr.nodes[m_i_pt] - mapped_pt)
-                                < threshold):
-                            self.map[i_pt] = m_i_pt
-                            break
-
-                    if i_pt not in self.map:
-                        for m_i_pt in range(
-                                mapped_slice.start, mapped_slice.stop):
-                            print la.norm_2(discr.nodes[m_i_pt] - mapped_pt)
-                        raise RuntimeError("no symmetry match found")
+            ldis = eg.local_discretization
+            el_count = len(eg.members)
+            node_count = ldis.node_count()
+            if not el_count:
+                continue
+
+            mapped_starts = numpy.empty(el_count, dtype=numpy.intp)
+            for i, el in enumerate(eg.members):
+                mapped_el_id = complete_el_map[el.id]
+                mapped_range, mapped_ldis = discr.find_el_data(mapped_el_id)
+                if mapped_ldis is not ldis:
+                    raise ValueError("element %d and its symmetric "
+                            "counterpart %d use different local "
+                            "discretizations" % (el.id, mapped_el_id))
+                mapped_starts[i] = mapped_range.start
+
+            group_start = eg.ranges.start
+            group_end = group_start + el_count*node_count
+            mapped_nodes = numpy.array(
+                    [sym_map(pt) for pt in discr.nodes[group_start:group_end]],
+                    dtype=discr.nodes.dtype).reshape(
+                            el_count, node_count, discr.dimensions)
+
+            # global indices of the nodes of each element's counterpart
+            target_indices = (mapped_starts[:, numpy.newaxis]
+                    + numpy.arange(node_count))
+
+            # the coordinate differences take up
+            # node_count**2 * dimensions floats per element
+            chunk_size = max(1, self.chunk_bytes // (
+                node_count**2 * discr.dimensions
+                * discr.nodes.dtype.itemsize))
+
+            for chunk_start in range(0, el_count, chunk_size):
+                chunk = slice(chunk_start, chunk_start+chunk_size)
+
+                distances = numpy.sum(
+                        (mapped_nodes[chunk, :, numpy.newaxis, :]
+                            - discr.nodes[target_indices[chunk]]
+                            [:, numpy.newaxis, :, :])**2,
+                        axis=-1)
+                closest = numpy.argmin(distances, axis=-1)
+                min_distances = numpy.sqrt(numpy.min(distances, axis=-1))
+
+                if (min_distances >= threshold).any():
+                    raise RuntimeError("no symmetry match found")
+
+                chunk_el_count = len(closest)
+                scatter_indices[
+                        group_start + chunk_start*node_count:
+                        group_start + (chunk_start+chunk_el_count)*node_count] = \
+                                target_indices[chunk][
+                                        numpy.arange(chunk_el_count)[
+                                            :, numpy.newaxis],
+                                        closest].ravel()
+
+        self.gather_indices = numpy.empty_like(scatter_indices)
+        self.gather_indices.fill(-1)
+        self.gather_indices[scatter_indices] = numpy.arange(
+                len(scatter_indices))
+
+        if (self.gather_indices < 0).any():
+            raise RuntimeError("symmetry map is not one-to-one")
 
     def __call__(self, vec):
-        result = self.discretization.volume_zeros()
-        for i, mapped_i in self.map.iteritems():
-            result[mapped_i] = vec[i]
-        return result
+        from pytools.obj_array import with_object_array_or_scalar
+        return with_object_array_or_scalar(
+                lambda subvec: subvec[..., self.gather_indices], vec)
 
 
 
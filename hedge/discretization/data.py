@@ -352,6 +352,54 @@ class StraightCurvedFaceGroup(hedge._internal.StraightCurvedFaceGroup):
 
 
 
+class MixedOrderTrace(object):
+    """Interpolates volume vectors to the face nodes of the interfaces
+    between elements of differing order, as seen from the opposite
+    element. The result is appended to volume vectors, so that the
+    exterior sides of
+    :attr:`hedge.discretization.Discretization.mixed_order_face_groups`
+    can refer to it like to volume nodes.
+
+    :ivar volume_node_count: the number of nodes of a volume vector.
+    :ivar node_count: the number of trace nodes.
+    """
+
+    def __init__(self, volume_node_count, rows):
+        """
+        :param rows: a list of tuples *(el_base, weights)*, one for each trace
+          node, such that the trace value is
+          ``numpy.dot(weights, vol[el_base:el_base+len(weights)])``.
+        """
+        self.volume_node_count = volume_node_count
+        self.node_count = len(rows)
+
+        # pad to the largest element size in use
+        width = max([len(weights) for el_base, weights in rows] + [0])
+        self.indices = numpy.zeros((len(rows), width), dtype=numpy.intp)
+        self.weights = numpy.zeros((len(rows), width), dtype=numpy.float64)
+
+        for i, (el_base, weights) in enumerate(rows):
+            self.indices[i, :len(weights)] = numpy.arange(
+                    el_base, el_base+len(weights))
+            self.weights[i, :len(weights)] = weights
+
+    def __call__(self, vol_vector):
+        """Return the trace values of *vol_vector*."""
+        return numpy.asarray(
+                numpy.sum(self.weights*vol_vector[self.indices], axis=1),
+                dtype=vol_vector.dtype)
+
+    def extend(self, vol_vector):
+        """Return a copy of *vol_vector* with its trace values appended."""
+        result = numpy.empty(self.volume_node_count+self.node_count,
+                dtype=vol_vector.dtype)
+        result[:self.volume_node_count] = vol_vector
+        result[self.volume_node_count:] = self(vol_vector)
+        return result
+
+
+
+
 # }}}
 # {{{ boundary ----------------------------------------------------------------
 class Boundary(object):
@@ -139,25 +139,61 @@ class LocalDiscretization(object):
 
     # }}}
 
+    # {{{ basis evaluation ----------------------------------------------------
+    def basis_vandermonde(self, points):
+        """Return the Vandermonde matrix of :meth:`basis_functions` at
+        *points*, a sequence of unit coordinate vectors.
+        """
+        from hedge.polynomial import generic_vandermonde
+        return generic_vandermonde(list(points), list(self.basis_functions()))
+
+    def grad_basis_vandermonde(self, points):
+        """Return the list of Vandermonde matrices of
+        :meth:`grad_basis_functions` at *points*, one per unit coordinate.
+        """
+        from hedge.polynomial import generic_multi_vandermonde
+        return generic_multi_vandermonde(
+                list(points), list(self.grad_basis_functions()))
+
+    def face_basis_vandermonde(self, points):
+        """Return the Vandermonde matrix of :meth:`face_basis` at *points*,
+        given in facial unit coordinates.
+        """
+        from hedge.polynomial import generic_vandermonde
+        return generic_vandermonde(list(points), list(self.face_basis()))
+
+    def get_persistent_matrix(self, name, node_sets, compute,
+            quadrature_degree=None):
+        """Return the matrix (or list of matrices) computed by *compute*,
+        which is determined by this element type and order, the nodes in
+        *node_sets* and *quadrature_degree*. The result is looked up in and
+        stored to the :class:`hedge.discretization.matrix_cache.MatrixCache`
+        under *name*.
+        """
+        from hedge.discretization.matrix_cache import \
+                get_matrix_cache, node_set_digest
+        return get_matrix_cache().get(
+                (type(self).__name__, getattr(self, "order", None),
+                    quadrature_degree, node_set_digest(*node_sets), name),
+                compute)
+
+    # }}}
+
     # {{{ matrices ------------------------------------------------------------
     @memoize_method
     def vandermonde(self):
-        from hedge.polynomial import generic_vandermonde
-
-        return generic_vandermonde(
-                list(self.unit_nodes()),
-                list(self.basis_functions()))
+        unit_nodes = self.unit_nodes()
+        return self.get_persistent_matrix("vandermonde", [unit_nodes],
+                lambda: self.basis_vandermonde(unit_nodes))
 
     @memoize_method
     def grad_vandermonde(self):
         """Compute the Vandermonde matrices of the grad_basis_functions().
         Return a list of these matrices."""
 
-        from hedge.polynomial import generic_multi_vandermonde
-
-        return generic_multi_vandermonde(
-                list(self.unit_nodes()),
-                list(self.grad_basis_functions()))
+        unit_nodes = self.unit_nodes()
+        return self.get_persistent_matrix("grad_vandermonde", [unit_nodes],
+                lambda: self.grad_basis_vandermonde(unit_nodes))
 
     def _assemble_multi_face_mass_matrix(self, face_mass_matrix):
         """Helper for the function below."""
@@ -202,6 +238,21 @@ class LocalDiscretization(object):
         return numpy.dot(self.inverse_mass_matrix(),
                 self.multi_face_mass_matrix())
 
+    @memoize_method
+    def interpolation_matrix_to(self, to_ldis):
+        """Return a matrix that maps nodal values on this local
+        discretization to nodal values on *to_ldis*, a local discretization
+        of the same element shape, but possibly of a different order.
+
+        If *to_ldis* is of lower order, this is not a projection, but
+        interpolation at the nodes of *to_ldis*.
+        """
+        from hedge.tools.linalg import leftsolve
+
+        return leftsolve(
+                self.vandermonde(),
+                self.basis_vandermonde(to_ldis.unit_nodes()))
+
     def find_diff_mat_permutation(self, target_idx):
         """Find a permuation *p* such that::
 
@@ -350,11 +401,10 @@ class PkSimplexDiscretization(OrthonormalLocalDiscretization):
 
     @memoize_method
     def face_vandermonde(self):
-        from hedge.polynomial import generic_vandermonde
-
-        return generic_vandermonde(
-                self.unit_face_nodes(),
-                self.face_basis())
+        unit_face_nodes = self.unit_face_nodes()
+        return self.get_persistent_matrix("face_vandermonde",
+                [unit_face_nodes],
+                lambda: self.face_basis_vandermonde(unit_face_nodes))
 
     @memoize_method
     def face_mass_matrix(self):
@@ -534,6 +584,25 @@ class PkSimplexDiscretization(OrthonormalLocalDiscretization):
         return generate_nonnegative_integer_tuples_summing_to_at_most(
                 self.order, self.dimensions)
 
+    def basis_vandermonde(self, points):
+        from hedge.polynomial import simplex_onb_vandermonde
+        return simplex_onb_vandermonde(self.dimensions,
+                self.generate_mode_identifiers(), points)
+
+    def grad_basis_vandermonde(self, points):
+        from hedge.polynomial import grad_simplex_onb_vandermonde
+        return grad_simplex_onb_vandermonde(self.dimensions,
+                self.generate_mode_identifiers(), points)
+
+    def face_basis_vandermonde(self, points):
+        from pytools import \
+                generate_nonnegative_integer_tuples_summing_to_at_most
+        from hedge.polynomial import simplex_onb_vandermonde
+        return simplex_onb_vandermonde(self.dimensions-1,
+                generate_nonnegative_integer_tuples_summing_to_at_most(
+                    self.order, self.dimensions-1),
+                points)
+
     # }}}
 
     # {{{ time step scaling ---------------------------------------------------
@@ -586,19 +655,21 @@ class PkSimplexDiscretization(OrthonormalLocalDiscretization):
                     for face_idx in range(self.ldis.face_count())]
 
         # {{{ matrices
+        def get_persistent_matrix(self, name, node_sets, compute):
+            return self.ldis.get_persistent_matrix(name, node_sets, compute,
+                    quadrature_degree=self.exact_to_degree)
+
         @memoize_method
         def vandermonde(self):
-            from hedge.polynomial import generic_vandermonde
-            return generic_vandermonde(
-                    self.volume_nodes,
-                    list(self.ldis.basis_functions()))
+            return self.get_persistent_matrix("vandermonde",
+                    [self.volume_nodes],
+                    lambda: self.ldis.basis_vandermonde(self.volume_nodes))
 
         @memoize_method
         def face_vandermonde(self):
-            from hedge.polynomial import generic_vandermonde
-            return generic_vandermonde(
-                    self.face_nodes,
-                    list(self.ldis.face_basis()))
+            return self.get_persistent_matrix("face_vandermonde",
+                    [self.face_nodes],
+                    lambda: self.ldis.face_basis_vandermonde(self.face_nodes))
 
         @memoize_method
         def volume_up_interpolation_matrix(self):
@@ -609,10 +680,9 @@ class PkSimplexDiscretization(OrthonormalLocalDiscretization):
 
         @memoize_method
         def diff_vandermonde_matrices(self):
-            from hedge.polynomial import generic_multi_vandermonde
-            return generic_multi_vandermonde(
-                    self.volume_nodes,
-                    list(self.ldis.grad_basis_functions()))
+            return self.get_persistent_matrix("diff_vandermonde",
+                    [self.volume_nodes],
+                    lambda: self.ldis.grad_basis_vandermonde(self.volume_nodes))
 
         @memoize_method
         def volume_to_face_up_interpolation_matrix(self):
@@ -624,20 +694,20 @@ class PkSimplexDiscretization(OrthonormalLocalDiscretization):
             """
             ldis = self.ldis
 
-            face_maps = ldis.face_affine_maps()
+            def compute():
+                face_maps = ldis.face_affine_maps()
 
-            from pytools import flatten
-            face_nodes = list(flatten(
-                    [face_map(qnode) for qnode in self.face_nodes]
-                    for face_map in face_maps))
+                from pytools import flatten
+                face_nodes = list(flatten(
+                        [face_map(qnode) for qnode in self.face_nodes]
+                        for face_map in face_maps))
 
-            from hedge.polynomial import generic_vandermonde
-            vdm = generic_vandermonde(
-                    face_nodes,
-                    list(ldis.basis_functions()))
+                from hedge.tools.linalg import leftsolve
+                return leftsolve(ldis.vandermonde(),
+                        ldis.basis_vandermonde(face_nodes))
 
-            from hedge.tools.linalg import leftsolve
-            return leftsolve(self.ldis.vandermonde(), vdm)
+            return self.get_persistent_matrix("volume_to_face_up_interpolation",
+                    [ldis.unit_nodes(), self.face_nodes], compute)
 
         @memoize_method
         def face_up_interpolation_matrix(self):
@@ -0,0 +1,173 @@
+"""Persistent cache of reference element matrices."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+
+import os
+import numpy
+
+
+
+
+def node_set_digest(*node_sets):
+    """Return a string identifying the coordinates of all nodes in
+    *node_sets*, each of which is a sequence of node coordinate arrays.
+    """
+    from hashlib import sha1
+    checksum = sha1()
+    for nodes in node_sets:
+        nodes = numpy.ascontiguousarray(
+                numpy.array(list(nodes), dtype=numpy.float64))
+        checksum.update(str(nodes.shape))
+        checksum.update(nodes.tostring())
+    return checksum.hexdigest()
+
+
+
+
+def default_cache_dir():
+    """Return the value of ``$HEDGE_MATRIX_CACHE_DIR`` or, if that is not
+    set, the directory ``matrix-cache`` in ``$HEDGE_CACHE_DIR`` (which
+    defaults to ``~/.hedge``).
+    """
+    try:
+        return os.environ["HEDGE_MATRIX_CACHE_DIR"]
+    except KeyError:
+        return os.path.join(
+                os.environ.get("HEDGE_CACHE_DIR",
+                    os.path.join(os.path.expanduser("~"), ".hedge")),
+                "matrix-cache")
+
+
+
+
+class MatrixCache(object):
+    """A mapping from keys to arrays or lists of arrays, backed by one
+    ``.npz`` file per entry in a directory, so that reference matrices
+    need to be computed only once per machine rather than once per process.
+
+    Keys are tuples of strings, numbers and *None*, such as
+    *(element type, order, quadrature degree, node set digest, name)*.
+    See :func:`node_set_digest`.
+    """
+
+    # increment to invalidate all stored entries
+    version = 1
+
+    def __init__(self, dirname=None, persistent=True):
+        if dirname is None:
+            dirname = default_cache_dir()
+
+        self.dirname = dirname
+        self.persistent = persistent
+
+    def _filename(self, key):
+        from hashlib import sha1
+        return os.path.join(self.dirname,
+                sha1(repr((self.version,) + tuple(key))).hexdigest()
+                + ".npz")
+
+    def load(self, key):
+        """Return the entry stored under *key*, or *None*."""
+        try:
+            inf = open(self._filename(key), "rb")
+        except IOError:
+            return None
+
+        try:
+            try:
+                data = numpy.load(inf)
+                arrays = [data["arr_%d" % i] for i in range(len(data.files)-1)]
+                is_list = bool(data["is_list"])
+            except Exception:
+                from warnings import warn
+                warn("ignoring corrupt matrix cache entry '%s'"
+                        % self._filename(key))
+                return None
+        finally:
+            inf.close()
+
+        if is_list:
+            return arrays
+        else:
+            array, = arrays
+            return array
+
+    def store(self, key, value):
+        if isinstance(value, list):
+            arrays = value
+        else:
+            arrays = [value]
+
+        if not os.path.isdir(self.dirname):
+            try:
+                os.makedirs(self.dirname)
+            except OSError:
+                # another process may have created it in the meantime
+                if not os.path.isdir(self.dirname):
+                    raise
+
+        # write-then-rename, so that concurrent processes never see a
+        # partially-written file
+        filename = self._filename(key)
+        tmp_filename = "%s.%d.tmp" % (filename, os.getpid())
+        outf = open(tmp_filename, "wb")
+        try:
+            numpy.savez(outf, *arrays, is_list=isinstance(value, list))
+        finally:
+            outf.close()
+        os.rename(tmp_filename, filename)
+
+    def get(self, key, compute):
+        """Return the entry stored under *key*. If there is none, compute
+        it by calling *compute* and store it.
+        """
+        if not self.persistent:
+            return compute()
+
+        result = self.load(key)
+        if result is None:
+            result = compute()
+            try:
+                self.store(key, result)
+            except (IOError, OSError), e:
+                from warnings import warn
+                warn("could not write matrix cache entry: %s" % e)
+
+        return result
+
+
+
+
+_cache = []
+
+def get_matrix_cache():
+    """Return the process-wide :class:`MatrixCache`."""
+    if not _cache:
+        _cache.append(MatrixCache())
+
+    return _cache[0]
@@ -29,6 +29,8 @@ THE SOFTWARE.
 
 
 import numpy
+import numpy.linalg as la
+from pytools import memoize
 
 
 
@@ -101,6 +103,284 @@ class DiagonalPreconditioner(OperatorBase):
 
 
 
+def _nearby_nodes(adjacency, node, distance):
+    """Return the set of nodes at most *distance* hops from *node* in the
+    graph *adjacency*, including *node* itself.
+    """
+    nearby = set([node])
+    for i in range(distance):
+        nearby.update([nb
+            for other in list(nearby)
+            for nb in adjacency.get(other, ())])
+
+    return nearby
+
+
+
+
+def _greedy_coloring(adjacency, nodes, distance=1):
+    """Return a dictionary assigning a color number to each of *nodes*
+    such that no two nodes that are at most *distance* hops apart in the
+    graph *adjacency* (a mapping from nodes to their neighbors) share a
+    color. Paths may pass through nodes not in *nodes*.
+    """
+    colors = {}
+    for node in nodes:
+        taken = set(colors[other]
+                for other in _nearby_nodes(adjacency, node, distance)
+                if other in colors)
+        color = 0
+        while color in taken:
+            color += 1
+        colors[node] = color
+
+    return colors
+
+
+
+
+def _element_probe_rounds(pcon, discr, distance):
+    """Return a list of lists of element numbers, such that no two elements
+    of a round are at most *distance* element adjacencies apart.
+
+    Hence, applying an operator that couples elements at most *distance*
+    apart to a vector that is nonzero only on the elements of one round
+    gives, on each of these elements, the response to that element's data
+    alone.
+
+    In parallel, the number of rounds agrees across ranks, and elements
+    near rank boundaries are only probed while no rank at most *distance*
+    rank adjacencies away probes theirs. (A path of *distance* element
+    adjacencies crosses at most *distance* rank boundaries.)
+    """
+    adjacency = discr.mesh.element_adjacency_graph()
+    el_count = len(discr.mesh.elements)
+
+    comm = pcon.communicator
+
+    near_rank_boundary = set()
+    if comm is not None:
+        from hedge.mesh import TAG_RANK_BOUNDARY
+        for rank in discr.neighbor_ranks:
+            for el, face_nr in discr.mesh.tag_to_boundary.get(
+                    TAG_RANK_BOUNDARY(rank), []):
+                near_rank_boundary.add(el.id)
+
+        for i in range(distance):
+            near_rank_boundary.update([nb
+                for el_id in list(near_rank_boundary)
+                for nb in adjacency.get(el_id, ())])
+
+    interior_colors = _greedy_coloring(adjacency,
+            [el_id for el_id in xrange(el_count)
+                if el_id not in near_rank_boundary],
+            distance=distance)
+    near_colors = _greedy_coloring(adjacency,
+            sorted(near_rank_boundary), distance=distance)
+
+    def color_count(colors):
+        if colors:
+            return max(colors.itervalues()) + 1
+        else:
+            return 0
+
+    interior_color_count = color_count(interior_colors)
+    near_color_count = color_count(near_colors)
+
+    if comm is None:
+        rank_color = 0
+        rank_color_count = 1
+    else:
+        import pytools.mpiwrap as mpi
+        interior_color_count = comm.allreduce(interior_color_count, op=mpi.MAX)
+        near_color_count = comm.allreduce(near_color_count, op=mpi.MAX)
+
+        all_neighbor_ranks = comm.allgather(list(discr.neighbor_ranks))
+        rank_colors = _greedy_coloring(
+                dict(enumerate(all_neighbor_ranks)),
+                range(len(all_neighbor_ranks)), distance=distance)
+        rank_color = rank_colors[comm.rank]
+        rank_color_count = color_count(rank_colors)
+
+    rounds = [[] for i in range(
+        interior_color_count + rank_color_count*near_color_count)]
+
+    for el_id, color in interior_colors.iteritems():
+        rounds[color].append(el_id)
+    for el_id, color in near_colors.iteritems():
+        rounds[interior_color_count
+                + rank_color*near_color_count + color].append(el_id)
+
+    return rounds
+
+
+
+
+def probe_element_blocks(pcon, discr, operator, stencil_hops=2):
+    """Return a dictionary mapping each element group of *discr* to an
+    array of shape *(element_count, nodes_per_element, nodes_per_element)*
+    holding the diagonal (element-to-itself) blocks of the linear *operator*.
+
+    The blocks are obtained by applying *operator* to colored unit vectors,
+    so that (for a fixed stencil) the number of operator applications does
+    not grow with the number of elements. In parallel, this must be called
+    on all ranks.
+    """
+    rounds = _element_probe_rounds(pcon, discr, stencil_hops)
+
+    node_count = max(eg.local_discretization.node_count()
+            for eg in discr.element_groups)
+    if pcon.communicator is not None:
+        import pytools.mpiwrap as mpi
+        node_count = pcon.communicator.allreduce(node_count, op=mpi.MAX)
+
+    blocks = {}
+    for eg in discr.element_groups:
+        ldis = eg.local_discretization
+        blocks[eg] = numpy.zeros(
+                (len(eg.members), ldis.node_count(), ldis.node_count()),
+                dtype=operator.dtype)
+
+    for round_el_ids in rounds:
+        group_el_indices = {}
+        for el_id in round_el_ids:
+            eg, idx = discr.group_map[el_id]
+            group_el_indices.setdefault(eg, []).append(idx)
+
+        group_el_indices = [
+                (eg, numpy.array(indices, dtype=numpy.intp))
+                for eg, indices in group_el_indices.iteritems()]
+
+        for i_node in range(node_count):
+            probe = discr.volume_zeros(dtype=operator.dtype)
+            for eg, indices in group_el_indices:
+                if i_node < eg.local_discretization.node_count():
+                    eg.el_array_from_volume(probe)[indices, i_node] = 1
+
+            response = operator(probe)
+
+            for eg, indices in group_el_indices:
+                if i_node < eg.local_discretization.node_count():
+                    blocks[eg][indices, :, i_node] = \
+                            eg.el_array_from_volume(response)[indices]
+
+    return blocks
+
+
+
+
+def assemble_sparse_matrix(pcon, discr, operator, stencil_hops=2, dtype=None):
+    """Return a :class:`scipy.sparse.csr_matrix` representing the linear
+    *operator* on volume vectors of *discr*.
+
+    Instead of applying *operator* to every unit vector, this applies it to
+    colored unit vectors, where elements whose stencils overlap never
+    share a color. The number of operator applications is thus independent
+    of the number of elements.
+
+    :param stencil_hops: the maximum number of element adjacencies across
+      which *operator* couples elements. This is two for LDG.
+    :param dtype: the scalar type of the probe vectors. Defaults to
+      *operator.dtype*.
+    """
+    if dtype is None:
+        dtype = operator.dtype
+
+    if pcon.communicator is not None:
+        raise NotImplementedError("assembling sparse matrices in parallel")
+
+    adjacency = discr.mesh.element_adjacency_graph()
+
+    def neighborhood_indices(el_id):
+        el_ranges = [discr.find_el_range(nb)
+                for nb in sorted(_nearby_nodes(adjacency, el_id, stencil_hops))]
+        return numpy.hstack([
+            numpy.arange(rng.start, rng.stop, dtype=numpy.intp)
+            for rng in el_ranges])
+
+    node_count = max(eg.local_discretization.node_count()
+            for eg in discr.element_groups)
+
+    rows = []
+    cols = []
+    values = []
+
+    for round_el_ids in _element_probe_rounds(
+            pcon, discr, 2*stencil_hops):
+        round_data = [
+                (discr.find_el_range(el_id),
+                    discr.find_el_discretization(el_id).node_count(),
+                    neighborhood_indices(el_id))
+                for el_id in round_el_ids]
+
+        for i_node in range(node_count):
+            probe = discr.volume_zeros(dtype=dtype)
+            for el_range, el_node_count, nbhd_indices in round_data:
+                if i_node < el_node_count:
+                    probe[el_range.start + i_node] = 1
+
+            response = operator(probe)
+
+            for el_range, el_node_count, nbhd_indices in round_data:
+                if i_node < el_node_count:
+                    rows.append(nbhd_indices)
+                    cols.append(numpy.empty_like(nbhd_indices))
+                    cols[-1].fill(el_range.start + i_node)
+                    values.append(response[nbhd_indices])
+
+    import scipy.sparse as sp
+    n = len(discr)
+    return sp.coo_matrix(
+            (numpy.hstack(values), (numpy.hstack(rows), numpy.hstack(cols))),
+            shape=(n, n)).tocsr()
+
+
+
+
+class BlockJacobiPreconditioner(OperatorBase):
+    """Applies the inverses of the element-diagonal blocks of a linear
+    operator on volume vectors of *discr*, e.g. a
+    :class:`hedge.models.poisson.BoundPoissonOperator`.
+
+    The blocks include the element's own contributions through its faces.
+    They are found by :func:`probe_element_blocks` and inverted once per
+    element group.
+
+    :param stencil_hops: the maximum number of element adjacencies across
+      which *operator* couples elements. This is two for LDG, whose
+      auxiliary variable involves one more neighbor than the primal one.
+    """
+
+    def __init__(self, pcon, discr, operator, stencil_hops=2):
+        self.discr = discr
+        self.my_dtype = numpy.dtype(operator.dtype)
+
+        self.inverse_blocks = [
+                (eg, la.inv(blocks))
+                for eg, blocks in probe_element_blocks(
+                    pcon, discr, operator, stencil_hops).iteritems()]
+
+    @property
+    def dtype(self):
+        return self.my_dtype
+
+    @property
+    def shape(self):
+        n = len(self.discr)
+        return n, n
+
+    def __call__(self, operand):
+        result = self.discr.volume_zeros(dtype=self.dtype)
+
+        for eg, inv_blocks in self.inverse_blocks:
+            eg.el_array_from_volume(result)[:] = numpy.einsum(
+                    "eij,ej->ei", inv_blocks, eg.el_array_from_volume(operand))
+
+        return result
+
+
+
+
 class ConvergenceError(RuntimeError):
     pass
 
@@ -218,3 +498,387 @@ def parallel_cg(pcon, operator, b, precon=None, x=None, tol=1e-7, max_iterations
         debug = False
 
     return cg.run(max_iterations, tol, debug_callback, debug)
+
+
+
+
+# {{{ communication-avoiding Krylov solvers -----------------------------------
+@memoize
+def _get_lincomb_kernel(result_dtype, scalar_dtype, vector_dtype, arg_count):
+    from codepy.elementwise import \
+            make_linear_comb_kernel_with_result_dtype
+    return make_linear_comb_kernel_with_result_dtype(
+            result_dtype,
+            (scalar_dtype,)*arg_count,
+            (vector_dtype,)*arg_count)
+
+
+
+
+def _lincomb_into(result, *args):
+    """Set *result* to *factor0*vec0 + factor1*vec1 + ...*, given the
+    *(factor, vec)* pairs *args*, in a single pass and without allocating
+    temporaries. *result* may be one of the *vec*s.
+    """
+    from pytools import single_valued, flatten
+    vector_dtype = single_valued(vec.dtype for fac, vec in args)
+    scalar_dtype = numpy.array([fac for fac, vec in args]).dtype
+
+    _get_lincomb_kernel(result.dtype, scalar_dtype, vector_dtype, len(args))(
+            result, *tuple(flatten(args)))
+
+
+
+
+class _FusedInnerProducts(object):
+    """Computes several inner products at once, with a single (and, where
+    the communicator supports it, nonblocking) global reduction.
+    """
+
+    def __init__(self, pcon, local_dot=None):
+        self.communicator = pcon.communicator
+
+        if local_dot is None:
+            local_dot = numpy.dot
+        self.local_dot = local_dot
+
+    def start(self, pairs):
+        """Start computing the inner products *(a, b)* (conjugate-linear in
+        *a*) for the pairs *(a, b)* in *pairs*. Return a
+        :class:`hedge.tools.futures.Future` for a :mod:`numpy` array of
+        the results.
+        """
+        local_values = numpy.array([
+            self.local_dot(a.conj(), b) for a, b in pairs])
+
+        from hedge.tools.futures import ImmediateFuture
+        comm = self.communicator
+        if comm is None:
+            return ImmediateFuture(local_values)
+
+        if hasattr(comm, "iallreduce"):
+            return _RequestFuture(comm.iallreduce(local_values))
+        else:
+            return ImmediateFuture(comm.allreduce(local_values))
+
+
+
+
+class _RequestFuture(object):
+    """A :class:`hedge.tools.futures.Future` for the result of a
+    nonblocking MPI request."""
+
+    def __init__(self, request):
+        self.request = request
+
+    def is_ready(self):
+        return self.request.test()[0]
+
+    def __call__(self):
+        return self.request.wait()
+
+
+
+
+def parallel_pipelined_cg(pcon, operator, b, precon=None, x=None, tol=1e-7,
+        max_iterations=None, debug=False, local_dot=None):
+    """Solve *operator(x) = b* for a symmetric positive definite *operator*
+    by the pipelined preconditioned conjugate gradient method of Ghysels
+    and Vanroose (Parallel Computing 40 (2014) 224-238).
+
+    Unlike :func:`parallel_cg`, this needs only one global reduction per
+    iteration, and overlaps it with the application of *precon* and
+    *operator*. This makes it preferable when reductions are expensive,
+    i.e. on many ranks, at the cost of four more vectors and slightly
+    worse round-off behavior. The vector updates are done in place by
+    fused kernels.
+
+    :param local_dot: computes the rank-local part of an inner product.
+      Defaults to :func:`numpy.dot`. The reduction across ranks is done
+      by this routine.
+    """
+    if precon is None:
+        precon = IdentityOperator(operator.dtype, operator.shape[0])
+    if x is None:
+        x = numpy.zeros((operator.shape[1],), dtype=b.dtype)
+    if max_iterations is None:
+        max_iterations = 10 * operator.shape[0]
+    if not pcon.is_head_rank:
+        debug = False
+
+    dots = _FusedInnerProducts(pcon, local_dot)
+
+    def apply_precon(v):
+        # The recurrence vectors are updated in place, so the preconditioned
+        # vectors must not share storage with their operands, as they would
+        # for the identity.
+        result = precon(v)
+        if result is v:
+            result = v.copy()
+        return result
+
+    r = b - operator(x)
+    u = apply_precon(r)
+    w = operator(u)
+    p = numpy.zeros_like(r)
+    s = numpy.zeros_like(r)
+    q = numpy.zeros_like(r)
+    z = numpy.zeros_like(r)
+
+    def replace_residual():
+        # recompute the recurrence vectors from their definitions to stop
+        # the accumulation of round-off
+        r = b - operator(x)
+        u = apply_precon(r)
+        s = operator(p)
+        q = apply_precon(s)
+        return r, u, operator(u), s, q, operator(q)
+
+    gamma_0 = None
+    iterations = 0
+    while iterations < max_iterations:
+        ip_future = dots.start([(r, u), (w, u)])
+        m = apply_precon(w)
+        n = operator(m)
+        gamma, delta = ip_future()
+
+        if gamma_0 is None:
+            gamma_0 = gamma
+            if gamma_0 == 0:
+                return x
+
+        if abs(gamma) < tol*tol * abs(gamma_0):
+            r, u, w, s, q, z = replace_residual()
+            gamma = dots.start([(r, u)])()[0]
+            if abs(gamma) < tol*tol * abs(gamma_0):
+                if debug:
+                    print "%d iterations" % iterations
+                return x
+
+            iterations += 1
+            continue
+
+        if iterations:
+            beta = gamma / gamma_old
+            alpha = gamma / (delta - beta*gamma/alpha)
+        else:
+            beta = 0
+            alpha = gamma / delta
+
+        _lincomb_into(z, (1, n), (beta, z))
+        _lincomb_into(q, (1, m), (beta, q))
+        _lincomb_into(s, (1, w), (beta, s))
+        _lincomb_into(p, (1, u), (beta, p))
+
+        _lincomb_into(x, (1, x), (alpha, p))
+        _lincomb_into(r, (1, r), (-alpha, s))
+        _lincomb_into(u, (1, u), (-alpha, q))
+        _lincomb_into(w, (1, w), (-alpha, z))
+
+        gamma_old = gamma
+
+        if iterations % 50 == 49:
+            r, u, w, s, q, z = replace_residual()
+
+        if debug and iterations % debug == 0:
+            print "debug: delta=%g" % abs(gamma)
+        iterations += 1
+
+    raise ConvergenceError("pipelined cg failed to converge")
+
+
+
+
+def parallel_bicgstab(pcon, operator, b, precon=None, x=None, tol=1e-7,
+        max_iterations=None, debug=False, local_dot=None):
+    """Solve *operator(x) = b* for a general (e.g. nonsymmetric) *operator*
+    by the right-preconditioned stabilized biconjugate gradient method
+    (BiCGStab).
+
+    The inner products that determine the stabilization step, the next
+    search direction and the residual norm are computed together, so that
+    each iteration needs two global reductions instead of the usual four.
+    The vector updates are done in place by fused kernels.
+
+    :param local_dot: as in :func:`parallel_pipelined_cg`.
+    """
+    if precon is None:
+        precon = IdentityOperator(operator.dtype, operator.shape[0])
+    if x is None:
+        x = numpy.zeros((operator.shape[1],), dtype=b.dtype)
+    if max_iterations is None:
+        max_iterations = 10 * operator.shape[0]
+    if not pcon.is_head_rank:
+        debug = False
+
+    dots = _FusedInnerProducts(pcon, local_dot)
+
+    r = b - operator(x)
+    r_hat = r.copy()
+    rho, rr, rr_0 = dots.start([(r_hat, r), (r, r), (b, b)])()
+    if rr_0 == 0:
+        return x
+
+    p = numpy.zeros_like(r)
+    v = numpy.zeros_like(r)
+    s = numpy.empty_like(r)
+    alpha = omega = rho_old = 1
+
+    iterations = 0
+    while iterations < max_iterations:
+        if abs(rr) < tol*tol * abs(rr_0):
+            r = b - operator(x)
+            rho, rr = dots.start([(r_hat, r), (r, r)])()
+            if abs(rr) < tol*tol * abs(rr_0):
+                if debug:
+                    print "%d iterations" % iterations
+                return x
+
+            # converged only in the recurrences--restart
+            r_hat = r.copy()
+            rho = rr
+            p.fill(0)
+            v.fill(0)
+            alpha = omega = rho_old = 1
+
+        if rho == 0:
+            raise ConvergenceError("bicgstab broke down")
+
+        beta = (rho/rho_old) * (alpha/omega)
+        _lincomb_into(p, (1, r), (beta, p), (-beta*omega, v))
+
+        p_hat = precon(p)
+        v = operator(p_hat)
+        alpha = rho / dots.start([(r_hat, v)])()[0]
+
+        _lincomb_into(s, (1, r), (-alpha, v))
+        s_hat = precon(s)
+        t = operator(s_hat)
+
+        ts, tt, rs, rt, ss = dots.start([
+            (t, s), (t, t), (r_hat, s), (r_hat, t), (s, s)])()
+        omega = ts / tt
+
+        _lincomb_into(x, (1, x), (alpha, p_hat), (omega, s_hat))
+        _lincomb_into(r, (1, s), (-omega, t))
+
+        rho_old = rho
+        rho = rs - omega*rt
+        rr = (ss - 2*(omega*ts.conjugate()).real + abs(omega)**2*tt).real
+
+        if debug and iterations % debug == 0:
+            print "debug: residual=%g" % abs(rr)
+        iterations += 1
+
+    raise ConvergenceError("bicgstab failed to converge")
+
+# }}}
+
+
+
+
+class OrderProlongation(object):
+    """Interpolates volume vectors from *coarse_discr* to *fine_discr*, two
+    discretizations of the same mesh that differ only in polynomial order.
+    The transpose, available as :meth:`restrict`, maps residuals (i.e.
+    mass-weighted quantities) back.
+    """
+
+    def __init__(self, fine_discr, coarse_discr):
+        self.fine_discr = fine_discr
+        self.coarse_discr = coarse_discr
+
+        self.group_matrices = [
+                (fine_eg, coarse_eg,
+                    coarse_eg.local_discretization.interpolation_matrix_to(
+                        fine_eg.local_discretization))
+                for fine_eg, coarse_eg in zip(
+                    fine_discr.element_groups, coarse_discr.element_groups)]
+
+    def __call__(self, coarse_vec):
+        result = self.fine_discr.volume_zeros(dtype=coarse_vec.dtype)
+
+        for fine_eg, coarse_eg, mat in self.group_matrices:
+            fine_eg.el_array_from_volume(result)[:] = numpy.dot(
+                    coarse_eg.el_array_from_volume(coarse_vec), mat.T)
+
+        return result
+
+    def restrict(self, fine_vec):
+        result = self.coarse_discr.volume_zeros(dtype=fine_vec.dtype)
+
+        for fine_eg, coarse_eg, mat in self.group_matrices:
+            coarse_eg.el_array_from_volume(result)[:] = numpy.dot(
+                    fine_eg.el_array_from_volume(fine_vec), mat)
+
+        return result
+
+
+
+
+class PMultigridPreconditioner(OperatorBase):
+    """A multigrid V-cycle across polynomial orders, for use as a
+    preconditioner with :func:`parallel_cg`.
+
+    :param levels: a list of *(discr, operator)* tuples, ordered from the
+      finest (i.e. the one being preconditioned) to the coarsest order.
+      All discretizations must share the same mesh.
+    :param smoothing_steps: number of damped block-Jacobi steps before
+      and after each coarse-grid correction. Using the same number on both
+      sides keeps the preconditioner symmetric.
+    :param coarse_tol: relative tolerance for the (preconditioned
+      conjugate gradient) solve on the coarsest level.
+
+    On the coarsest level, a Krylov solve to a finite tolerance makes the
+    preconditioner slightly nonlinear. In practice, a tolerance somewhat
+    tighter than the outer one is sufficient.
+    """
+
+    def __init__(self, pcon, levels, smoothing_steps=2, damping=0.7,
+            coarse_tol=1e-8):
+        self.pcon = pcon
+        self.levels = levels
+        self.smoothing_steps = smoothing_steps
+        self.damping = damping
+        self.coarse_tol = coarse_tol
+
+        self.smoothers = [
+                BlockJacobiPreconditioner(pcon, discr, operator)
+                for discr, operator in levels]
+        self.prolongations = [
+                OrderProlongation(fine_discr, coarse_discr)
+                for (fine_discr, fine_op), (coarse_discr, coarse_op)
+                in zip(levels[:-1], levels[1:])]
+
+    @property
+    def dtype(self):
+        return self.levels[0][1].dtype
+
+    @property
+    def shape(self):
+        return self.levels[0][1].shape
+
+    def v_cycle(self, level, rhs):
+        discr, operator = self.levels[level]
+        smoother = self.smoothers[level]
+
+        if level == len(self.levels) - 1:
+            return parallel_cg(self.pcon, operator, rhs,
+                    precon=smoother, tol=self.coarse_tol,
+                    dot=discr.nodewise_dot_product)
+
+        def smooth(x):
+            for i in range(self.smoothing_steps):
+                x = x + self.damping*smoother(rhs - operator(x))
+            return x
+
+        x = smooth(discr.volume_zeros(dtype=rhs.dtype))
+
+        prolongation = self.prolongations[level]
+        x = x + prolongation(self.v_cycle(level+1,
+            prolongation.restrict(rhs - operator(x))))
+
+        return smooth(x)
+
+    def __call__(self, operand):
+        return self.v_cycle(0, operand)
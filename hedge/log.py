@@ -133,6 +133,203 @@ class LpNorm(LogQuantity):
 
 
 
+# compiled diagnostics --------------------------------------------------------
+class DiagnosticsPipeline(object):
+    """Evaluates a set of log quantities given as operator templates
+    together.
+
+    All the templates are compiled into a single operator, so that
+    subexpressions such as mass matrix applications are shared and the
+    fields are traversed once. The resulting reductions are performed in
+    one pass and, on distributed discretizations, combined by a single
+    collective operation.
+
+    The log quantities obtained from :meth:`integral`, :meth:`integrals` and
+    :meth:`norm` trigger an evaluation of the whole pipeline the first time
+    one of them is queried in a step. To sample only every *k* steps,
+    add them to the :class:`pytools.log.LogManager` with ``interval=k``.
+
+    :param variables: a dictionary mapping variable names used in the
+      templates to argumentless callables returning the variable's
+      current value.
+    :param mgr: a :class:`pytools.log.LogManager`. If given, steps are
+      counted by its tick count.
+    :param step_getter: an argumentless callable returning the current
+      step number, overriding *mgr*. If neither is given, the pipeline
+      is evaluated anew for each query.
+    """
+
+    def __init__(self, discr, variables, mgr=None, step_getter=None):
+        self.discr = discr
+        self.variables = variables
+
+        if step_getter is None and mgr is not None:
+            step_getter = lambda: mgr.tick_count
+        self.step_getter = step_getter
+
+        # list of (kind, density template), where kind is one of
+        # "integral" (mass-weighted sum), "sum", "max"
+        self.reductions = []
+
+        self.compiled = None
+        self.values = None
+        self.values_step = None
+
+    def _add_reductions(self, kind, exprs):
+        start = len(self.reductions)
+        self.reductions.extend((kind, expr) for expr in exprs)
+        self.compiled = None
+        return range(start, len(self.reductions))
+
+    def _evaluate(self):
+        if self.compiled is None:
+            from pytools.obj_array import join_fields
+            self.compiled = self.discr.compile(join_fields(
+                *[expr for kind, expr in self.reductions]))
+
+        densities = self.compiled(**dict(
+            (name, getter()) for name, getter in self.variables.iteritems()))
+
+        subdiscr = getattr(self.discr, "subdiscr", None)
+        if subdiscr is None:
+            local_discr = self.discr
+        else:
+            local_discr = subdiscr
+
+        is_max = numpy.array([kind == "max" for kind, expr in self.reductions])
+        values = numpy.empty(len(self.reductions))
+        for i, ((kind, expr), density) in enumerate(
+                zip(self.reductions, densities)):
+            if kind == "integral":
+                values[i] = local_discr.integral(density)
+            elif kind == "sum":
+                values[i] = numpy.sum(density)
+            elif kind == "max":
+                values[i] = numpy.max(density)
+            else:
+                raise ValueError("invalid reduction kind: %s" % kind)
+
+        if subdiscr is not None:
+            def combine(a, b):
+                return numpy.where(is_max, numpy.maximum(a, b), a + b)
+
+            values = self.discr.context.communicator.allreduce(
+                    values, op=combine)
+
+        return values
+
+    def get_values(self, quantity, indices):
+        """Return the values of the reductions numbered *indices* for
+        *quantity*, evaluating the pipeline if it has not yet been
+        evaluated in the current step.
+        """
+        if self.step_getter is None:
+            step = None
+        else:
+            step = self.step_getter()
+
+        if self.values is None or step is None or step != self.values_step:
+            self.values = self._evaluate()
+            self.values_step = step
+
+        return [self.values[i] for i in indices]
+
+    def integral(self, name, expr, unit="1", description=None,
+            default_aggregator=sum):
+        """Return a log quantity for the volume integral of the
+        scalar template *expr*.
+        """
+        indices = self._add_reductions("integral", [expr])
+        return PipelinedQuantity(self, indices, lambda (value,): value,
+                name, unit, description, default_aggregator)
+
+    def integrals(self, names, expr, units=None, descriptions=None):
+        """Return a multi-valued log quantity for the volume integrals of
+        the components of the vector template *expr*.
+        """
+        if len(names) != len(expr):
+            raise ValueError("need one name per component")
+
+        indices = self._add_reductions("integral", list(expr))
+        return PipelinedMultiQuantity(self, indices, lambda values: values,
+                names, units, descriptions)
+
+    def norm(self, name, expr, p=2, unit="1", description=None):
+        """Return a log quantity for the *p*-norm of the (scalar or
+        vector) template *expr*, with the same meaning as
+        :meth:`hedge.discretization.Discretization.norm`.
+        """
+        from pytools.obj_array import log_shape
+        if log_shape(expr) == ():
+            components = [expr]
+        else:
+            components = list(expr)
+
+        from hedge.optemplate import MassOperator
+        from hedge.optemplate.primitives import CFunction
+        fabs = CFunction("fabs")
+
+        if p == numpy.Inf:
+            indices = self._add_reductions("max",
+                    [fabs(comp) for comp in components])
+            finish = max
+            from pytools import norm_inf as aggregator
+        elif p == 2:
+            # the L2 norm is the quadratic form of the mass matrix
+            indices = self._add_reductions("sum", [sum(
+                comp*MassOperator()(comp) for comp in components)])
+            finish = lambda (value,): value**(1/2)
+            from pytools import Norm
+            aggregator = Norm(p)
+        else:
+            indices = self._add_reductions("integral", [sum(
+                fabs(comp)**p for comp in components)])
+            finish = lambda (value,): value**(1/p)
+            from pytools import Norm
+            aggregator = Norm(p)
+
+        return PipelinedQuantity(self, indices, finish,
+                name, unit, description, aggregator)
+
+
+
+
+class PipelinedQuantity(LogQuantity):
+    """A log quantity computed by a :class:`DiagnosticsPipeline`."""
+
+    def __init__(self, pipeline, indices, finish, name, unit, description,
+            default_aggregator):
+        LogQuantity.__init__(self, name, unit, description)
+        self.pipeline = pipeline
+        self.indices = indices
+        self.finish = finish
+        self._default_aggregator = default_aggregator
+
+    @property
+    def default_aggregator(self):
+        return self._default_aggregator
+
+    def __call__(self):
+        return self.finish(self.pipeline.get_values(self, self.indices))
+
+
+
+
+class PipelinedMultiQuantity(MultiLogQuantity):
+    """A multi-valued log quantity computed by a :class:`DiagnosticsPipeline`."""
+
+    def __init__(self, pipeline, indices, finish, names, units, descriptions):
+        MultiLogQuantity.__init__(self, names, units, descriptions)
+        self.pipeline = pipeline
+        self.indices = indices
+        self.finish = finish
+
+    def __call__(self):
+        return self.finish(self.pipeline.get_values(self, self.indices))
+
+
+
+
 # electromagnetic quantities --------------------------------------------------
 class EMFieldGetter(object):
     """Makes E and H field accessible as self.e and self.h from a variable lookup.
@@ -294,8 +491,95 @@ def add_em_energies(mgr, maxwell_op, fields):
 
 
 
-def add_em_quantities(mgr, maxwell_op, fields):
-    add_em_energies(mgr, maxwell_op, fields)
-    mgr.add_quantity(EMFieldMomentum(fields, maxwell_op.c))
-    mgr.add_quantity(EMFieldDivergenceD(maxwell_op, fields))
-    mgr.add_quantity(EMFieldDivergenceB(maxwell_op, fields))
+def make_em_quantities(maxwell_op, fields, mgr=None):
+    """Return a list of log quantities for the energies, the momentum and
+    the divergences of the Maxwell fields obtained from *fields*, an
+    :class:`EMFieldGetter`, all computed by one :class:`DiagnosticsPipeline`.
+    If the :class:`pytools.log.LogManager` *mgr* is given, the pipeline is
+    evaluated once per log tick, otherwise once per query.
+
+    *maxwell_op* must have constant material parameters.
+    """
+    if not maxwell_op.fixed_material:
+        raise ValueError("compiled EM quantities require constant "
+                "epsilon and mu")
+
+    from pytools import norm_2
+    from hedge.mesh import TAG_ALL
+    from hedge.optemplate import make_vector_field, BoundarizeOperator
+    from hedge.optemplate.primitives import CFunction
+    from hedge.models.nd_calculus import DivergenceOperator
+    from hedge.tools.mathematics import SubsettableCrossProduct
+    from pytools.obj_array import join_fields
+
+    w = make_vector_field("w", len(fields.fgetter()))
+    e, h = maxwell_op.split_eh(w)
+    d = maxwell_op.epsilon * e
+    b = maxwell_op.mu * h
+
+    def divergence(subset, field):
+        div_op = DivergenceOperator(maxwell_op.dimensions, subset)
+        if not div_op.arg_count:
+            return 0
+        return div_op.op_template(field, BoundarizeOperator(TAG_ALL)(field))
+
+    e_subset = maxwell_op.get_eh_subset()[0:3]
+    h_subset = maxwell_op.get_eh_subset()[3:6]
+    poynting_s = SubsettableCrossProduct(
+            op1_subset=e_subset, op2_subset=h_subset)(
+                    e, h, three_mult=lambda lc, x, y: lc*x*y)
+
+    div_d = divergence(e_subset, d)
+    div_b = divergence(h_subset, b)
+    if div_b == 0:
+        abs_div_b = 0
+    else:
+        abs_div_b = CFunction("fabs")(div_b)
+
+    pipeline = DiagnosticsPipeline(fields.discr, {"w": fields.fgetter},
+            mgr=mgr)
+
+    return [
+            pipeline.integral("W_el", 1/2*numpy.dot(e, d),
+                "J", "Energy of the electric field",
+                default_aggregator=norm_2),
+            pipeline.integral("W_mag", 1/2*numpy.dot(h, b),
+                "J", "Energy of the magnetic field",
+                default_aggregator=norm_2),
+            pipeline.integrals(
+                ["p%s_field" % axis_name(i) for i in range(len(poynting_s))],
+                poynting_s/maxwell_op.c**2,
+                units=["N*s"]*len(poynting_s),
+                descriptions=["Field Momentum"]*len(poynting_s)),
+            pipeline.integral("divD", div_d, "C", "Integral over div D"),
+            pipeline.integrals(["divB", "err_divB_l1"],
+                join_fields(div_b, abs_div_b),
+                units=["T/m", "T/m"],
+                descriptions=["Integral over div B",
+                    "Integral over |div B|"]),
+            ]
+
+
+
+
+def add_em_quantities(mgr, maxwell_op, fields, interval=1):
+    """Add log quantities for the energies, the momentum and the divergences
+    of the Maxwell fields obtained from *fields*, an :class:`EMFieldGetter`,
+    to *mgr*. They are sampled every *interval* steps.
+
+    For constant material parameters, they are computed together, see
+    :func:`make_em_quantities`.
+    """
+    if maxwell_op.fixed_material:
+        quantities = make_em_quantities(maxwell_op, fields, mgr)
+    else:
+        quantities = [
+                ElectricFieldEnergy(fields),
+                MagneticFieldEnergy(fields),
+                EMFieldMomentum(fields, maxwell_op.c),
+                EMFieldDivergenceD(maxwell_op, fields),
+                EMFieldDivergenceB(maxwell_op, fields),
+                ]
+
+    for quantity in quantities:
+        mgr.add_quantity(quantity, interval=interval)
@@ -58,12 +58,18 @@ class HyperbolicOperator(Operator):
 
     def estimate_timestep(self, discr, 
             stepper=None, stepper_class=None, stepper_args=None,
-            t=None, fields=None):
+            t=None, fields=None, max_eigenvalue=None):
         u"""Estimate the largest stable timestep, given a time stepper
         `stepper_class`. If none is given, RK4 is assumed.
+
+        If *max_eigenvalue* is given, it is used instead of
+        :meth:`max_eigenvalue`.
         """
 
-        rk4_dt = 1 / self.max_eigenvalue(t, fields, discr) \
+        if max_eigenvalue is None:
+            max_eigenvalue = self.max_eigenvalue(t, fields, discr)
+
+        rk4_dt = 1 / max_eigenvalue \
                 * (discr.dt_non_geometric_factor()
                 * discr.dt_geometric_factor())
 
@@ -126,3 +126,21 @@ class BoundDiffusionOperator(hedge.iterative.OperatorBase):
                     t, self.discr, dop.neumann_tag)
 
         return self.compiled_op(**context)
+
+    def assemble(self, pcon, t=0):
+        """Return a tuple *(A, b)* of a :class:`scipy.sparse.csr_matrix`
+        *A* and a volume vector *b* such that *self(t, u) = A*u + b*.
+
+        Since *A* does not depend on *t* unless the diffusion tensor does,
+        this allows an implicit time stepper to factor it once and reuse
+        the factorization.
+        """
+        b = self(t, self.discr.volume_zeros())
+
+        def linear_part(u):
+            return self(t, u) - b
+
+        return (hedge.iterative.assemble_sparse_matrix(
+                    pcon, self.discr, linear_part,
+                    dtype=self.discr.default_scalar_type),
+                b)
@@ -388,17 +388,28 @@ class MaxwellOperator(HyperbolicOperator):
         e_indices = full_to_subset_indices(self.get_eh_subset()[0:3])
         all_indices = full_to_subset_indices(self.get_eh_subset())
 
+        if self.incident_bc_data is None:
+            get_incident_bc_data = lambda t: 0
+        elif discr.get_boundary(self.incident_tag).is_empty():
+            # data on an empty boundary does not change
+            empty_incident_bc_data = self.incident_bc_data.boundary_interpolant(
+                    0, discr, self.incident_tag)[all_indices]
+            get_incident_bc_data = lambda t: empty_incident_bc_data
+        else:
+            # the data is passed straight to the compiled operator
+            from hedge.data import with_buffer_reuse
+            incident_bc = with_buffer_reuse(self.incident_bc_data)
+            get_incident_bc_data = lambda t: \
+                    incident_bc.boundary_interpolant(
+                            t, discr, self.incident_tag)[all_indices]
+
         def rhs(t, w):
             if self.current is not None:
                 j = self.current.volume_interpolant(t, discr)[e_indices]
             else:
                 j = 0
 
-            if self.incident_bc_data is not None:
-                incident_bc_data = self.incident_bc_data.boundary_interpolant(
-                        t, discr, self.incident_tag)[all_indices]
-            else:
-                incident_bc_data = 0
+            incident_bc_data = get_incident_bc_data(t)
 
             kwargs = {}
             kwargs.update(extra_context)
@@ -800,7 +800,15 @@ class GasDynamicsOperator(TimeDependentOperator):
     # }}}
 
     # {{{ operator binding ----------------------------------------------------
-    def bind(self, discr, sensor=None, sensor_scaling=None, viscosity_only=False):
+    def bind(self, discr, sensor=None, sensor_scaling=None, viscosity_only=False,
+            reduce_max_speed=True):
+        """Return a function *rhs(t, q)* returning a tuple *(ode_rhs,
+        max_speed)*.
+
+        If *reduce_max_speed* is *False*, *max_speed* is the nodal field of
+        characteristic speeds instead of its maximum, leaving the reduction
+        to the caller, e.g. a :class:`hedge.timestep.TimestepController`.
+        """
         if (sensor is None and 
                 self.artificial_viscosity_mode is not None):
             raise ValueError("must specify a sensor if using "
@@ -824,6 +832,23 @@ class GasDynamicsOperator(TimeDependentOperator):
             raise RuntimeError("no-slip BCs only make sense for "
                     "viscous problems")
 
+        def make_bc_getter(bc, tag):
+            if discr.get_boundary(tag).is_empty():
+                # data on an empty boundary does not change
+                data = bc.boundary_interpolant(0, discr, tag)
+                return lambda t: data
+            else:
+                # the data is passed straight to bound_op
+                from hedge.data import with_buffer_reuse
+                bc = with_buffer_reuse(bc)
+                return lambda t: bc.boundary_interpolant(t, discr, tag)
+
+        get_bc_q_in = make_bc_getter(self.bc_inflow, self.inflow_tag)
+        get_bc_q_out = make_bc_getter(self.bc_outflow, self.outflow_tag)
+        get_bc_q_noslip = make_bc_getter(self.bc_noslip, self.noslip_tag)
+        get_bc_q_supersonic_in = make_bc_getter(
+                self.bc_supersonic_inflow, self.supersonic_inflow_tag)
+
         def rhs(t, q):
             extra_kwargs = {}
             if self.source is not None:
@@ -834,21 +859,18 @@ class GasDynamicsOperator(TimeDependentOperator):
                 extra_kwargs["sensor"] = sensor(q)
 
             opt_result = bound_op(q=q,
-                    bc_q_in=self.bc_inflow.boundary_interpolant(
-                        t, discr, self.inflow_tag),
-                    bc_q_out=self.bc_outflow.boundary_interpolant(
-                        t, discr, self.outflow_tag),
-                    bc_q_noslip=self.bc_noslip.boundary_interpolant(
-                        t, discr, self.noslip_tag),
-                    bc_q_supersonic_in=self.bc_supersonic_inflow
-                    .boundary_interpolant(t, discr, 
-                        self.supersonic_inflow_tag),
+                    bc_q_in=get_bc_q_in(t),
+                    bc_q_out=get_bc_q_out(t),
+                    bc_q_noslip=get_bc_q_noslip(t),
+                    bc_q_supersonic_in=get_bc_q_supersonic_in(t),
                     **extra_kwargs
                     )
 
             max_speed = opt_result[-1]
             ode_rhs = opt_result[:-1]
-            return ode_rhs, discr.nodewise_max(max_speed)
+            if reduce_max_speed:
+                max_speed = discr.nodewise_max(max_speed)
+            return ode_rhs, max_speed
 
         return rhs
 
@@ -28,7 +28,8 @@ THE SOFTWARE.
 import numpy as np
 import numpy.linalg as la
 from hedge.models import HyperbolicOperator
-from pytools.obj_array import make_obj_array
+from pytools import memoize_method
+from pytools.obj_array import make_obj_array, is_obj_array
 
 
 
@@ -97,6 +98,38 @@ class D2Q9LBMMethod(LBMMethodBase):
 
 
 
+def pack_distributions(f_bar, dtype=None):
+    """Return the distributions *f_bar*, an object array of volume vectors,
+    as one C-contiguous array of shape *(Q, ndofs)*. Arrays already in that
+    form are passed through.
+    """
+    if not is_obj_array(f_bar):
+        return np.ascontiguousarray(f_bar, dtype=dtype)
+
+    if dtype is None:
+        dtype = f_bar[0].dtype
+
+    result = np.empty((len(f_bar), len(f_bar[0])), dtype=dtype)
+    for f_alpha, f_bar_alpha in zip(result, f_bar):
+        f_alpha[:] = f_bar_alpha
+
+    return result
+
+
+
+
+def unpack_distributions(f):
+    """Return the distributions *f*, stored as by :func:`pack_distributions`,
+    as an object array whose entries are views of the rows of *f*.
+    """
+    if is_obj_array(f):
+        return f
+
+    return make_obj_array(list(f))
+
+
+
+
 class LatticeBoltzmannOperator(HyperbolicOperator):
     def __init__(self, method, lbm_delta_t, nu, flux_type="upwind"):
         self.method = method
@@ -122,7 +155,7 @@ class LatticeBoltzmannOperator(HyperbolicOperator):
             return u.avg*np.dot(normal, velocity)
         elif self.flux_type == "lf":
             return u.avg*np.dot(normal, velocity) \
-                    + 0.5*la.norm(v)*(u.int - u.ext)
+                    + 0.5*la.norm(velocity)*(u.int - u.ext)
         elif self.flux_type == "upwind":
             return (np.dot(normal, velocity)*
                     IfPositive(np.dot(normal, velocity),
@@ -159,6 +192,8 @@ class LatticeBoltzmannOperator(HyperbolicOperator):
                 zip(self.method.direction_vectors, f_bar))
 
     def stream_rhs(self, f_bar):
+        # All advection fluxes share their repr_op, so the compiler puts
+        # them into a single flux batch, i.e. one sweep over the faces.
         return make_obj_array([
             self.get_advection_op(f_bar_alpha, e_alpha)
             for e_alpha, f_bar_alpha in
@@ -177,6 +212,18 @@ class LatticeBoltzmannOperator(HyperbolicOperator):
         return f_bar - 1/(self.tau+1/2)*(f_bar - f_eq)
 
     def bind_rhs(self, discr):
+        """Return a right-hand side for streaming. It accepts the
+        distributions either as an object array or in the contiguous storage
+        of :func:`pack_distributions`, and returns them in the same form.
+
+        The compiled streaming operator allocates its own outputs, so in the
+        contiguous form, each evaluation additionally repacks them into a
+        new *(Q, ndofs)* array. The contiguous storage only pays
+        off in the collision kernel of :meth:`bind_collision`. Time steppers
+        that take several stages or substeps per collision should therefore
+        stream the object array form, e.g. as obtained from
+        :func:`unpack_distributions`.
+        """
         compiled_op_template = discr.compile(
                 self.stream_rhs(self.f_bar()))
 
@@ -184,7 +231,11 @@ class LatticeBoltzmannOperator(HyperbolicOperator):
         #check_bc_coverage(discr.mesh, [TAG_ALL])
 
         def rhs(t, f_bar):
-            return compiled_op_template(f_bar=f_bar)
+            if is_obj_array(f_bar):
+                return compiled_op_template(f_bar=f_bar)
+            else:
+                return pack_distributions(compiled_op_template(
+                    f_bar=unpack_distributions(f_bar)), dtype=f_bar.dtype)
 
         return rhs
 
@@ -201,10 +252,128 @@ class LatticeBoltzmannOperator(HyperbolicOperator):
         compiled_op_template = discr.compile(what(f_bar_sym), type_hints=type_hints)
 
         def rhs(f_bar):
-            return compiled_op_template(f_bar=f_bar)
+            return compiled_op_template(f_bar=unpack_distributions(f_bar))
 
         return rhs
 
+    @memoize_method
+    def make_collision_kernel(self, discr, dtype):
+        """Return a compiled function *collide(f, omega)* that performs the
+        BGK collision on the contiguous distributions *f* in place, computing
+        the moments and the equilibrium of each node in a single pass.
+        """
+        from cgen import (
+                FunctionDeclaration, FunctionBody, Typedef,
+                Const, Value, POD,
+                Statement, Include, Line, Block, Initializer, Assign,
+                For, If)
+        from pymbolic import var
+        from pymbolic.mapper.c_code import CCodeMapper
+        from pymbolic.mapper.stringifier import PREC_NONE
+
+        method = self.method
+        q = len(method)
+        dims = method.dimensions
+
+        def const(num):
+            return "value_type(%r)" % float(num)
+
+        code_mapper = CCodeMapper(const, reverse=False)
+
+        from codepy.bpl import BoostPythonModule
+        mod = BoostPythonModule()
+
+        S = Statement
+        mod.add_to_preamble([
+            Include("pyublas/numpy.hpp"),
+            Include("stdexcept"),
+            Include("cmath"),
+            ])
+
+        mod.add_to_module([
+            S("using namespace pyublas"),
+            Line(),
+            Typedef(POD(dtype, "value_type")),
+            ])
+
+        u_sym = make_obj_array([var("u%d" % i) for i in range(dims)])
+
+        def rho_u_code(i):
+            terms = ["%s*f_%d" % (const(e_alpha[i]), alpha)
+                    for alpha, e_alpha in enumerate(method.direction_vectors)
+                    if e_alpha[i]]
+            return "(%s)/rho" % (" + ".join(terms) or "0")
+
+        node_body = Block(
+                [Initializer(Const(Value("value_type", "f_%d" % alpha)),
+                    "f_it[%d*n + i]" % alpha)
+                    for alpha in range(q)]
+                + [Line(),
+                    Initializer(Const(Value("value_type", "rho")),
+                        " + ".join("f_%d" % alpha for alpha in range(q)))]
+                + [Initializer(Const(Value("value_type", "u%d" % i)),
+                    rho_u_code(i))
+                    for i in range(dims)]
+                + [Line()]
+                + [Assign("f_it[%d*n + i]" % alpha,
+                    "f_%d - omega*(f_%d - (%s))" % (alpha, alpha,
+                        code_mapper(
+                            method.f_equilibrium(var("rho"), alpha, u_sym),
+                            PREC_NONE)))
+                    for alpha in range(q)])
+
+        fdecl = FunctionDeclaration(
+                Value("void", "collide"),
+                [Value("numpy_array<value_type>", "f"),
+                    POD(dtype, "omega")])
+
+        fbody = Block([
+            If("f.size() %% %d != 0" % q,
+                S('throw std::runtime_error("unexpected distribution size")')),
+            Initializer(Const(Value("unsigned long", "n")),
+                "f.size() / %d" % q),
+            Initializer(Value("numpy_array<value_type>::iterator", "f_it"),
+                "f.begin()"),
+            Line(),
+            For("unsigned long i = 0", "i < n", "++i", node_body),
+            ])
+
+        mod.add_function(FunctionBody(fdecl, fbody))
+
+        return discr.build_module("lbm_collision", str(mod.generate()),
+                lambda: mod.compile(discr.toolchain)).collide
+
+    def bind_collision(self, discr):
+        """Return a function that applies one collision step to the
+        distributions *f_bar* and returns the result.
+
+        On the JIT backend, the distributions are kept in the contiguous
+        storage of :func:`pack_distributions` and updated in place by
+        :meth:`make_collision_kernel`. Other backends evaluate
+        :meth:`collision_update`.
+        """
+        omega = 1/(self.tau+1/2)
+
+        from hedge.backends.jit import Discretization as JitDiscretization
+        if isinstance(discr, JitDiscretization):
+            def collide(f_bar):
+                f = pack_distributions(f_bar)
+                self.make_collision_kernel(discr, f.dtype)(f, omega)
+                return f
+        else:
+            collision_update = self.bind(discr, self.collision_update)
+
+            def collide(f_bar):
+                result = collision_update(f_bar)
+                if is_obj_array(f_bar):
+                    return result
+                else:
+                    for f_alpha, result_alpha in zip(f_bar, result):
+                        f_alpha[:] = result_alpha
+                    return f_bar
+
+        return collide
+
     def max_eigenvalue(self, t=None, fields=None, discr=None):
         return max(
                 la.norm(v) for v in self.method.direction_vectors)
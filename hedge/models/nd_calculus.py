@@ -103,7 +103,12 @@ class DivergenceOperator(Operator):
 
         return flux
 
-    def op_template(self):
+    def op_template(self, v=None, bc=None):
+        """Return the divergence of *v* with boundary data *bc*.
+
+        If not given, *v* and *bc* default to vector fields named
+        ``v`` and ``bc``.
+        """
         from hedge.mesh import TAG_ALL
         from hedge.optemplate import make_vector_field, BoundaryPair, \
                 get_flux_operator, make_nabla, InverseMassOperator
@@ -111,8 +116,10 @@ class DivergenceOperator(Operator):
         nabla = make_nabla(self.dimensions)
         m_inv = InverseMassOperator()
 
-        v = make_vector_field("v", self.arg_count)
-        bc = make_vector_field("bc", self.arg_count)
+        if v is None:
+            v = make_vector_field("v", self.arg_count)
+        if bc is None:
+            bc = make_vector_field("bc", self.arg_count)
 
         local_op_result = 0
         idx = 0
@@ -199,6 +199,54 @@ class BoundPoissonOperator(hedge.iterative.OperatorBase):
 
     __call__ = op
 
+    def block_jacobi_preconditioner(self, pcon):
+        """Return a :class:`hedge.iterative.BlockJacobiPreconditioner` for
+        this operator. Use its negative with ``-bound_op``.
+        """
+        return hedge.iterative.BlockJacobiPreconditioner(
+                pcon, self.discr, self)
+
+    def p_multigrid_preconditioner(self, pcon, coarse_orders=None, **kwargs):
+        """Return a :class:`hedge.iterative.PMultigridPreconditioner` for
+        this operator. Use its negative with ``-bound_op``.
+
+        :param coarse_orders: a decreasing list of polynomial orders of the
+          coarse levels. By default, the order is halved down to one.
+
+        Further keyword arguments are passed on to
+        :class:`hedge.iterative.PMultigridPreconditioner`.
+        """
+        if coarse_orders is None:
+            from pytools import single_valued
+            order = single_valued(eg.local_discretization.order
+                    for eg in self.discr.element_groups)
+
+            coarse_orders = []
+            while order > 1:
+                order = order // 2
+                coarse_orders.append(order)
+
+        levels = [(self.discr, self)]
+        for order in coarse_orders:
+            coarse_discr = self.discr.copy_with_order(order)
+            levels.append(
+                    (coarse_discr, self.poisson_op.bind(coarse_discr)))
+
+        return hedge.iterative.PMultigridPreconditioner(
+                pcon, levels, **kwargs)
+
+    def assemble(self, pcon):
+        """Return a :class:`scipy.sparse.csr_matrix` equal to this operator,
+        e.g. for use with a sparse direct or algebraic multigrid solver.
+        Use it together with :meth:`prepare_rhs`.
+        """
+        if self.poincare_mean_value_hack:
+            raise NotImplementedError("assembling pure Neumann problems, "
+                    "whose mean-value constraint is not sparse")
+
+        return hedge.iterative.assemble_sparse_matrix(
+                pcon, self.discr, self)
+
     def prepare_rhs(self, rhs):
         """Prepare the right-hand side for the linear system op(u)=rhs(f).
 
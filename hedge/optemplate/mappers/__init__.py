@@ -211,6 +211,126 @@ class BoundOpMapperMixin(object):
 
 
 
+
+def _is_equal_with_types(a, b):
+    """Like ``a == b``, but constants only compare equal if they are of the
+    same type. This distinguishes ``Quotient(x, 2)`` from ``Quotient(x, 2.0)``,
+    which generate different code.
+    """
+    if a is b:
+        return True
+    if type(a) is not type(b):
+        return False
+
+    if isinstance(a, (tuple, list)):
+        return len(a) == len(b) and all(
+                _is_equal_with_types(a_i, b_i) for a_i, b_i in zip(a, b))
+
+    if isinstance(a, numpy.ndarray):
+        if a.dtype != b.dtype or a.shape != b.shape:
+            return False
+        if a.dtype == object:
+            return _is_equal_with_types(list(a.flat), list(b.flat))
+        return bool((a == b).all())
+
+    if isinstance(a, pymbolic.primitives.Expression):
+        try:
+            a_args = a.__getinitargs__()
+            b_args = b.__getinitargs__()
+        except AttributeError:
+            pass
+        else:
+            return _is_equal_with_types(a_args, b_args)
+
+    try:
+        return bool(a == b)
+    except ValueError:
+        return False
+
+
+
+
+class _TypedKey(object):
+    """Wraps an expression for use as a dictionary key that compares by
+    :func:`_is_equal_with_types`.
+    """
+
+    __slots__ = ["expr", "hash"]
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.hash = hash(expr)
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return _is_equal_with_types(self.expr, other.expr)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+
+
+class MemoizingMapperMixin(object):
+    """Remembers the result of mapping each subexpression, so that
+    structurally identical subtrees are only processed once.
+
+    Results are hash-consed through :attr:`interned`, so that equal
+    results are represented by the same object. A result equal to its
+    input is replaced by the input itself, which means that a pass that
+    changes nothing returns the expression it was given. Expressions only
+    count as equal here if their constants are also of the same types.
+
+    Only suitable for mappers whose result for a subexpression depends
+    on nothing but that subexpression, i.e. whose mapper methods take
+    no extra arguments and which do not depend on traversal state.
+
+    :ivar memo: maps subexpressions to their results. May be replaced
+      by a dictionary shared among instances of the same mapper (with
+      the same parameters) to reuse results across invocations.
+    :ivar interned: maps expressions to their canonical instances. May
+      be shared among any number of mappers.
+    """
+
+    def __call__(self, expr, *args, **kwargs):
+        if args or kwargs or not isinstance(
+                expr, pymbolic.primitives.Expression):
+            return super(MemoizingMapperMixin, self).__call__(
+                    expr, *args, **kwargs)
+
+        try:
+            memo = self.memo
+        except AttributeError:
+            memo = self.memo = {}
+
+        key = _TypedKey(expr)
+        try:
+            return memo[key]
+        except KeyError:
+            pass
+
+        result = super(MemoizingMapperMixin, self).__call__(expr)
+
+        if isinstance(result, pymbolic.primitives.Expression):
+            if result is not expr and _is_equal_with_types(result, expr):
+                result = expr
+
+            try:
+                interned = self.interned
+            except AttributeError:
+                interned = self.interned = {}
+
+            result = interned.setdefault(_TypedKey(result), result)
+
+        memo[key] = result
+        return result
+
+    rec = __call__
+
+
+
 # }}}
 
 # {{{ basic mappers -----------------------------------------------------------
@@ -270,6 +390,11 @@ class FlopCounter(
     def map_c_function(self, expr):
         return 1
 
+    def map_if_positive(self, expr):
+        # one comparison, plus whatever the branches and criterion cost
+        return (1 + self.rec(expr.criterion)
+                + self.rec(expr.then) + self.rec(expr.else_))
+
     def map_normal_component(self, expr):
         return 0
 
@@ -304,7 +429,8 @@ class CSERemover(IdentityMapper):
 # }}}
 
 # {{{ operator binder ---------------------------------------------------------
-class OperatorBinder(CSECachingMapperMixin, IdentityMapper):
+class OperatorBinder(MemoizingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     map_common_subexpression_uncached = \
             IdentityMapper.map_common_subexpression
 
@@ -331,7 +457,8 @@ class OperatorBinder(CSECachingMapperMixin, IdentityMapper):
 # }}}
 
 # {{{ operator specializer ----------------------------------------------------
-class OperatorSpecializer(CSECachingMapperMixin, IdentityMapper):
+class OperatorSpecializer(MemoizingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     """Guided by a typedict obtained through type inference (i.e. by
     :class:`hedge.optemplate.mappers.type_inference.TypeInferrrer`),
     substitutes more specialized operators for generic ones.
@@ -386,8 +513,10 @@ class OperatorSpecializer(CSECachingMapperMixin, IdentityMapper):
             try:
                 field_repr_tag = field_type.repr_tag
             except AttributeError:
-                # boundary pairs are not assigned types
-                assert isinstance(expr.field, BoundaryPair)
+                # boundary pairs are not assigned types, and per-element
+                # vectors are broadcast to the nodal grid
+                assert (isinstance(expr.field, BoundaryPair)
+                        or isinstance(field_type, type_info.PerElementVector))
                 has_quad_operand = False
             else:
                 has_quad_operand = isinstance(field_repr_tag,
@@ -441,7 +570,12 @@ class OperatorSpecializer(CSECachingMapperMixin, IdentityMapper):
             repr_tag_cell = [None]
 
             def process_flux_arg(flux_arg):
-                arg_repr_tag = self.typedict[flux_arg].repr_tag
+                arg_type = self.typedict[flux_arg]
+                if isinstance(arg_type, type_info.PerElementVector):
+                    # gets broadcast to the grid of the other arguments
+                    return
+
+                arg_repr_tag = arg_type.repr_tag
                 if repr_tag_cell[0] is None:
                     repr_tag_cell[0] = arg_repr_tag
                 else:
@@ -507,7 +641,8 @@ class OperatorSpecializer(CSECachingMapperMixin, IdentityMapper):
 
 # {{{ global-to-reference mapper ----------------------------------------------
 
-class GlobalToReferenceMapper(CSECachingMapperMixin, IdentityMapper):
+class GlobalToReferenceMapper(MemoizingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     """Maps operators that apply on the global function space down to operators on
     reference elements, together with explicit multiplication by geometric factors.
     """
@@ -1004,6 +1139,7 @@ class QuadratureUpsamplerChanger(CSECachingMapperMixin, IdentityMapper):
 
 # {{{ simplification / optimization -------------------------------------------
 class CommutativeConstantFoldingMapper(
+        MemoizingMapperMixin,
         pymbolic.mapper.constant_folder.CommutativeConstantFoldingMapper,
         IdentityMapperMixin):
 
@@ -1140,7 +1276,8 @@ class CommutativeConstantFoldingMapper(
 
 
 
-class EmptyFluxKiller(CSECachingMapperMixin, IdentityMapper):
+class EmptyFluxKiller(MemoizingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     def __init__(self, mesh):
         IdentityMapper.__init__(self)
         self.mesh = mesh
@@ -1228,7 +1365,8 @@ class _InnerDerivativeJoiner(pymbolic.mapper.RecursiveMapper):
 
 
 
-class DerivativeJoiner(CSECachingMapperMixin, IdentityMapper):
+class DerivativeJoiner(MemoizingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     """Joins derivatives:
 
     .. math::
@@ -1355,7 +1493,8 @@ class _InnerInverseMassContractor(pymbolic.mapper.RecursiveMapper):
 
 
 
-class InverseMassContractor(CSECachingMapperMixin, IdentityMapper):
+class InverseMassContractor(MemoizingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     # assumes all operators to be bound
     map_common_subexpression_uncached = \
             IdentityMapper.map_common_subexpression
@@ -1386,7 +1525,8 @@ class InverseMassContractor(CSECachingMapperMixin, IdentityMapper):
 # }}}
 
 # {{{ error checker -----------------------------------------------------------
-class ErrorChecker(CSECachingMapperMixin, IdentityMapper):
+class ErrorChecker(MemoizingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     map_common_subexpression_uncached = \
             IdentityMapper.map_common_subexpression
 
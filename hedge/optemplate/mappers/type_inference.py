@@ -295,6 +295,30 @@ class type_info:
 
         def __getinitargs__(self):
             return (self.boundary_tag, self.repr_tag)
+
+    class PerElementVector(StatelessTypeInfo, FinalType):
+        """A volume quantity that is constant on each element, such as a
+        geometric factor of a straight element, and that is stored with one
+        value per element.
+
+        A per-element vector may be used wherever a volume vector (of any
+        representation) is expected. It is broadcast to the nodes of each
+        element on the fly where it is combined with volume vectors, and
+        explicitly where an operator needs a full volume vector. Hence it
+        unifies with (and takes precedence over) all volume types.
+        """
+        def __repr__(self):
+            return "PerElement"
+
+        def unify_inner(self, other):
+            if isinstance(other, (
+                    type_info.KnownVolume,
+                    type_info.KnownInteriorFaces,
+                    type_info.KnownRepresentation,
+                    type_info.VolumeVector)):
+                return self
+            else:
+                return type_info.TypeInfo.unify_inner(self, other)
     # }}}
 
 # {{{ aspect extraction functions
@@ -307,7 +331,7 @@ def extract_representation(ti):
         return type_info.KnownRepresentation(own_repr_tag)
 
 def extract_domain(ti):
-    if isinstance(ti, type_info.VolumeVectorBase):
+    if isinstance(ti, (type_info.VolumeVectorBase, type_info.PerElementVector)):
         return type_info.KnownVolume()
     elif isinstance(ti, type_info.BoundaryVectorBase):
         return type_info.KnownBoundary(ti.boundary_tag)
@@ -396,25 +420,33 @@ class TypeInferrer(pymbolic.mapper.RecursiveMapper):
     # {{{ base cases
     def infer_for_children(self, expr, typedict, children):
         # This routine allows scalar among children and treats them as
-        # not type-changing
+        # not type-changing. Per-element children are broadcast to the
+        # type of the remaining children, so they are not type-changing
+        # either--unless all children are per-element or scalar.
 
         tp = typedict[expr]
+        if isinstance(tp, type_info.PerElementVector):
+            tp = type_info.no_type
 
         non_scalar_exprs = []
+        have_per_element = False
 
         for child in children:
-            if tp is type_info.no_type:
-                tp = self.rec(child, typedict)
-                if isinstance(tp, type_info.Scalar):
-                    tp = type_info.no_type
-                else:
-                    non_scalar_exprs.append(child)
+            child_tp = self.rec(child, typedict)
+
+            if isinstance(child_tp, type_info.Scalar):
+                pass
+            elif isinstance(child_tp, type_info.PerElementVector):
+                have_per_element = True
+            elif tp is type_info.no_type:
+                non_scalar_exprs.append(child)
+                tp = child_tp
             else:
-                other_tp = self.rec(child, typedict)
+                non_scalar_exprs.append(child)
+                tp = tp.unify(child_tp, child)
 
-                if not isinstance(other_tp, type_info.Scalar):
-                    non_scalar_exprs.append(child)
-                    tp = tp.unify(other_tp, child)
+        if tp is type_info.no_type and have_per_element:
+            return type_info.PerElementVector()
 
         for child in non_scalar_exprs:
             typedict[child] = tp
@@ -468,7 +500,7 @@ class TypeInferrer(pymbolic.mapper.RecursiveMapper):
                 ReferenceStiffnessTOperator, 
                 ReferenceQuadratureStiffnessTOperator,
 
-                ElementwiseLinearOperator)
+                ElementwiseLinearOperator, ElementReductionOperator)
 
         own_type = typedict[expr]
 
@@ -573,6 +605,11 @@ class TypeInferrer(pymbolic.mapper.RecursiveMapper):
                     expr.op.boundary_tag,
                     QuadratureRepresentation(expr.op.quadrature_tag))
 
+        elif isinstance(expr.op, ElementReductionOperator):
+            typedict[expr.field] = type_info.VolumeVector(NodalRepresentation())
+            self.rec(expr.field, typedict)
+            return type_info.PerElementVector()
+
         elif isinstance(expr.op, ElementwiseLinearOperator):
             typedict[expr.field] = type_info.VolumeVector(NodalRepresentation())
             self.rec(expr.field, typedict)
@@ -647,7 +684,11 @@ class TypeInferrer(pymbolic.mapper.RecursiveMapper):
                     .unify(typedict[expr], expr))
 
     def map_jacobian(self, expr, typedict):
-        return type_info.KnownVolume()
+        if expr.quadrature_tag is None:
+            # nodal geometric factors are stored per element
+            return type_info.PerElementVector()
+        else:
+            return type_info.KnownVolume()
 
     map_forward_metric_derivative = map_jacobian
     map_inverse_metric_derivative = map_jacobian
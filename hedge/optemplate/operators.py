@@ -225,6 +225,26 @@ class ElementwiseLinearOperator(Operator):
 
 
 
+class ElementReductionOperator(ElementwiseLinearOperator):
+    """An element-local linear operator all of whose matrix rows are equal,
+    so that its result is constant on each element. Backends that support
+    per-element vectors (see
+    :class:`hedge.optemplate.mappers.type_inference.type_info.PerElementVector`)
+    store the result with one value per element.
+
+    Subclasses implement :meth:`row` instead of :meth:`matrix`.
+    """
+
+    def row(self, element_group):
+        raise NotImplementedError
+
+    def matrix(self, element_group):
+        row = self.row(element_group)
+        return numpy.tile(row, (len(row), 1))
+
+
+
+
 class ElementwiseMaxOperator(StatelessOperator):
     mapper_method = intern("map_elementwise_max")
 
@@ -327,28 +347,22 @@ class FilterOperator(ElementwiseLinearOperator):
 
 
 
-class OnesOperator(ElementwiseLinearOperator, StatelessOperator):
-    def matrix(self, eg):
-        ldis = eg.local_discretization
+class OnesOperator(ElementReductionOperator, StatelessOperator):
+    def row(self, eg):
+        return numpy.ones(eg.local_discretization.node_count(),
+                dtype=numpy.float64)
 
-        node_count = ldis.node_count()
-        return numpy.ones((node_count, node_count), dtype=numpy.float64)
 
 
 
-
-class AveragingOperator(ElementwiseLinearOperator, StatelessOperator):
-    def matrix(self, eg):
+class AveragingOperator(ElementReductionOperator, StatelessOperator):
+    def row(self, eg):
         # average matrix, so that AVE*fields = cellaverage(fields)
         # see Hesthaven and Warburton page 227
 
         mmat = eg.local_discretization.mass_matrix()
         standard_el_vol = numpy.sum(numpy.dot(mmat, numpy.ones(mmat.shape[0])))
-        avg_mat_row = numpy.sum(mmat,0)/standard_el_vol
-
-        avg_mat = numpy.zeros((numpy.size(avg_mat_row), numpy.size(avg_mat_row)))
-        avg_mat[:] = avg_mat_row
-        return avg_mat
+        return numpy.sum(mmat,0)/standard_el_vol
 
 
 
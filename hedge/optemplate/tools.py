@@ -220,9 +220,40 @@ def ptwise_dot(logdims1, logdims2, a1, a2):
 # }}}
 
 # {{{ process_optemplate function ---------------------------------------------
+class OptemplateProcessingCache(object):
+    """Results of the optemplate processing passes, to be reused among
+    invocations of :func:`process_optemplate` on the same mesh.
+
+    Since every pass is applied subexpression by subexpression, templates
+    that share parts (such as the ones compiled by a model for different
+    purposes) are only processed once in their shared parts.
+    """
+
+    def __init__(self):
+        self.interned = {}
+        self.memos = {}
+
+    def prepare(self, mapper, key):
+        """Make *mapper* (a :class:`hedge.optemplate.mappers.MemoizingMapperMixin`)
+        use the results stored under *key*. *key* must identify the
+        transformation performed by *mapper*, including its parameters.
+        """
+        mapper.memo = self.memos.setdefault(key, {})
+        mapper.interned = self.interned
+        return mapper
+
+
+
+
 def process_optemplate(optemplate, post_bind_mapper=None,
         dumper=lambda name, optemplate: None, mesh=None,
-        type_hints={}):
+        type_hints={}, cache=None, pass_timings=None):
+    """
+    :param cache: an :class:`OptemplateProcessingCache` that was only
+      used with *mesh* before, or *None*.
+    :param pass_timings: if not *None*, a dictionary to which the time
+      spent in each pass (in seconds, by pass name) is added.
+    """
 
     from hedge.optemplate.mappers import (
             OperatorBinder, CommutativeConstantFoldingMapper,
@@ -231,24 +262,43 @@ def process_optemplate(optemplate, post_bind_mapper=None,
     from hedge.optemplate.mappers.bc_to_flux import BCToFluxRewriter
     from hedge.optemplate.mappers.type_inference import TypeInferrer
 
+    if cache is None:
+        cache = OptemplateProcessingCache()
+
+    from time import time
+
+    def run_pass(name, mapper, optemplate, *args):
+        start = time()
+        result = mapper(optemplate, *args)
+        if pass_timings is not None:
+            pass_timings[name] = pass_timings.get(name, 0) + time() - start
+        return result
+
     dumper("before-bind", optemplate)
-    optemplate = OperatorBinder()(optemplate)
+    optemplate = run_pass("bind",
+            cache.prepare(OperatorBinder(), "bind"), optemplate)
 
-    ErrorChecker(mesh)(optemplate)
+    run_pass("error-check",
+            cache.prepare(ErrorChecker(mesh), "error-check"), optemplate)
 
     if post_bind_mapper is not None:
         dumper("before-postbind", optemplate)
-        optemplate = post_bind_mapper(optemplate)
+        optemplate = run_pass("postbind", post_bind_mapper, optemplate)
 
     if mesh is not None:
         dumper("before-empty-flux-killer", optemplate)
-        optemplate = EmptyFluxKiller(mesh)(optemplate)
+        optemplate = run_pass("empty-flux-killer",
+                cache.prepare(EmptyFluxKiller(mesh), "empty-flux-killer"),
+                optemplate)
 
     dumper("before-cfold", optemplate)
-    optemplate = CommutativeConstantFoldingMapper()(optemplate)
+    optemplate = run_pass("cfold",
+            cache.prepare(CommutativeConstantFoldingMapper(), "cfold"),
+            optemplate)
 
     dumper("before-bc2flux", optemplate)
-    optemplate = BCToFluxRewriter()(optemplate)
+    optemplate = run_pass("bc2flux",
+            cache.prepare(BCToFluxRewriter(), "bc2flux"), optemplate)
 
     # Ordering restriction:
     #
@@ -259,10 +309,15 @@ def process_optemplate(optemplate, post_bind_mapper=None,
     # - Must run BC-to-flux before first type inferrer run so that zeros in
     # flux arguments can be removed.
 
+    # Type inference works on the whole template at once, so neither it
+    # nor the specializer it guides can reuse results across invocations.
+
     dumper("before-specializer", optemplate)
-    optemplate = OperatorSpecializer(
-            TypeInferrer()(optemplate, type_hints)
-            )(optemplate)
+    typedict = run_pass("type-inference",
+            TypeInferrer(), optemplate, type_hints)
+    specializer = OperatorSpecializer(typedict)
+    specializer.interned = cache.interned
+    optemplate = run_pass("specializer", specializer, optemplate)
 
     # Ordering restriction:
     #
@@ -272,7 +327,10 @@ def process_optemplate(optemplate, post_bind_mapper=None,
 
     assert mesh is not None
     dumper("before-global-to-reference", optemplate)
-    optemplate = GlobalToReferenceMapper(mesh.dimensions)(optemplate)
+    optemplate = run_pass("global-to-reference",
+            cache.prepare(GlobalToReferenceMapper(mesh.dimensions),
+                "global-to-reference"),
+            optemplate)
 
     # Ordering restriction: 
     #
@@ -281,13 +339,17 @@ def process_optemplate(optemplate, post_bind_mapper=None,
     # quadrature operators.
 
     dumper("before-imass", optemplate)
-    optemplate = InverseMassContractor()(optemplate)
+    optemplate = run_pass("imass",
+            cache.prepare(InverseMassContractor(), "imass"), optemplate)
 
     dumper("before-cfold-2", optemplate)
-    optemplate = CommutativeConstantFoldingMapper()(optemplate)
+    optemplate = run_pass("cfold",
+            cache.prepare(CommutativeConstantFoldingMapper(), "cfold"),
+            optemplate)
 
     dumper("before-derivative-join", optemplate)
-    optemplate = DerivativeJoiner()(optemplate)
+    optemplate = run_pass("derivative-join",
+            cache.prepare(DerivativeJoiner(), "derivative-join"), optemplate)
 
     dumper("process-optemplate-finished", optemplate)
 
@@ -100,6 +100,251 @@ def generic_multi_vandermonde(points, functions):
 
 
 
+def jacobi_polynomial_table(alpha, beta, max_n, x):
+    """Return a list of the values of the Jacobi polynomials with parameters
+    *alpha* and *beta* of degrees 0 through *max_n* at the array of points
+    *x*, normalized like :class:`JacobiFunction`.
+
+    The values of all degrees are obtained from a single run of the
+    three-term recurrence.
+    """
+    from math import gamma, sqrt
+
+    x = numpy.asarray(x, dtype=numpy.float64)
+
+    gamma0 = (2**(alpha+beta+1)/(alpha+beta+1)
+            * gamma(alpha+1)*gamma(beta+1)/gamma(alpha+beta+1))
+    result = [numpy.ones_like(x)/sqrt(gamma0)]
+    if max_n == 0:
+        return result
+
+    gamma1 = (alpha+1)*(beta+1)/(alpha+beta+3)*gamma0
+    result.append(((alpha+beta+2)/2*x + (alpha-beta)/2)/sqrt(gamma1))
+
+    a_prev = 2/(2+alpha+beta)*sqrt((alpha+1)*(beta+1)/(alpha+beta+3))
+    for i in range(1, max_n):
+        h1 = 2*i+alpha+beta
+        a = 2/(h1+2)*sqrt((i+1)*(i+1+alpha+beta)*(i+1+alpha)*(i+1+beta)
+                /(h1+1)/(h1+3))
+        b = -(alpha**2-beta**2)/h1/(h1+2)
+
+        result.append(1/a*(-a_prev*result[-2] + (x-b)*result[-1]))
+        a_prev = a
+
+    return result
+
+
+
+
+def diff_jacobi_polynomial_table(alpha, beta, max_n, x):
+    """Return a list of the derivatives of the polynomials returned by
+    :func:`jacobi_polynomial_table`, normalized like
+    :class:`DiffJacobiFunction`.
+    """
+    from math import sqrt
+
+    x = numpy.asarray(x, dtype=numpy.float64)
+
+    result = [numpy.zeros_like(x)]
+    if max_n > 0:
+        shifted = jacobi_polynomial_table(alpha+1, beta+1, max_n-1, x)
+        result.extend(sqrt(n*(n+alpha+beta+1))*shifted[n-1]
+                for n in range(1, max_n+1))
+
+    return result
+
+
+
+
+def _quotient_or(numerator, denominator, default):
+    nonzero = denominator != 0
+    return numpy.where(nonzero,
+            numerator/numpy.where(nonzero, denominator, 1),
+            default)
+
+
+
+
+def simplex_onb_vandermonde(dimensions, mode_identifiers, points):
+    """Return the Vandermonde matrix of the orthonormal basis of the unit
+    simplex of *dimensions* dimensions at *points*, i.e. the matrix
+    :math:`V_{i,j} := \phi_j(x_i)` with one column for each mode in
+    *mode_identifiers*.
+
+    The result agrees with evaluating :class:`TriangleBasisFunction` and
+    friends point by point, but evaluates each basis function on all
+    points at once.
+    """
+    mode_identifiers = list(mode_identifiers)
+    if dimensions == 0:
+        return numpy.ones((len(points), len(mode_identifiers)))
+
+    points = numpy.asarray(points, dtype=numpy.float64) \
+            .reshape(len(points), dimensions)
+    max_n = max(sum(mid) for mid in mode_identifiers)
+    result = numpy.empty((len(points), len(mode_identifiers)))
+
+    if dimensions == 1:
+        r, = points.T
+        f = jacobi_polynomial_table(0, 0, max_n, r)
+        for col, (i,) in enumerate(mode_identifiers):
+            result[:, col] = f[i]
+
+    elif dimensions == 2:
+        r, s = points.T
+        a = _quotient_or(2*(1+r), 1-s, 2) - 1
+
+        f = jacobi_polynomial_table(0, 0, max_n, a)
+        g = {}
+        for col, (i, j) in enumerate(mode_identifiers):
+            if i not in g:
+                g[i] = jacobi_polynomial_table(2*i+1, 0, max_n-i, s)
+            result[:, col] = numpy.sqrt(2)*f[i]*g[i][j]*(1-s)**i
+
+    elif dimensions == 3:
+        r, s, t = points.T
+        a = _quotient_or(-2*(1+r), s+t, 0) - 1
+        b = _quotient_or(2*(1+s), 1-t, 0) - 1
+        c = t
+
+        f = jacobi_polynomial_table(0, 0, max_n, a)
+        g = {}
+        h = {}
+        for col, (i, j, k) in enumerate(mode_identifiers):
+            if i not in g:
+                g[i] = jacobi_polynomial_table(2*i+1, 0, max_n-i, b)
+            if (i, j) not in h:
+                h[i, j] = jacobi_polynomial_table(
+                        2*i+2*j+2, 0, max_n-i-j, c)
+
+            result[:, col] = (numpy.sqrt(8)
+                    * f[i] * g[i][j] * (1-b)**i
+                    * h[i, j][k] * (1-c)**(i+j))
+
+    else:
+        raise ValueError("unsupported dimension count: %d" % dimensions)
+
+    return result
+
+
+
+
+def grad_simplex_onb_vandermonde(dimensions, mode_identifiers, points):
+    """Return a list of *dimensions* Vandermonde matrices of the unit
+    coordinate derivatives of the basis evaluated by
+    :func:`simplex_onb_vandermonde`, agreeing with
+    :class:`GradTriangleBasisFunction` and friends.
+    """
+    mode_identifiers = list(mode_identifiers)
+    points = numpy.asarray(points, dtype=numpy.float64) \
+            .reshape(len(points), dimensions)
+    max_n = max(sum(mid) for mid in mode_identifiers)
+    result = [numpy.empty((len(points), len(mode_identifiers)))
+            for axis in range(dimensions)]
+
+    if dimensions == 1:
+        r, = points.T
+        df = diff_jacobi_polynomial_table(0, 0, max_n, r)
+        for col, (i,) in enumerate(mode_identifiers):
+            result[0][:, col] = df[i]
+
+    elif dimensions == 2:
+        r, s = points.T
+
+        # avoid the singularity of the collapsed coordinates at the top
+        s = numpy.where(s >= 1, 1-numpy.finfo(numpy.float64).eps, s)
+        a = _quotient_or(2*(1+r), 1-s, 2) - 1
+        one_s = 1-s
+
+        f = jacobi_polynomial_table(0, 0, max_n, a)
+        df = diff_jacobi_polynomial_table(0, 0, max_n, a)
+        g = {}
+        dg = {}
+        for col, (i, j) in enumerate(mode_identifiers):
+            if i not in g:
+                g[i] = jacobi_polynomial_table(2*i+1, 0, max_n-i, s)
+                dg[i] = diff_jacobi_polynomial_table(2*i+1, 0, max_n-i, s)
+
+            f_a = f[i]
+            df_a = df[i]
+            g_s = g[i][j]
+            dg_s = dg[i][j]
+
+            # see doc/hedge-notes.tm
+            result[0][:, col] = 2*numpy.sqrt(2) * g_s * one_s**(i-1) * df_a
+            result[1][:, col] = numpy.sqrt(2)*(
+                    f_a * one_s**i * dg_s
+                    + (2*r+2) * g_s * one_s**(i-2) * df_a
+                    - i * f_a * g_s * one_s**(i-1))
+
+    elif dimensions == 3:
+        r, s, t = points.T
+        a = _quotient_or(-2*(1+r), s+t, 0) - 1
+        b = _quotient_or(2*(1+s), 1-t, 0) - 1
+        c = t
+        one_b = 1-b
+        one_c = 1-c
+
+        f = jacobi_polynomial_table(0, 0, max_n, a)
+        df = diff_jacobi_polynomial_table(0, 0, max_n, a)
+        g = {}
+        dg = {}
+        h = {}
+        dh = {}
+        for col, (i, j, k) in enumerate(mode_identifiers):
+            if i not in g:
+                g[i] = jacobi_polynomial_table(2*i+1, 0, max_n-i, b)
+                dg[i] = diff_jacobi_polynomial_table(2*i+1, 0, max_n-i, b)
+            if (i, j) not in h:
+                h[i, j] = jacobi_polynomial_table(
+                        2*i+2*j+2, 0, max_n-i-j, c)
+                dh[i, j] = diff_jacobi_polynomial_table(
+                        2*i+2*j+2, 0, max_n-i-j, c)
+
+            fa = f[i]
+            dfa = df[i]
+            gb = g[i][j]
+            dgb = dg[i][j]
+            hc = h[i, j][k]
+            dhc = dh[i, j][k]
+
+            # after Hesthaven/Warburton's GradSimplex3DP
+            v_r = dfa*(gb*hc)
+            if i > 0:
+                v_r = v_r*(0.5*one_b)**(i-1)
+            if i+j > 0:
+                v_r = v_r*(0.5*one_c)**(i+j-1)
+
+            v_s = 0.5*(1+a)*v_r
+            tmp = dgb*(0.5*one_b)**i
+            if i > 0:
+                tmp = tmp + (-0.5*i)*(gb*(0.5*one_b)**(i-1))
+            if i+j > 0:
+                tmp = tmp*(0.5*one_c)**(i+j-1)
+            tmp = fa*(tmp*hc)
+            v_s = v_s + tmp
+
+            v_t = 0.5*(1+a)*v_r + 0.5*(1+b)*tmp
+            tmp = dhc*(0.5*one_c)**(i+j)
+            if i+j > 0:
+                tmp = tmp - 0.5*(i+j)*(hc*(0.5*one_c)**(i+j-1))
+            tmp = fa*(gb*tmp)
+            tmp = tmp*(0.5*one_b)**i
+            v_t = v_t + tmp
+
+            normalization = 2**(2*i+j+1.5)
+            result[0][:, col] = v_r*normalization
+            result[1][:, col] = v_s*normalization
+            result[2][:, col] = v_t*normalization
+
+    else:
+        raise ValueError("unsupported dimension count: %d" % dimensions)
+
+    return result
+
+
+
+
 def legendre_vandermonde(points, N):
     return generic_vandermonde(points,
             [LegendreFunction(i) for i in range(N+1)])
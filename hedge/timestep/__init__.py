@@ -103,3 +103,89 @@ def times_and_steps(max_dt_getter, taken_dt_getter=None,
 
         step += 1
         t += taken_dt
+
+
+
+
+class TimestepController(object):
+    """Estimate the largest stable timestep of *op* on *discr*, for use as the
+    *max_dt_getter* of :func:`times_and_steps`.
+
+    The discretization's geometric factors and the relative size of the
+    stepper's stability region do not change during a run and are only
+    obtained once. For nonlinear operators, the characteristic speed is taken
+    from the right-hand side (see :meth:`wrap_rhs`) instead of being
+    computed separately, so that an estimate costs at most one global
+    reduction.
+
+    :param estimate_every: re-estimate the timestep only on every
+      *estimate_every*-th call and reuse the previous estimate otherwise.
+    :param safety_factor: multiplied onto each estimate.
+    """
+
+    def __init__(self, op, discr, stepper=None, stepper_class=None,
+            stepper_args=None, estimate_every=1, safety_factor=1):
+        if estimate_every < 1:
+            raise ValueError("estimate_every must be positive")
+
+        self.op = op
+        self.discr = discr
+        self.estimate_every = estimate_every
+        self.safety_factor = safety_factor
+
+        from hedge.timestep.stability import \
+                approximate_rk4_relative_imag_stability_region
+        self.stability_factor = approximate_rk4_relative_imag_stability_region(
+                stepper, stepper_class, stepper_args)
+
+        self.speed = None
+        self.call_count = 0
+        self.dt = None
+
+    def wrap_rhs(self, rhs):
+        """Return a function *(t, q)* that returns the ODE right-hand side
+        computed by *rhs*, which returns a tuple *(ode_rhs, max_speed)*.
+
+        *max_speed* may be a scalar or a nodal field of characteristic
+        speeds, such as that returned by
+        :meth:`hedge.models.gas_dynamics.GasDynamicsOperator.bind` with
+        *reduce_max_speed=False*. In the latter case, the field is only
+        reduced when a new estimate is needed.
+        """
+        def wrapped_rhs(t, q):
+            ode_rhs, self.speed = rhs(t, q)
+            return ode_rhs
+
+        return wrapped_rhs
+
+    def max_eigenvalue(self):
+        """Return the most recent characteristic speed obtained through
+        :meth:`wrap_rhs`, or *None*.
+        """
+        speed = self.speed
+        if speed is None:
+            return None
+
+        import numpy
+        if not numpy.isscalar(speed):
+            speed = self.discr.nodewise_max(speed)
+
+        return speed
+
+    def estimate(self, t):
+        kwargs = {}
+        max_eigenvalue = self.max_eigenvalue()
+        if max_eigenvalue is not None:
+            kwargs["max_eigenvalue"] = max_eigenvalue
+
+        # The stability region is accounted for by self.stability_factor,
+        # so estimate for RK4.
+        return (self.safety_factor * self.stability_factor
+                * self.op.estimate_timestep(self.discr, t=t, **kwargs))
+
+    def __call__(self, t):
+        if self.dt is None or self.call_count % self.estimate_every == 0:
+            self.dt = self.estimate(t)
+
+        self.call_count += 1
+        return self.dt
@@ -27,5 +27,30 @@ THE SOFTWARE.
 
 
 
+import numpy
+
+
+
+
+def get_scalar_dtype(dtype, mixed_precision=False):
+    """Return the type of the coefficients with which a time stepper
+    combines state vectors of type *dtype*.
+
+    Normally, this is the real type of the same precision as *dtype*. If
+    *mixed_precision* is set, single-precision real state is combined
+    using double-precision coefficients, so that the arithmetic of each
+    update is carried out in double precision while state and right-hand
+    sides are stored in single precision.
+    """
+    dtype = numpy.dtype(dtype)
+    if mixed_precision and dtype == numpy.float32:
+        return numpy.dtype(numpy.float64)
+
+    from pytools import match_precision
+    return match_precision(numpy.dtype(numpy.float64), dtype)
+
+
+
+
 class TimeStepper(object):
     pass
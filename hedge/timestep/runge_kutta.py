@@ -70,7 +70,12 @@ class LSRK4TimeStepper(TimeStepper):
     adaptive = False
 
     def __init__(self, dtype=numpy.float64, rcon=None,
-            vector_primitive_factory=None):
+            vector_primitive_factory=None, mixed_precision=False):
+        """
+        :param mixed_precision: if *True* and *dtype* is single precision,
+          carry out the update arithmetic in double precision. See
+          :func:`hedge.timestep.base.get_scalar_dtype`.
+        """
         if vector_primitive_factory is None:
             from hedge.vector_primitives import VectorPrimitiveFactory
             self.vector_primitive_factory = VectorPrimitiveFactory()
@@ -87,10 +92,9 @@ class LSRK4TimeStepper(TimeStepper):
         self.flop_counter = EventCounter(
                 "n_flops_rk4", "Floating point operations performed in RK4")
 
-        from pytools import match_precision
+        from hedge.timestep.base import get_scalar_dtype
         self.dtype = numpy.dtype(dtype)
-        self.scalar_dtype = match_precision(
-                numpy.dtype(numpy.float64), self.dtype)
+        self.scalar_dtype = get_scalar_dtype(self.dtype, mixed_precision)
         self.coeffs = numpy.array([self._RK4A, self._RK4B, self._RK4C], 
                 dtype=self.scalar_dtype).T
 
@@ -193,7 +197,7 @@ class EmbeddedRungeKuttaTimeStepperBase(TimeStepper):
     def __init__(self, use_high_order=True, dtype=numpy.float64, rcon=None,
             vector_primitive_factory=None, atol=0, rtol=0,
             max_dt_growth=5, min_dt_shrinkage=0.1,
-            limiter=None):
+            limiter=None, mixed_precision=False):
         if vector_primitive_factory is None:
             from hedge.vector_primitives import VectorPrimitiveFactory
             self.vector_primitive_factory = VectorPrimitiveFactory()
@@ -223,9 +227,8 @@ class EmbeddedRungeKuttaTimeStepperBase(TimeStepper):
         self.atol = atol
         self.rtol = rtol
 
-        from pytools import match_precision
-        self.scalar_dtype = match_precision(
-                numpy.dtype(numpy.float64), self.dtype)
+        from hedge.timestep.base import get_scalar_dtype
+        self.scalar_dtype = get_scalar_dtype(self.dtype, mixed_precision)
 
         self.max_dt_growth = max_dt_growth
         self.min_dt_shrinkage = min_dt_shrinkage
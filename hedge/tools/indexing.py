@@ -154,21 +154,29 @@ def find_index_map_from_node_sets(old_nodes, new_nodes, threshold=1e-12):
     returns an index tuple, which satisfies (in shorthand)
     `new_nodes[imap] == old_nodes`.
     """
-    idx_map = []
+    def as_array(nodes):
+        nodes = list(nodes)
+        dim = len(nodes[0]) if nodes else 0
+        return numpy.array(nodes, dtype=numpy.float64).reshape(len(nodes), dim)
+
+    old_nodes = as_array(old_nodes)
+    new_nodes = as_array(new_nodes)
 
-    # yay O(n^2)
-    for old_node in old_nodes:
-        found = False
-        for new_idx, new_node in enumerate(new_nodes):
-            if la.norm(old_node-new_node) < threshold:
-                idx_map.append(new_idx)
-                found = True
-                break
+    # distances between all pairs of old and new nodes
+    distances = numpy.sqrt(numpy.sum(
+        (old_nodes[:, numpy.newaxis, :] - new_nodes[numpy.newaxis, :, :])**2,
+        axis=-1))
+    close = distances < threshold
 
-        if not found:
+    idx_map = []
+    for old_node, old_close in zip(old_nodes, close):
+        new_indices, = numpy.nonzero(old_close)
+        if not len(new_indices):
             raise ValueError("a corresponding node for %s was not found"
                     % old_node)
 
+        idx_map.append(int(new_indices[0]))
+
     return tuple(idx_map)
 
 
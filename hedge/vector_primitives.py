@@ -129,6 +129,25 @@ class CUDALinearCombiner:
 # }}}
 
 # {{{ inner product -----------------------------------------------------------
+def accumulating_dot(a, b):
+    """Return the dot product of the vectors *a* and *b*. Sums of
+    single-precision data are accumulated in double precision, which keeps
+    reductions over many nodes accurate without having to store the data
+    in double precision.
+    """
+    from pytools import common_dtype
+    dtype = common_dtype([a.dtype, b.dtype])
+
+    if dtype == numpy.float32:
+        return numpy.einsum("i,i", a, b, dtype=numpy.float64)
+    elif dtype == numpy.complex64:
+        return numpy.einsum("i,i", a, b, dtype=numpy.complex128)
+    else:
+        return numpy.dot(a, b)
+
+
+
+
 class ObjectArrayInnerProductWrapper(object):
     def __init__(self, scalar_kernel):
         self.scalar_kernel = scalar_kernel
@@ -219,7 +238,7 @@ class VectorPrimitiveFactory(object):
             sample_vec = sample_vec[0]
 
         if isinstance(sample_vec, numpy.ndarray) and sample_vec.dtype != object:
-            kernel = numpy.dot
+            kernel = accumulating_dot
         else:
             kernel = self.make_special_inner_product(sample_vec)
 
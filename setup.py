@@ -128,6 +128,8 @@ def main():
                     "hedge.tools",
                     ],
 
+            scripts=["bin/hedge-tune-jit"],
+
             ext_package="hedge",
 
             setup_requires=[
@@ -0,0 +1,132 @@
+"""This benchmark measures how long it takes to turn the operator templates
+of the models in :mod:`hedge.models` into instruction lists, split into
+optemplate processing and the work of the JIT operator compiler (flux
+batching, assignment aggregation and code generation).
+"""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2009 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+
+import numpy
+
+
+
+
+def make_operators(dimensions):
+    from hedge.models.advection import (
+            StrongAdvectionOperator, WeakAdvectionOperator)
+    from hedge.models.wave import StrongWaveOperator
+    from hedge.models.em import MaxwellOperator, TMMaxwellOperator
+    from hedge.models.poisson import PoissonOperator
+    from hedge.models.diffusion import DiffusionOperator
+    from hedge.models.gas_dynamics import GasDynamicsOperator, GammaLawEOS
+
+    v = numpy.array([1] + [0]*(dimensions-1), dtype=numpy.float64)
+
+    result = [
+            ("strong advection", StrongAdvectionOperator(v, flux_type="upwind")
+                .op_template()),
+            ("weak advection", WeakAdvectionOperator(v, flux_type="upwind")
+                .op_template()),
+            ("wave", StrongWaveOperator(1, dimensions).op_template()),
+            ]
+
+    if dimensions == 2:
+        result.append(("maxwell (tm)",
+            TMMaxwellOperator(1, 1, flux_type=1).op_template()))
+    else:
+        result.append(("maxwell",
+            MaxwellOperator(1, 1, flux_type=1).op_template()))
+
+    result.extend([
+            ("poisson", PoissonOperator(dimensions)
+                .op_template(apply_minv=True)),
+            ("diffusion", DiffusionOperator(dimensions)
+                .op_template(apply_minv=True)),
+            ("euler", GasDynamicsOperator(dimensions,
+                equation_of_state=GammaLawEOS(1.4)).op_template()),
+            ("navier-stokes", GasDynamicsOperator(dimensions, mu=0.01,
+                equation_of_state=GammaLawEOS(1.4), prandtl=0.72)
+                .op_template()),
+            ])
+
+    return result
+
+
+
+
+def main():
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--dimensions", type="int", default=2)
+    parser.add_option("--order", type="int", default=3)
+    parser.add_option("--repeat", type="int", default=3,
+            help="number of compilations to take the minimum time of")
+    options, args = parser.parse_args()
+
+    if options.dimensions == 2:
+        from hedge.mesh.generator import make_rect_mesh
+        mesh = make_rect_mesh(max_area=0.05)
+    else:
+        from hedge.mesh.generator import make_box_mesh
+        mesh = make_box_mesh(max_volume=0.05)
+
+    from hedge.backends.jit import Discretization
+    discr = Discretization(mesh, order=options.order)
+
+    from time import time
+    from hedge.optemplate import process_optemplate
+    from hedge.optemplate.mappers import QuadratureUpsamplerRemover
+    from hedge.backends.jit.compiler import OperatorCompiler
+
+    print "%-20s %10s %10s %8s" % ("operator", "process", "compile", "insns")
+
+    for name, optemplate in make_operators(options.dimensions):
+        optemplate = QuadratureUpsamplerRemover(discr.quad_min_degrees)(
+                optemplate)
+
+        process_times = []
+        compile_times = []
+        for i in range(options.repeat):
+            start = time()
+            processed = process_optemplate(optemplate, mesh=discr.mesh)
+            process_times.append(time()-start)
+
+            start = time()
+            code = OperatorCompiler(discr)(processed)
+            compile_times.append(time()-start)
+
+        print "%-20s %9.3fs %9.3fs %8d" % (name,
+                min(process_times), min(compile_times),
+                len(code.instructions))
+
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""This benchmark measures the throughput of the lattice Boltzmann operator
+of :mod:`hedge.models.gas_dynamics.lbm` on the periodic shear layer of
+``examples/gas_dynamics/lbm-simple.py``. It times the collision step, both
+as a compiled operator template on separate vectors and as the fused kernel
+on contiguous storage, as well as the streaming right-hand side.
+"""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2011 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+
+import numpy
+
+
+
+
+def make_initial_condition(op, discr):
+    """Return the equilibrium distributions of the double shear layer."""
+    from hedge.data import CompiledExpressionData
+
+    def ic_expr(t, x, fields):
+        from hedge.optemplate import CFunction
+        from pymbolic.primitives import IfPositive
+        from pytools.obj_array import make_obj_array
+
+        tanh = CFunction("tanh")
+        sin = CFunction("sin")
+
+        u0 = 0.05
+        w = 0.05
+        delta = 0.05
+
+        from hedge.tools.symbolic import make_common_subexpression as cse
+        u = cse(make_obj_array([
+            IfPositive(x[1]-1/2,
+                u0*tanh(4*(3/4-x[1])/w),
+                u0*tanh(4*(x[1]-1/4)/w)),
+            u0*delta*sin(2*numpy.pi*(x[0]+1/4))]),
+            "u")
+
+        return make_obj_array([
+            op.method.f_equilibrium(1, alpha, u)
+            for alpha in range(len(op.method))
+            ])
+
+    return CompiledExpressionData(ic_expr).volume_interpolant(0, discr)
+
+
+
+
+def time_call(f, arg, repeat):
+    """Return the smallest wall time of *repeat* calls of *f(arg)*, after
+    one untimed warm-up call.
+    """
+    from time import time
+
+    f(arg)
+
+    best = None
+    for i in range(repeat):
+        start = time()
+        f(arg)
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+
+
+def main():
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--order", type="int", default=3)
+    parser.add_option("--subdivisions", type="int", default=70)
+    parser.add_option("--single", action="store_true",
+            help="use single precision")
+    parser.add_option("--repeat", type="int", default=10,
+            help="number of calls to take the minimum time of")
+    options, args = parser.parse_args()
+
+    if options.single:
+        dtype = numpy.float32
+    else:
+        dtype = numpy.float64
+
+    from hedge.mesh.generator import make_rect_mesh
+    mesh = make_rect_mesh(a=(0, 0), b=(1, 1), max_area=1e-4,
+            periodicity=(True, True),
+            subdivisions=(options.subdivisions, options.subdivisions))
+
+    from hedge.backends.jit import Discretization
+    discr = Discretization(mesh, order=options.order,
+            default_scalar_type=dtype)
+
+    from hedge.models.gas_dynamics.lbm import (
+            D2Q9LBMMethod, LatticeBoltzmannOperator,
+            pack_distributions)
+
+    op = LatticeBoltzmannOperator(
+            D2Q9LBMMethod(), lbm_delta_t=0.001, nu=1e-4)
+
+    f_bar = make_initial_condition(op, discr)
+    f = pack_distributions(f_bar)
+
+    collision_update = op.bind(discr, op.collision_update)
+    collide = op.bind_collision(discr)
+    stream_rhs = op.bind_rhs(discr)
+
+    updates = f.size
+    print "%d elements, %d nodes, %d distributions" % (
+            len(mesh.elements), len(discr), len(op.method))
+    print
+
+    print "%-32s %10s %12s" % ("step", "time", "Mupdates/s")
+    for name, func, arg in [
+            ("collision (operator template)", collision_update, f_bar),
+            ("collision (fused, contiguous)", collide, f),
+            ("streaming rhs", lambda f_bar: stream_rhs(0, f_bar), f_bar),
+            ("streaming rhs (contiguous)", lambda f: stream_rhs(0, f), f),
+            ]:
+        elapsed = time_call(func, arg, options.repeat)
+        print "%-32s %9.4fs %12.2f" % (name, elapsed, updates/elapsed/1e6)
+
+    discr.close()
+
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+"""This benchmark times right-hand side evaluations of the models in
+:mod:`hedge.models` across dimensions, orders and scalar types, and relates
+the achieved flop and memory bandwidth rates to a simple roofline model of
+the machine.
+
+Results can be written to a JSON file with ``--output`` and compared against
+an earlier run with ``--compare`` to catch performance regressions.
+"""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2009 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+
+
+import numpy
+
+
+
+
+# {{{ machine model -----------------------------------------------------------
+def measure_peak_bandwidth(size=1<<23, repeat=5):
+    """Return the bandwidth of an out-of-place vector sum, in bytes per
+    second, which is a reasonable stand-in for the machine's attainable
+    memory bandwidth.
+    """
+    from time import time
+
+    a = numpy.empty(size)
+    b = numpy.ones(size)
+    c = numpy.ones(size)
+
+    best = None
+    for i in range(repeat):
+        start = time()
+        numpy.add(b, c, a)
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return 3*a.nbytes/best
+
+
+
+
+def measure_peak_flops(n=1000, repeat=3):
+    """Return the flop rate of a dense matrix product, in flops per second."""
+    from time import time
+
+    a = numpy.random.randn(n, n)
+    b = numpy.random.randn(n, n)
+
+    best = None
+    for i in range(repeat):
+        start = time()
+        numpy.dot(a, b)
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return 2*n**3/best
+
+# }}}
+
+
+
+
+# {{{ problems ----------------------------------------------------------------
+OPERATORS = ["advection", "wave", "maxwell", "euler", "poisson"]
+
+
+
+
+def make_mesh(dimensions, element_count):
+    # periodic meshes keep boundary condition handling out of the picture
+    if dimensions == 2:
+        from hedge.mesh.generator import make_rect_mesh
+        return make_rect_mesh(max_area=1/element_count,
+                periodicity=(True, True))
+    elif dimensions == 3:
+        from hedge.mesh.generator import make_box_mesh
+        return make_box_mesh(max_volume=1/element_count,
+                periodicity=(True, True, True))
+    else:
+        raise ValueError("unsupported dimension count: %d" % dimensions)
+
+
+
+
+def make_problem(name, discr):
+    """Return a tuple *(rhs, fields)*, where *rhs* is a function of the field
+    state that evaluates the right-hand side of operator *name*.
+    """
+    from hedge.tools import join_fields
+
+    dims = discr.dimensions
+
+    def random_field(offset=0, amplitude=1):
+        result = discr.volume_zeros()
+        result[:] = offset + amplitude*numpy.random.randn(len(discr))
+        return result
+
+    def random_fields(count):
+        return join_fields(*[random_field() for i in range(count)])
+
+    if name == "advection":
+        from hedge.models.advection import StrongAdvectionOperator
+        v = numpy.array([1] + [0]*(dims-1), dtype=numpy.float64)
+        op_rhs = StrongAdvectionOperator(v, flux_type="upwind").bind(discr)
+        return (lambda u: op_rhs(0, u)), random_field()
+
+    elif name == "wave":
+        from hedge.models.wave import StrongWaveOperator
+        op_rhs = StrongWaveOperator(-1, dims, flux_type="upwind").bind(discr)
+        return (lambda w: op_rhs(0, w)), random_fields(dims+1)
+
+    elif name == "maxwell":
+        if dims == 2:
+            from hedge.models.em import TMMaxwellOperator as op_class
+        else:
+            from hedge.models.em import MaxwellOperator as op_class
+        op = op_class(1, 1, flux_type=1)
+        op_rhs = op.bind(discr)
+
+        from hedge.tools import count_subset
+        return ((lambda w: op_rhs(0, w)),
+                random_fields(count_subset(op.get_eh_subset())))
+
+    elif name == "euler":
+        from hedge.models.gas_dynamics import (
+                GasDynamicsOperator, GammaLawEOS)
+        op_rhs = GasDynamicsOperator(dims,
+                equation_of_state=GammaLawEOS(1.4)).bind(discr)
+
+        q = join_fields(
+                random_field(1, 0.01),
+                random_field(2.5, 0.01),
+                *[random_field(0, 0.1) for i in range(dims)])
+
+        return (lambda q: op_rhs(0, q)[0]), q
+
+    elif name == "poisson":
+        from hedge.models.poisson import PoissonOperator
+        return PoissonOperator(dims).bind(discr), random_field()
+
+    else:
+        raise ValueError("unknown operator: %s" % name)
+
+# }}}
+
+
+
+
+# {{{ measurement -------------------------------------------------------------
+def estimate_flops(insn, discr):
+    """Return a model flop count for one execution of *insn* if it is one of
+    the instructions whose work is not counted by the runtime profile.
+    """
+    from hedge.compiler import (
+            FluxBatchAssign, DiffBatchAssign, ElementwiseBatchAssign)
+    from hedge.backends.jit.compiler import XYZDiffBatchAssign
+    from hedge.tools.flops import (
+            diff_rst_flops, mass_flops, gather_flops, lift_flops)
+
+    if isinstance(insn, FluxBatchAssign):
+        if getattr(insn, "is_boundary", False):
+            return 0
+        return len(insn.expressions) * (
+                gather_flops(discr, getattr(insn, "quadrature_tag", None))
+                + sum(lift_flops(fg) for fg in discr.face_groups))
+    elif isinstance(insn, DiffBatchAssign):
+        return len(insn.operators)*diff_rst_flops(discr)
+    elif isinstance(insn, XYZDiffBatchAssign):
+        return discr.dimensions*(diff_rst_flops(discr)
+                + 2*len(insn.xyz_axes)*len(discr))
+    elif isinstance(insn, ElementwiseBatchAssign):
+        return len(insn.fields)*mass_flops(discr)
+    else:
+        return 0
+
+
+
+
+def run_case(name, dimensions, order, dtype, element_count, repeat):
+    mesh = make_mesh(dimensions, element_count)
+
+    from hedge.backends.jit import Discretization
+    discr = Discretization(mesh, order=order, default_scalar_type=dtype)
+
+    # capture the executors the model compiles so that they can be profiled
+    executors = []
+    base_compile = discr.compile
+
+    def compile(*args, **kwargs):
+        executor = base_compile(*args, **kwargs)
+        executors.append(executor)
+        return executor
+
+    discr.compile = compile
+
+    rhs, fields = make_problem(name, discr)
+
+    # warm up: builds and tunes kernels
+    rhs(fields)
+
+    profiles = [ex.code.enable_profiling() for ex in executors]
+    for profile in profiles:
+        profile.clear()
+
+    from time import time
+    start = time()
+    for i in range(repeat):
+        rhs(fields)
+    seconds = (time() - start)/repeat
+
+    flops = 0
+    nbytes = 0
+    for profile in profiles:
+        for insn, stats in profile.stats.iteritems():
+            nbytes += stats.bytes
+            if stats.flops is not None:
+                flops += stats.flops
+            else:
+                flops += stats.count*estimate_flops(insn, discr)
+
+    flops /= repeat
+    nbytes /= repeat
+
+    from hedge.tools import count_dofs
+    return dict(
+            operator=name, dimensions=dimensions, order=order,
+            dtype=numpy.dtype(dtype).name,
+            elements=len(mesh.elements), dofs=len(discr),
+            seconds=seconds, flops=flops, bytes=nbytes,
+            dof_updates_per_second=count_dofs(fields)/seconds,
+            )
+
+
+
+
+def add_roofline(result, peak_flops, peak_bandwidth):
+    result["gflops"] = result["flops"]/result["seconds"]/1e9
+    result["gbs"] = result["bytes"]/result["seconds"]/1e9
+
+    if result["bytes"]:
+        intensity = result["flops"]/result["bytes"]
+        attainable = min(peak_flops, intensity*peak_bandwidth)
+    else:
+        intensity = None
+        attainable = peak_flops
+
+    result["intensity"] = intensity
+    result["roofline_fraction"] = (
+            result["flops"]/result["seconds"]/attainable)
+
+# }}}
+
+
+
+
+# {{{ reporting ---------------------------------------------------------------
+def case_key(result):
+    return (result["operator"], result["dimensions"], result["order"],
+            result["dtype"])
+
+
+
+
+def print_header():
+    print "%-10s %3s %5s %8s %9s %10s %8s %8s %6s %7s %10s" % (
+            "operator", "dim", "order", "dtype", "dofs", "time [ms]",
+            "GFlops/s", "GB/s", "AI", "roofl.", "DOF-upd/s")
+
+
+
+
+def print_result(result):
+    intensity = result["intensity"]
+    if intensity is None:
+        intensity_str = "-"
+    else:
+        intensity_str = "%.2f" % intensity
+
+    print "%-10s %3d %5d %8s %9d %10.3f %8.3f %8.3f %6s %6.1f%% %10.3g" % (
+            result["operator"], result["dimensions"], result["order"],
+            result["dtype"], result["dofs"], 1e3*result["seconds"],
+            result["gflops"], result["gbs"], intensity_str,
+            100*result["roofline_fraction"],
+            result["dof_updates_per_second"])
+
+
+
+
+def compare(results, baseline):
+    baseline = dict((case_key(r), r) for r in baseline)
+
+    print
+    print "%-10s %3s %5s %8s %10s %10s %8s" % (
+            "operator", "dim", "order", "dtype",
+            "base [ms]", "now [ms]", "speedup")
+
+    for result in results:
+        try:
+            base = baseline[case_key(result)]
+        except KeyError:
+            continue
+
+        print "%-10s %3d %5d %8s %10.3f %10.3f %7.2fx" % (
+                result["operator"], result["dimensions"], result["order"],
+                result["dtype"], 1e3*base["seconds"], 1e3*result["seconds"],
+                base["seconds"]/result["seconds"])
+
+# }}}
+
+
+
+
+def main():
+    from optparse import OptionParser
+
+    def int_list(s):
+        return [int(x) for x in s.split(",")]
+
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--dimensions", default="2,3",
+            help="comma-separated list of dimension counts")
+    parser.add_option("--orders", default="1,2,3,4,5,6,7,8",
+            help="comma-separated list of orders")
+    parser.add_option("--dtypes", default="float64,float32",
+            help="comma-separated list of scalar types")
+    parser.add_option("--operators", default=",".join(OPERATORS),
+            help="comma-separated subset of %s" % ", ".join(OPERATORS))
+    parser.add_option("--elements", type="int", default=200,
+            help="approximate number of elements in each mesh")
+    parser.add_option("--repeat", type="int", default=10,
+            help="number of right-hand side evaluations to average over")
+    parser.add_option("--peak-gflops", type="float",
+            help="peak flop rate for the roofline (measured if not given)")
+    parser.add_option("--peak-gbs", type="float",
+            help="peak bandwidth for the roofline (measured if not given)")
+    parser.add_option("--output", metavar="FILE",
+            help="write results to FILE as JSON")
+    parser.add_option("--compare", metavar="FILE",
+            help="compare against results saved earlier with --output")
+    options, args = parser.parse_args()
+
+    if options.peak_gflops is not None:
+        peak_flops = options.peak_gflops*1e9
+    else:
+        peak_flops = measure_peak_flops()
+
+    if options.peak_gbs is not None:
+        peak_bandwidth = options.peak_gbs*1e9
+    else:
+        peak_bandwidth = measure_peak_bandwidth()
+
+    print "roofline: %.3g GFlops/s peak, %.3g GB/s peak, ridge at %.2f flops/byte" % (
+            peak_flops/1e9, peak_bandwidth/1e9, peak_flops/peak_bandwidth)
+    print
+
+    print_header()
+
+    results = []
+    for dimensions in int_list(options.dimensions):
+        for name in options.operators.split(","):
+            for order in int_list(options.orders):
+                for dtype_name in options.dtypes.split(","):
+                    result = run_case(name, dimensions, order,
+                            numpy.dtype(dtype_name).type,
+                            options.elements, options.repeat)
+                    add_roofline(result, peak_flops, peak_bandwidth)
+                    print_result(result)
+                    results.append(result)
+
+    if options.output is not None:
+        import json
+        outf = open(options.output, "w")
+        try:
+            json.dump(dict(
+                peak_flops=peak_flops,
+                peak_bandwidth=peak_bandwidth,
+                results=results), outf, indent=2)
+        finally:
+            outf.close()
+
+    if options.compare is not None:
+        import json
+        inf = open(options.compare)
+        try:
+            baseline = json.load(inf)["results"]
+        finally:
+            inf.close()
+
+        compare(results, baseline)
+
+
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: foldmethod=marker
@@ -0,0 +1,132 @@
+"""This benchmark compares the accuracy and throughput of double-precision,
+single-precision and mixed-precision (single-precision storage with
+double-precision time stepper arithmetic and reductions) runs of an
+advection problem with a known exact solution.
+"""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2009 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+
+
+import numpy
+
+
+
+
+MODES = [
+        ("double", numpy.float64, False),
+        ("single", numpy.float32, False),
+        ("mixed", numpy.float32, True),
+        ]
+
+
+
+
+def run(mode_name, dtype, mixed_precision, order, element_count, final_time):
+    from math import sin, pi
+    from hedge.mesh.generator import make_rect_mesh
+    mesh = make_rect_mesh(a=(0, 0), b=(2*pi, 2*pi),
+            max_area=4*pi**2/element_count, periodicity=(True, True))
+
+    from hedge.backends.jit import Discretization
+    discr = Discretization(mesh, order=order, default_scalar_type=dtype)
+
+    v = numpy.array([1, 0.5])
+
+    def u_analytic(x, el, t):
+        return sin(x[0] - v[0]*t) * sin(x[1] - v[1]*t)
+
+    from hedge.models.advection import StrongAdvectionOperator
+    op = StrongAdvectionOperator(v, flux_type="upwind")
+    rhs = op.bind(discr)
+
+    u = discr.interpolate_volume_function(
+            lambda x, el: u_analytic(x, el, 0))
+
+    from hedge.timestep.runge_kutta import LSRK4TimeStepper
+    stepper = LSRK4TimeStepper(dtype=dtype, mixed_precision=mixed_precision)
+
+    dt = op.estimate_timestep(discr, stepper=stepper)
+    nsteps = int(final_time/dt) + 1
+    dt = final_time/nsteps
+
+    # warm up: builds and tunes kernels
+    stepper(u, 0, dt, rhs)
+
+    from time import time
+    start = time()
+    for step in xrange(nsteps):
+        u = stepper(u, step*dt, dt, rhs)
+    seconds = time() - start
+
+    u_true = discr.interpolate_volume_function(
+            lambda x, el: u_analytic(x, el, final_time))
+    error = discr.norm(u - u_true)
+
+    return dict(mode=mode_name, order=order, dofs=len(discr),
+            steps=nsteps, seconds_per_step=seconds/nsteps,
+            error=error)
+
+
+
+
+def main():
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--orders", default="2,4,6",
+            help="comma-separated list of orders")
+    parser.add_option("--elements", type="int", default=400,
+            help="approximate number of elements in the mesh")
+    parser.add_option("--final-time", type="float", default=1)
+    options, args = parser.parse_args()
+
+    print "%-8s %5s %9s %7s %12s %9s %12s" % (
+            "mode", "order", "dofs", "steps", "step [ms]", "speedup",
+            "L2 error")
+
+    for order in [int(o) for o in options.orders.split(",")]:
+        reference_time = None
+
+        for mode_name, dtype, mixed_precision in MODES:
+            result = run(mode_name, dtype, mixed_precision, order,
+                    options.elements, options.final_time)
+
+            if reference_time is None:
+                reference_time = result["seconds_per_step"]
+
+            print "%-8s %5d %9d %7d %12.3f %8.2fx %12.4e" % (
+                    result["mode"], result["order"], result["dofs"],
+                    result["steps"], 1e3*result["seconds_per_step"],
+                    reference_time/result["seconds_per_step"],
+                    result["error"])
+
+
+
+
+if __name__ == "__main__":
+    main()
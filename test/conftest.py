@@ -0,0 +1,20 @@
+"""Keep the persistent caches of hedge, i.e. the JIT tuning database and
+the reference matrix cache, out of the user's home directory during test
+runs.
+"""
+
+from __future__ import division
+
+import os
+
+
+
+
+if "HEDGE_CACHE_DIR" not in os.environ:
+    from tempfile import mkdtemp
+    _cache_dir = os.environ["HEDGE_CACHE_DIR"] = mkdtemp(
+            prefix="hedge-test-cache-")
+
+    import atexit
+    from shutil import rmtree
+    atexit.register(rmtree, _cache_dir, True)
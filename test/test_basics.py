@@ -378,6 +378,42 @@ def test_adaptive_timestep():
 
 
 
+def test_timestep_controller():
+    class Discretization:
+        reductions = 0
+
+        def nodewise_max(self, a):
+            self.reductions += 1
+            return numpy.max(a)
+
+    class Operator:
+        def estimate_timestep(self, discr, t=None, max_eigenvalue=None):
+            return 1/max_eigenvalue
+
+    discr = Discretization()
+    speeds = iter([2, 4, 8, 16, 32])
+
+    def rhs(t, q):
+        return -q, numpy.array([0, next(speeds)])
+
+    from hedge.timestep import TimestepController
+    controller = TimestepController(Operator(), discr, estimate_every=2)
+    rhs = controller.wrap_rhs(rhs)
+
+    q = numpy.ones(2)
+    assert (rhs(0, q) == -q).all()
+
+    dts = []
+    for step in range(4):
+        dts.append(controller(step))
+        rhs(step, q)
+
+    assert dts == [1/2, 1/2, 1/8, 1/8]
+    assert discr.reductions == 2
+
+
+
+
 def test_face_vertex_order():
     """Verify that face_indices() emits face vertex indices in the right order"""
     from hedge.discretization.local import \
@@ -916,6 +952,158 @@ def test_identify_affine_map():
 
 
 
+
+
+def test_jit_tuning_database():
+    """Check that JIT tuning decisions survive a save/load cycle."""
+    from tempfile import mkdtemp
+    from shutil import rmtree
+    from os.path import join
+    from hedge.backends.jit.tuning import TuningDatabase
+
+    tmpdir = mkdtemp()
+    try:
+        filename = join(tmpdir, "tuning.json")
+        key = ("diff", 4, 3, 1024, "float64", "some cpu")
+
+        # the "functions" to choose from are their own benchmark timings
+        def benchmark(f):
+            return f
+
+        db = TuningDatabase(filename)
+        assert db.lookup(key) is None
+        assert db.pick(key, benchmark, [("slow", 2), ("fast", 1)]) == "fast"
+
+        # a fresh instance must find the decision without benchmarking
+        db2 = TuningDatabase(filename)
+        assert db2.lookup(key) == "fast"
+        assert db2.pick(key, None, [("slow", 2), ("fast", 1)]) == "fast"
+
+        db2.retune = True
+        assert db2.pick(key, benchmark, [("slow", 0), ("fast", 1)]) == "slow"
+
+        # saving keeps the decisions that other instances stored meanwhile
+        other_key = ("lift", 4, 3, 1024, "float64", "some cpu")
+        assert db.pick(other_key, benchmark, [("a", 1), ("b", 2)]) == "a"
+
+        db3 = TuningDatabase(filename)
+        assert db3.lookup(key) == "slow"
+        assert db3.lookup(other_key) == "a"
+    finally:
+        rmtree(tmpdir)
+
+
+
+
+def test_matrix_cache(tmpdir):
+    """Check that reference matrices survive a store/load cycle and that
+    corrupt cache entries are recomputed."""
+    from hedge.discretization.matrix_cache import MatrixCache
+
+    calls = []
+
+    def compute():
+        calls.append(None)
+        return [numpy.eye(3), numpy.arange(4.)]
+
+    key = ("triangle", 3, None, "digest", "mats")
+
+    cache = MatrixCache(str(tmpdir))
+    assert cache.load(key) is None
+    mats = cache.get(key, compute)
+    assert len(calls) == 1
+
+    # a fresh instance must find the entry without computing it
+    cached = MatrixCache(str(tmpdir)).get(key, compute)
+    assert len(calls) == 1
+    assert isinstance(cached, list) and len(cached) == 2
+    for mat, cached_mat in zip(mats, cached):
+        assert (mat == cached_mat).all()
+
+    single_key = key[:-1] + ("mat",)
+    cache.store(single_key, numpy.ones((2, 2)))
+    assert (cache.load(single_key) == numpy.ones((2, 2))).all()
+
+    # corrupt entries are ignored and overwritten
+    outf = open(cache._filename(key), "wb")
+    outf.write("not an npz file")
+    outf.close()
+
+    assert cache.load(key) is None
+    cache.get(key, compute)
+    assert len(calls) == 2
+    assert len(cache.load(key)) == 2
+
+    # non-persistent caches compute every time
+    MatrixCache(str(tmpdir.join("other")), persistent=False).get(key, compute)
+    assert len(calls) == 3
+    assert not tmpdir.join("other").check()
+
+
+
+
+def test_optemplate_processing_cache():
+    """Check that reprocessing an optemplate with a shared cache reuses
+    the earlier result."""
+    from hedge.mesh.generator import make_rect_mesh
+    from hedge.models.wave import StrongWaveOperator
+    from hedge.optemplate.tools import (
+            process_optemplate, OptemplateProcessingCache)
+
+    mesh = make_rect_mesh(max_area=0.1)
+    cache = OptemplateProcessingCache()
+
+    timings = {}
+    first = process_optemplate(StrongWaveOperator(1, 2).op_template(),
+            mesh=mesh, cache=cache, pass_timings=timings)
+    assert "bind" in timings and "derivative-join" in timings
+
+    # a structurally identical, but freshly built template
+    second = process_optemplate(StrongWaveOperator(1, 2).op_template(),
+            mesh=mesh, cache=cache)
+
+    from hedge.tools import is_obj_array
+    if is_obj_array(first):
+        assert all(f is s for f, s in zip(first, second))
+    else:
+        assert first is second
+
+
+
+
+def test_memoizing_mapper_constant_types():
+    """Check that memoized optemplate passes keep apart expressions that
+    differ only in the types of their constants."""
+    from pymbolic.primitives import Quotient
+    from hedge.optemplate import Field
+    from hedge.optemplate.mappers import OperatorBinder
+
+    binder = OperatorBinder()
+    u = Field("u")
+
+    assert isinstance(binder(Quotient(u, 2)).denominator, int)
+    assert isinstance(binder(Quotient(u, 2.0)).denominator, float)
+
+
+
+
+def test_mixed_precision_accumulation():
+    """Check that single-precision reductions and mixed-precision time
+    stepper coefficients use double precision."""
+    from hedge.vector_primitives import accumulating_dot
+    from hedge.timestep.base import get_scalar_dtype
+
+    a = numpy.random.rand(10**6).astype(numpy.float32)
+    exact = numpy.dot(a.astype(numpy.float64), a.astype(numpy.float64))
+    assert abs(accumulating_dot(a, a) - exact) < 1e-10*exact
+
+    assert get_scalar_dtype(numpy.float32) == numpy.float32
+    assert get_scalar_dtype(numpy.float32, mixed_precision=True) \
+            == numpy.float64
+    assert get_scalar_dtype(numpy.complex64, mixed_precision=True) \
+            == numpy.float32
+
+
 # main program ----------------------------------------------------------------
 if __name__ == "__main__":
     import sys
@@ -1019,6 +1019,357 @@ def test_elliptic():
 
 
 
+def test_batched_elementwise_operators():
+    """Check that element-local operators applied to several fields are
+    batched into one instruction and give the same results."""
+    from hedge.mesh.generator import make_square_mesh
+    mesh = make_square_mesh(a=-1, b=1, max_area=0.1)
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags(),
+            quad_min_degrees={"quad": 9})
+
+    from hedge.optemplate import MassOperator, Field, QuadratureGridUpsampler
+    from hedge.compiler import ElementwiseBatchAssign
+    from hedge.tools import join_fields
+
+    f = discr.interpolate_volume_function(lambda x, el: x[0]**2 + x[1])
+    g = discr.interpolate_volume_function(lambda x, el: x[0]*x[1])
+
+    for op in [MassOperator(), QuadratureGridUpsampler("quad")]:
+        ex = discr.compile(join_fields(op(Field("f")), op(Field("g"))))
+
+        batch_sizes = [len(insn.names) for insn in ex.code.instructions
+                if isinstance(insn, ElementwiseBatchAssign)]
+        assert batch_sizes == [2]
+
+        f_res, g_res = ex(f=f, g=g)
+        single = discr.compile(op(Field("f")))
+        assert la.norm(f_res - single(f=f)) < 1e-13*la.norm(f_res)
+        assert la.norm(g_res - single(f=g)) < 1e-13*la.norm(g_res)
+
+
+
+
+def test_fused_flux_lift():
+    """Check that the fused (element-centric) flux gather and lift matches
+    the separate gather and lift."""
+    from hedge.mesh.generator import make_disk_mesh
+    from hedge.mesh import TAG_ALL
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    from hedge.flux import make_normal, FluxScalarPlaceholder
+    from hedge.optemplate import Field, BoundaryPair, \
+            InverseMassOperator, get_flux_operator
+    u = FluxScalarPlaceholder(0)
+    normal = make_normal(discr.dimensions)
+    flux_op = get_flux_operator(
+            u.avg*normal[0] + 0.5*(u.int - u.ext)*normal[1])
+
+    for optemplate in [
+            flux_op(Field("u")) + flux_op(BoundaryPair(Field("u"), Field("bc"))),
+            InverseMassOperator()(flux_op(Field("u")))]:
+        ex = discr.compile(optemplate)
+
+        u_vol = discr.interpolate_volume_function(
+                lambda x, el: x[0]**2 - 3*x[1])
+        bc = discr.boundarize_volume_field(u_vol, TAG_ALL)
+
+        results = []
+        for variant in ["separate", "fused"]:
+            ex.chosen_variants["flux_lift"] = variant
+            results.append(ex(u=u_vol, bc=bc))
+
+        separate, fused = results
+        assert la.norm(fused - separate) < 1e-12*la.norm(separate)
+
+
+
+
+def test_compiled_select_and_elementwise_max():
+    """Check that pointwise selects and element-wise maxima of vector
+    expressions are compiled into fused kernels and match numpy."""
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    from pymbolic.primitives import IfPositive
+    from hedge.optemplate import Field
+    from hedge.optemplate.operators import ElementwiseMaxOperator
+    from hedge.backends.jit.compiler import (
+            VectorExprAssign, ElementwiseMaxAssign)
+    from hedge.tools import join_fields
+
+    u = Field("u")
+    ex = discr.compile(join_fields(
+        IfPositive(u, 1, -1),
+        ElementwiseMaxOperator()(u*u - 2*u)))
+
+    insn_types = set(type(insn) for insn in ex.code.instructions)
+    assert VectorExprAssign in insn_types
+    assert ElementwiseMaxAssign in insn_types
+
+    u_vol = discr.interpolate_volume_function(
+            lambda x, el: x[0] - 2*x[1]**2)
+    sign, elwise_max = ex(u=u_vol)
+
+    assert (sign == numpy.where(u_vol > 0, 1, -1)).all()
+
+    ref = u_vol*u_vol - 2*u_vol
+    for eg in discr.element_groups:
+        for el_slice in eg.ranges:
+            assert abs(elwise_max[el_slice] - ref[el_slice].max()).max() \
+                    < 1e-14
+
+
+
+
+def test_xyz_diff_fusion():
+    """Check that global derivatives are computed from per-element metric
+    constants in one instruction, and that they match the unfused ones."""
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+
+    from hedge.optemplate import Field, make_nabla
+    from hedge.backends.jit.compiler import XYZDiffBatchAssign
+    u = Field("u")
+    nabla = make_nabla(2)
+    optemplate = nabla*u + nabla*(u*u)
+
+    results = []
+    for debug in [set(), set(["jit_no_xyz_diff"])]:
+        discr = discr_class(mesh, order=4, debug=debug)
+        ex = discr.compile(optemplate)
+
+        insn_types = set(type(insn) for insn in ex.code.instructions)
+        assert (XYZDiffBatchAssign in insn_types) == (not debug)
+
+        u_vol = discr.interpolate_volume_function(
+                lambda x, el: numpy.sin(3*x[0])*x[1])
+        results.append(ex(u=u_vol))
+
+    fused, unfused = results
+    for fused_i, unfused_i in zip(fused, unfused):
+        assert la.norm(fused_i - unfused_i) < 1e-12*la.norm(unfused_i)
+
+
+
+
+def test_assignment_aggregation_caps():
+    """Check that aggregated assignments of a model operator come out in
+    dependency order and stay within the vector and flop caps."""
+    from hedge.mesh.generator import make_rect_mesh
+    mesh = make_rect_mesh(max_area=0.1)
+    discr = discr_class(mesh, order=2)
+
+    from hedge.models.em import TMMaxwellOperator
+    from hedge.optemplate import process_optemplate
+    from hedge.optemplate.mappers import QuadratureUpsamplerRemover
+    optemplate = process_optemplate(
+            QuadratureUpsamplerRemover(discr.quad_min_degrees)(
+                TMMaxwellOperator(1, 1, flux_type=1).op_template()),
+            mesh=discr.mesh)
+
+    from pymbolic.primitives import Variable
+    from hedge.backends.jit.compiler import OperatorCompiler, VectorExprAssign
+
+    def compile_with_caps(max_vectors, max_flops):
+        compiler = OperatorCompiler(discr)
+        compiler.max_vectors_in_batch_expr = max_vectors
+        compiler.max_flops_in_batch_expr = max_flops
+        return compiler(optemplate)
+
+    def get_vector_assigns(code):
+        return [insn for insn in code.instructions
+                if isinstance(insn, VectorExprAssign)]
+
+    def get_vector_count(insn):
+        return len(insn.get_dependencies(each_vector=True)
+                | set(Variable(name) for name in insn.names))
+
+    # with zero caps, nothing is aggregated
+    single_assigns = get_vector_assigns(compile_with_caps(0, 0))
+    max_vectors = max(get_vector_count(insn) for insn in single_assigns)
+    max_flops = max(insn.flop_count() for insn in single_assigns)
+
+    for caps in [(100, 500), (max_vectors, max_flops)]:
+        code = compile_with_caps(*caps)
+
+        assigned_names = set()
+        for insn in code.instructions:
+            assigned_names |= insn.get_assignees()
+
+        available_names = set()
+        for insn in code.instructions:
+            for dep in insn.get_dependencies():
+                if (isinstance(dep, Variable)
+                        and dep.name in assigned_names
+                        and dep.name not in insn.get_assignees()):
+                    assert dep.name in available_names
+            available_names |= insn.get_assignees()
+
+        for insn in get_vector_assigns(code):
+            assert get_vector_count(insn) <= max(caps[0], max_vectors)
+            assert insn.flop_count() <= max(caps[1], max_flops)
+
+
+
+
+def test_compile_and_runtime_profile():
+    """Check that compiling and first running an operator records its
+    compile phases and module builds, and that runtime profiling records
+    every instruction."""
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=2,
+            debug=discr_class.noninteractive_debug_flags())
+
+    from hedge.flux import make_normal, FluxScalarPlaceholder
+    from hedge.optemplate import Field, InverseMassOperator, get_flux_operator
+    u = FluxScalarPlaceholder(0)
+    optemplate = 2*Field("u") + InverseMassOperator()(
+            get_flux_operator(u.avg*make_normal(discr.dimensions)[0])(
+                Field("u")))
+
+    u_vol = discr.interpolate_volume_function(lambda x, el: x[0]*x[1])
+
+    profiles = []
+    for i in range(2):
+        ex = discr.compile(optemplate)
+        ex(u=u_vol)
+        profiles.append(ex.compile_profile)
+
+    first, second = profiles
+    phase_names = [name for name, seconds in first.phases]
+    assert "optemplate:bind" in phase_names
+    assert "compiler:aggregation" in phase_names
+    assert first.instruction_flops
+
+    # the second compilation of the same operator only rebuilds modules
+    # that the first one already built
+    assert first.modules and second.modules
+    assert all(mb.cache_hit for mb in second.modules)
+    assert not [mb for mb in first.modules if mb in second.modules]
+    assert "total" in str(first)
+
+    # runtime profile
+    profile = ex.code.enable_profiling()
+    for i in range(2):
+        ex(u=u_vol)
+
+    assert set(profile.stats) == set(ex.code.instructions)
+    assert all(st.count == 2 for st in profile.stats.itervalues())
+    assert profile.total_seconds() > 0
+
+    from hedge.compiler import dot_dataflow_graph
+    assert "calls" in dot_dataflow_graph(ex.code, profile=profile)
+    str(profile)
+
+
+
+
+def test_elliptic_preconditioners():
+    """Check block-Jacobi blocks and sparse assembly against the dense
+    operator and solve a Poisson problem with the p-multigrid preconditioner."""
+    from hedge.tools import unit_vector
+    from hedge.mesh import TAG_ALL, TAG_NONE
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.1, faces=20)
+
+    from hedge.backends import CPURunContext
+    rcon = CPURunContext()
+
+    discr = rcon.make_discretization(mesh, order=4,
+            debug=discr_class.noninteractive_debug_flags())
+
+    from hedge.data import GivenFunction
+    from hedge.models.poisson import PoissonOperator
+    from math import sin
+    op = PoissonOperator(discr.dimensions,
+            dirichlet_tag=TAG_ALL,
+            dirichlet_bc=GivenFunction(lambda x, el: sin(x[0])),
+            neumann_tag=TAG_NONE)
+    bound_op = op.bind(discr)
+
+    n = len(discr)
+    mat = numpy.zeros((n, n))
+    for j in range(n):
+        mat[:, j] = bound_op(unit_vector(n, j))
+
+    from hedge.iterative import probe_element_blocks
+    for eg, blocks in probe_element_blocks(rcon, discr, bound_op).iteritems():
+        for el_range, block in zip(eg.ranges, blocks):
+            assert la.norm(block - mat[el_range, el_range]) \
+                    < 1e-10*la.norm(block)
+
+    assembled = bound_op.assemble(rcon).toarray()
+    assert la.norm(assembled - mat) < 1e-10*la.norm(mat)
+
+    rhs = bound_op.prepare_rhs(
+            discr.interpolate_volume_function(lambda x, el: 1))
+
+    from hedge.iterative import parallel_cg
+    ref_sol = -parallel_cg(rcon, -bound_op, rhs, tol=1e-10)
+
+    for precon in [
+            bound_op.block_jacobi_preconditioner(rcon),
+            bound_op.p_multigrid_preconditioner(rcon)]:
+        sol = -parallel_cg(rcon, -bound_op, rhs, precon=-precon,
+                tol=1e-10, dot=discr.nodewise_dot_product)
+        assert la.norm(sol - ref_sol) < 1e-6*la.norm(ref_sol)
+
+    from hedge.iterative import parallel_pipelined_cg, parallel_bicgstab
+    for solver in [parallel_pipelined_cg, parallel_bicgstab]:
+        for precon in [None, -bound_op.block_jacobi_preconditioner(rcon)]:
+            sol = -solver(rcon, -bound_op, rhs, precon=precon, tol=1e-10)
+            assert la.norm(sol - ref_sol) < 1e-6*la.norm(ref_sol)
+
+
+
+
+def test_bicgstab_restart():
+    """Check that BiCGStab recovers when its recurrences converge before the
+    true residual does."""
+    from hedge.iterative import OperatorBase, parallel_bicgstab
+
+    # a nonnormal convection matrix, on which the recurrences drift
+    n = 100
+    mat = (2*numpy.eye(n)
+            - 1.9*numpy.eye(n, k=-1)
+            - 0.1*numpy.eye(n, k=1))
+    b = numpy.ones(n)
+    x = numpy.zeros(n)
+
+    class CountingOperator(OperatorBase):
+        solution_applications = 0
+
+        @property
+        def dtype(self):
+            return mat.dtype
+
+        @property
+        def shape(self):
+            return mat.shape
+
+        def __call__(self, operand):
+            if operand is x:
+                self.solution_applications += 1
+            return numpy.dot(mat, operand)
+
+    op = CountingOperator()
+
+    from hedge.backends import CPURunContext
+    sol = parallel_bicgstab(CPURunContext(), op, b, x=x, tol=1e-10)
+
+    # the true residual is computed at the start, for each restart and
+    # at convergence
+    assert op.solution_applications >= 3
+    assert la.norm(b - numpy.dot(mat, sol)) < 1e-10*la.norm(b)
+
+
+
 def test_projection():
     """Test whether projection between different orders works"""
 
@@ -1190,6 +1541,392 @@ def test_mesh_regrid():
 
 
 
+def test_gemm_element_operators():
+    """Check the BLAS-3 element-local operators against the builtin ones."""
+    from hedge.mesh.generator import make_disk_mesh
+    from hedge.backends.jit.gemm import \
+            GemmDifferentiator, GemmLifter, GemmElementwiseLinear
+
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=5,
+            debug=discr_class.noninteractive_debug_flags())
+
+    f = discr.interpolate_volume_function(
+            lambda x, el: x[0]**3 - 2*x[0]*x[1]**2)
+
+    from hedge.optemplate import \
+            ReferenceDifferentiationOperator, MassOperator, Field
+    from hedge.optemplate.operators import ReferenceMassOperator
+    ex = discr.compile(MassOperator() * Field("f"))
+
+    ref_ops = [ReferenceDifferentiationOperator(i)
+            for i in range(discr.dimensions)]
+
+    fg = discr.face_groups[0]
+    fof = numpy.random.randn(
+            fg.face_count*fg.face_length()*fg.element_count())
+    mat = fg.ldis_loc.lifting_matrix()
+    scaling = fg.local_el_inverse_jacobians
+
+    ref_lift = discr.volume_zeros()
+    from hedge._internal import lift_flux
+    lift_flux(fg, mat, scaling, fof, ref_lift)
+
+    ref_mass = discr.volume_zeros()
+    from hedge._internal import perform_elwise_operator
+    for eg in discr.element_groups:
+        perform_elwise_operator(eg.ranges, eg.ranges,
+                eg.mass_matrix, f, ref_mass)
+
+    for block_size in [None, 7]:
+        for ref, gemm in zip(ex.diff_builtin(ref_ops, f),
+                GemmDifferentiator(discr, block_size)(ref_ops, f)):
+            assert la.norm(ref - gemm) < 1e-12 * la.norm(ref)
+
+        gemm_lift = discr.volume_zeros()
+        GemmLifter(discr, block_size)(fg, mat, scaling, fof, gemm_lift)
+        assert la.norm(ref_lift - gemm_lift) < 1e-12 * la.norm(ref_lift)
+
+        gemm_mass = discr.volume_zeros()
+        GemmElementwiseLinear(discr, block_size)(
+                ReferenceMassOperator(), f, gemm_mass)
+        assert la.norm(ref_mass - gemm_mass) < 1e-12 * la.norm(ref_mass)
+
+    assert set(ex.chosen_variants) == set(["diff", "lift", "elwise_linear"])
+
+
+
+
+def test_per_element_vectors():
+    """Check that element averages and geometric factors are stored with
+    one value per element and give the same results as volume vectors."""
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=3)
+
+    from hedge.optemplate import Field, AveragingOperator, Jacobian
+    u = Field("u")
+    ave_u = AveragingOperator()(u)
+    optemplate = ave_u*u + Jacobian(None)*u
+
+    u_vol = discr.interpolate_volume_function(
+            lambda x, el: numpy.sin(3*x[0])*x[1])
+    result = discr.compile(optemplate)(u=u_vol)
+
+    ave = discr.volume_zeros()
+    for eg in discr.element_groups:
+        eg.el_array_from_volume(ave)[:] = numpy.dot(
+                eg.el_array_from_volume(u_vol),
+                AveragingOperator().matrix(eg).T)
+    jac = discr.volume_jacobians()
+    ref = ave*u_vol + jac*u_vol
+    assert la.norm(result - ref) < 1e-12*la.norm(ref)
+
+    assert la.norm(discr.compile(ave_u)(u=u_vol) - ave) < 1e-12*la.norm(ave)
+
+    from hedge.bad_cell import make_h_vector
+    h_pe = make_h_vector(discr, per_element=True)
+    assert h_pe.shape == (len(mesh.elements),)
+    assert la.norm(discr.broadcast_per_element(h_pe)
+            - make_h_vector(discr)) == 0
+
+
+
+
+def test_per_element_results_by_type():
+    """Check that only results typed as per-element are broadcast, even if
+    another result has one entry per element."""
+    from hedge.mesh.generator import make_regular_square_mesh
+    from hedge.mesh import TAG_ALL
+
+    # 32 triangles with 16 boundary faces, so that at order 1, boundary
+    # vectors have one entry per element
+    mesh = make_regular_square_mesh(n=5)
+    discr = discr_class(mesh, order=1)
+    assert len(discr.get_boundary(TAG_ALL).nodes) == len(mesh.elements)
+
+    from hedge.optemplate import Field, BoundarizeOperator, AveragingOperator
+    from hedge.tools import join_fields
+    u = Field("u")
+    u_vol = discr.interpolate_volume_function(
+            lambda x, el: x[0]*x[1] + x[1])
+    ref_bdry_u = discr.boundarize_volume_field(u_vol, TAG_ALL)
+
+    bdry_u = discr.compile(BoundarizeOperator(TAG_ALL)(u))(u=u_vol)
+    assert bdry_u.shape == ref_bdry_u.shape
+    assert la.norm(bdry_u - ref_bdry_u) == 0
+
+    bdry_u, ave_u = discr.compile(join_fields(
+        BoundarizeOperator(TAG_ALL)(u), AveragingOperator()(u)))(u=u_vol)
+    assert la.norm(bdry_u - ref_bdry_u) == 0
+    assert ave_u.shape == u_vol.shape
+
+
+
+
+def test_p_adaptive_fluxes():
+    """Check fluxes on a discretization whose elements are of differing
+    order, including the interfaces between them."""
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+
+    orders = [2 + 2*(el.id % 2) for el in mesh.elements]
+    discr = discr_class(mesh, order=orders,
+            debug=discr_class.noninteractive_debug_flags())
+    assert len(discr.element_groups) == 2
+    assert discr.mixed_order_face_groups
+
+    from hedge.flux import make_normal, FluxScalarPlaceholder
+    from hedge.optemplate import Field, BoundaryPair, get_flux_operator
+    from hedge.mesh import TAG_ALL
+    from hedge.discretization import ones_on_volume
+
+    normal = make_normal(discr.dimensions)
+    u_ph = FluxScalarPlaceholder(0)
+    u = Field("u")
+
+    x = discr.interpolate_volume_function(lambda x, el: x[0])
+
+    # continuous fields have no jumps, also across differing orders
+    jump = discr.compile(
+            get_flux_operator((u_ph.int-u_ph.ext)*normal[0])(u))(u=x)
+    assert la.norm(jump) < 1e-12
+
+    # Gauss's theorem, summed over all elements
+    one_sided = get_flux_operator(u_ph.int*normal[0])
+    flux = discr.compile(
+            one_sided(u) + one_sided(BoundaryPair(u, Field("bz"))))(
+                    u=x, bz=discr.boundary_zeros(TAG_ALL))
+
+    assert abs(numpy.dot(flux, ones_on_volume(discr))
+            - discr.mesh_volume()) < 1e-12
+
+
+
+
+def test_h_adaptive_transfer():
+    """Check that fields transfer exactly across refining and coarsening an
+    adaptive mesh, and that compiled code is reused across adaptations."""
+    from hedge.mesh.generator import make_disk_mesh
+    from hedge.adaptivity import AdaptiveTriangleMesh, adapt_discretization
+
+    amesh = AdaptiveTriangleMesh(make_disk_mesh(r=0.5, max_area=0.05))
+    discr = discr_class(amesh.mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+    el_count = len(discr.mesh.elements)
+
+    def f(x, el):
+        return x[0]**3 - 2*x[0]*x[1] + x[1]**2
+
+    from hedge.optemplate import MassOperator, Field
+    mass_op = MassOperator()(Field("u"))
+
+    # polynomials of the discretization's order are transferred exactly
+    u = discr.interpolate_volume_function(f)
+    discr, transfer = adapt_discretization(discr,
+            amesh.refine(range(0, el_count, 3)))
+    assert len(discr.mesh.elements) > el_count
+    u = transfer(u)
+    assert la.norm(u - discr.interpolate_volume_function(f)) < 1e-10
+
+    ex = discr.compile(mass_op)
+    ex(u=u)
+    code = ex.code
+    del ex
+
+    from weakref import ref
+    discr_ref = ref(discr)
+
+    while True:
+        prev_el_count = len(discr.mesh.elements)
+        discr, transfer = adapt_discretization(discr,
+                amesh.coarsen(range(prev_el_count)))
+        u = transfer(u)
+        assert la.norm(u - discr.interpolate_volume_function(f)) < 1e-10
+        assert discr.compile(mass_op).code.instructions is code.instructions
+
+        if len(discr.mesh.elements) == prev_el_count:
+            break
+
+    assert len(discr.mesh.elements) == el_count
+
+    # the shared code does not keep earlier discretizations alive
+    del transfer
+    import gc
+    gc.collect()
+    assert discr_ref() is None
+
+
+
+
+def test_separable_given_function():
+    """Check that modulated given functions only rescale their cached
+    spatial part."""
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=3)
+
+    from hedge.data import make_tdep_given, with_buffer_reuse, \
+            TimeHarmonicGivenFunction, TimeIntervalGivenFunction
+    gf = TimeIntervalGivenFunction(
+            TimeHarmonicGivenFunction(
+                make_tdep_given(lambda x, el: x[0]), omega=2),
+            off_time=1)
+
+    x = discr.nodes[:, 0]
+    result = gf.volume_interpolant(0.3, discr)
+    assert la.norm(result - numpy.sin(0.6)*x) < 1e-14
+
+    from hedge.mesh import TAG_ALL
+    bdry_x = discr.get_boundary(TAG_ALL).nodes[:, 0]
+    assert la.norm(gf.boundary_interpolant(0.3, discr, TAG_ALL)
+            - numpy.sin(0.6)*bdry_x) < 1e-14
+
+    # by default, earlier results are left alone
+    assert la.norm(gf.volume_interpolant(2, discr)) == 0
+    assert la.norm(result - numpy.sin(0.6)*x) < 1e-14
+
+    # with buffer reuse, outside the interval, the same buffer is zeroed
+    reusing_gf = with_buffer_reuse(gf)
+    result = reusing_gf.volume_interpolant(0.3, discr)
+    assert reusing_gf.volume_interpolant(2, discr) is result
+    assert la.norm(result) == 0
+
+
+
+
+def test_groupwise_reductions():
+    """Check integrals and inner products computed element group by element
+    group against the mass operator."""
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=3)
+
+    from hedge.tools import join_fields
+    u = join_fields(
+            discr.interpolate_volume_function(
+                lambda x, el: numpy.sin(3*x[0])*x[1]),
+            0,
+            discr.interpolate_volume_function(
+                lambda x, el: numpy.cos(2*x[1])))
+
+    from hedge.optemplate import MassOperator
+    mass_u = [MassOperator().apply(discr, u_i) for u_i in u[[0, 2]]]
+    mass_u.insert(1, 0)
+    ones = numpy.ones(len(discr.nodes))
+
+    ref_integral = numpy.array([numpy.dot(mass_u[0], ones), 0,
+        numpy.dot(mass_u[2], ones)])
+    assert la.norm(discr.integral(u) - ref_integral) < 1e-12
+    assert abs(discr.integral(u[0]) - ref_integral[0]) < 1e-12
+    assert abs(discr.integral(2) - 2*discr.integral(ones)) < 1e-12
+
+    ref_ip = numpy.dot(u[0], mass_u[0]) + numpy.dot(u[2], mass_u[2])
+    assert abs(discr.inner_product(u, u) - ref_ip) < 1e-12
+    assert abs(discr.norm(u) - ref_ip**0.5) < 1e-12
+
+
+
+
+def test_diagnostics_pipeline():
+    """Check that pipelined log quantities agree with the discretization's
+    reductions."""
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=3)
+
+    from hedge.tools import join_fields
+    u = join_fields(
+            discr.interpolate_volume_function(
+                lambda x, el: numpy.sin(3*x[0])*x[1]),
+            discr.interpolate_volume_function(
+                lambda x, el: numpy.cos(2*x[1])))
+
+    from hedge.optemplate import make_vector_field
+    u_sym = make_vector_field("u", 2)
+
+    from hedge.log import DiagnosticsPipeline
+    step = [0]
+    pipeline = DiagnosticsPipeline(discr, {"u": lambda: u},
+            step_getter=lambda: step[0])
+    int_q = pipeline.integral("int_u0", u_sym[0])
+    l2_q = pipeline.norm("l2_u", u_sym)
+    l1_q = pipeline.norm("l1_u1", u_sym[1], p=1)
+    linf_q = pipeline.norm("linf_u", u_sym, p=numpy.Inf)
+    ints_q = pipeline.integrals(["int_uu0", "int_uu1"], u_sym*u_sym[0])
+
+    for i in range(2):
+        assert abs(int_q() - discr.integral(u[0])) < 1e-12
+        assert abs(l2_q() - discr.norm(u)) < 1e-12
+        assert abs(l1_q() - discr.norm(u[1], 1)) < 1e-12
+        assert abs(linf_q()
+                - numpy.maximum(numpy.abs(u[0]), numpy.abs(u[1])).max()) < 1e-12
+        assert la.norm(numpy.array(ints_q())
+                - discr.integral(u*u[0])) < 1e-12
+
+        # a quantity queried twice in a step sees the same evaluation
+        u_old = u
+        u = 2*u
+        assert abs(int_q() - discr.integral(u_old[0])) < 1e-12
+
+        step[0] += 1
+
+
+
+
+def test_vectorized_simplex_basis():
+    """Check the batched simplex basis against the pointwise one."""
+    from hedge.discretization.local import \
+            TriangleDiscretization, TetrahedronDiscretization
+    from hedge.polynomial import generic_vandermonde, generic_multi_vandermonde
+
+    for ldis in [TriangleDiscretization(5), TetrahedronDiscretization(4)]:
+        nodes = ldis.unit_nodes()
+
+        vdm = generic_vandermonde(nodes, list(ldis.basis_functions()))
+        assert la.norm(ldis.basis_vandermonde(nodes) - vdm) < 1e-12
+
+        grad_vdms = generic_multi_vandermonde(nodes,
+                list(ldis.grad_basis_functions()))
+        for grad_vdm, ref_grad_vdm in zip(
+                ldis.grad_basis_vandermonde(nodes), grad_vdms):
+            assert la.norm(grad_vdm - ref_grad_vdm) < 1e-10
+
+
+
+
+def test_lbm_fused_collision():
+    """Check the fused lattice Boltzmann collision kernel against the
+    collision operator template.
+    """
+    from hedge.mesh.generator import make_rect_mesh
+    mesh = make_rect_mesh(a=(0, 0), b=(1, 1), max_area=0.05,
+            periodicity=(True, True))
+    discr = discr_class(mesh, order=3)
+
+    from hedge.models.gas_dynamics.lbm import (
+            D2Q9LBMMethod, LatticeBoltzmannOperator,
+            pack_distributions, unpack_distributions)
+    op = LatticeBoltzmannOperator(D2Q9LBMMethod(), lbm_delta_t=0.001, nu=1e-4)
+
+    from pytools.obj_array import make_obj_array
+    f_bar = make_obj_array([
+        discr.interpolate_volume_function(
+            lambda x, el: (1+alpha)/20*(1+0.1*numpy.sin(3*x[0]+alpha*x[1])))
+        for alpha in range(len(op.method))])
+
+    ref = op.bind(discr, op.collision_update)(f_bar)
+
+    f = pack_distributions(f_bar)
+    assert op.bind_collision(discr)(f) is f
+    for f_alpha, ref_alpha in zip(unpack_distributions(f), ref):
+        assert la.norm(f_alpha - ref_alpha) < 1e-12*la.norm(ref_alpha)
+
+    rhs = op.bind_rhs(discr)
+    ref_rhs = pack_distributions(rhs(0, unpack_distributions(f)))
+    assert la.norm(rhs(0, f) - ref_rhs) < 1e-12*la.norm(ref_rhs)
+
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1: